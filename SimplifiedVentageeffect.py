@@ -6,22 +6,25 @@ import tempfile
 from moviepy.editor import VideoFileClip, concatenate_videoclips
 from skimage.util import random_noise
 
-def process_video_frames(input_path, output_path, effect_function, intensity=0.5, audio=True):
+def process_video_frames(input_path, output_path, effect_function, intensity=0.5, audio=True, seed=None):
     """
     Simplified function for applying effects to videos
     """
     try:
         # Just call the effect function directly
-        effect_function(input_path, output_path, intensity)
+        effect_function(input_path, output_path, intensity, seed)
     except Exception as e:
         raise Exception(f"Error processing video: {str(e)}")
 
 # VHS Effect
-def apply_vhs_effect(input_path, output_path, intensity=0.5):
+def apply_vhs_effect(input_path, output_path, intensity=0.5, seed=None):
     try:
         # Load the video
         clip = VideoFileClip(input_path)
         
+        # Seeded random stream so the same seed renders the same frames
+        rng = np.random.default_rng(seed)
+        
         # Process frames using a simple lambda that doesn't use the fl_image method
         # This avoids the attribute error
         frames = []
@@ -56,7 +59,7 @@ def apply_vhs_effect(input_path, output_path, intensity=0.5):
             
             # Add noise
             noise_level = 0.08 * intensity
-            noise = np.random.normal(0, noise_level, frame_float.shape)
+            noise = rng.normal(0, noise_level, frame_float.shape)
             result = np.clip(result + noise, 0, 1)
             
             # Convert back to uint8
@@ -81,11 +84,14 @@ def apply_vhs_effect(input_path, output_path, intensity=0.5):
         raise Exception(f"Error in VHS effect: {str(e)}")
 
 # Film Grain Effect - Simplified
-def apply_film_grain(input_path, output_path, intensity=0.5):
+def apply_film_grain(input_path, output_path, intensity=0.5, seed=None):
     try:
         # Load the video
         clip = VideoFileClip(input_path)
         
+        # Seeded random stream so the same seed renders the same frames
+        rng = np.random.default_rng(seed)
+        
         frames = []
         duration = clip.duration
         fps = clip.fps
@@ -103,7 +109,7 @@ def apply_film_grain(input_path, output_path, intensity=0.5):
             
             # Add film grain noise
             grain_intensity = 0.2 * intensity
-            grain = random_noise(frame_float, mode='gaussian', var=grain_intensity**2)
+            grain = random_noise(frame_float, mode='gaussian', var=grain_intensity**2, rng=rng)
             
             # Convert back to uint8
             processed_frame = (grain * 255).astype(np.uint8)
@@ -127,7 +133,7 @@ def apply_film_grain(input_path, output_path, intensity=0.5):
         raise Exception(f"Error in Film Grain effect: {str(e)}")
 
 # Light Leak Effect - Simplified
-def apply_light_leak(input_path, output_path, intensity=0.5):
+def apply_light_leak(input_path, output_path, intensity=0.5, seed=None):
     try:
         # Load the video
         clip = VideoFileClip(input_path)
@@ -187,11 +193,11 @@ def apply_light_leak(input_path, output_path, intensity=0.5):
         raise Exception(f"Error in Light Leak effect: {str(e)}")
 
 # Old Movie Effect (Simplified)
-def apply_old_movie(input_path, output_path, intensity=0.5):
-    apply_sepia(input_path, output_path, intensity)
+def apply_old_movie(input_path, output_path, intensity=0.5, seed=None):
+    apply_sepia(input_path, output_path, intensity, seed)
 
 # Sepia Tone Effect
-def apply_sepia(input_path, output_path, intensity=0.5):
+def apply_sepia(input_path, output_path, intensity=0.5, seed=None):
     try:
         # Load the video
         clip = VideoFileClip(input_path)
@@ -244,11 +250,11 @@ def apply_sepia(input_path, output_path, intensity=0.5):
 
 # CRT Scanlines, Vintage Color, and Glitch Effect
 # For simplicity, just redirect these to simpler effects
-def apply_crt_scanlines(input_path, output_path, intensity=0.5):
-    apply_film_grain(input_path, output_path, intensity)
+def apply_crt_scanlines(input_path, output_path, intensity=0.5, seed=None):
+    apply_film_grain(input_path, output_path, intensity, seed)
 
-def apply_vintage_color(input_path, output_path, intensity=0.5):
-    apply_sepia(input_path, output_path, intensity)
+def apply_vintage_color(input_path, output_path, intensity=0.5, seed=None):
+    apply_sepia(input_path, output_path, intensity, seed)
 
-def apply_glitch(input_path, output_path, intensity=0.5):
-    apply_vhs_effect(input_path, output_path, intensity) 
\ No newline at end of file
+def apply_glitch(input_path, output_path, intensity=0.5, seed=None):
+    apply_vhs_effect(input_path, output_path, intensity, seed) 
\ No newline at end of file
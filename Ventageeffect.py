@@ -1,28 +1,330 @@
 import os
-import cv2
 import numpy as np
-import random
+import inspect
+import math
+import pickle
 import tempfile
-from moviepy.editor import VideoFileClip, ImageSequenceClip, CompositeVideoClip, vfx, clips_array
-from skimage.util import random_noise
+import time
+from functools import lru_cache
+from cancellation import JobCancelled, check_cancel
+from checkpoints import Checkpoint, job_fingerprint
+from frame_ring import FrameWorkers
+from lazy_imports import lazy_import
+from media_probe import file_fingerprint, probe_media
+from time_ranges import encode_video
+from pointwise import (
+    add_frame,
+    chain_stages,
+    channel_gains,
+    clip,
+    contrast,
+    deterministic_prefix,
+    evaluate,
+    gaussian_noise,
+    multiply_mask,
+    stochastic
+)
 
-def process_video_frames(input_path, output_path, process_frame_func, audio=True, **kwargs):
+# OpenCV is only loaded when a video or frame is first processed; moviepy is
+# imported inside the functions that use it
+cv2 = lazy_import('cv2')
+
+# Worker processes process_video_frames spreads the effect over (1 processes
+# every frame in the calling process)
+FRAME_WORKERS = int(os.environ.get('FRAME_WORKERS', 1))
+
+# Reuse the effect work of the previous frame for decoded frames that repeat its
+# input (slideshows, held titles, static shots). Frames differing from it by at
+# most STATIC_FRAME_TOLERANCE in every pixel value count as repeats; 0 only
+# takes identical frames, which keeps the output identical to a full render.
+STATIC_FRAME_REUSE = os.environ.get('STATIC_FRAME_REUSE', '0') == '1'
+STATIC_FRAME_TOLERANCE = int(os.environ.get('STATIC_FRAME_TOLERANCE', 0))
+
+# Callbacks notified after each processed video with
+# (effect name, {stage: seconds}, frame count, input bytes)
+stage_hooks = []
+
+def add_stage_hook(hook):
+    """Register a callback that receives the per-stage timings of every processed video"""
+    stage_hooks.append(hook)
+
+def report_stages(effect_name, stage_times, frame_count, input_bytes):
+    for hook in stage_hooks:
+        try:
+            hook(effect_name, stage_times, frame_count, input_bytes)
+        except Exception as e:
+            print(f"Warning: Stage hook failed: {str(e)}")
+
+def frame_rng(job_seed, frame_index):
+    """Independent random stream for one frame of a job, derived from the job's SeedSequence"""
+    return np.random.default_rng(np.random.SeedSequence(job_seed.entropy, spawn_key=job_seed.spawn_key + (frame_index,)))
+
+def apply_frame(process_frame_func, frame, kwargs, job_seed, frame_index, pass_rng=True, scale=1.0):
+    """
+    Run one effect function on one frame, giving it the frame's random stream if it takes rng
+    Functions marked with takes_frame_index also get the frame's index.
+    With scale below 1 the effect runs on a frame downscaled by that factor and
+    the result is scaled back up, trading detail for speed.
+    """
+    if scale < 1.0:
+        height, width = frame.shape[:2]
+        small = cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+        processed = apply_frame(process_frame_func, small, kwargs, job_seed, frame_index, pass_rng)
+        return cv2.resize(processed, (width, height), interpolation=cv2.INTER_LINEAR)
+    frame_kwargs = dict(kwargs, rng=frame_rng(job_seed, frame_index)) if pass_rng else kwargs
+    if getattr(process_frame_func, 'takes_frame_index', False):
+        frame_kwargs = dict(frame_kwargs, frame_index=frame_index)
+    try:
+        return process_frame_func(frame, **frame_kwargs)
+    except TypeError:
+        # If that fails, try without kwargs
+        return process_frame_func(frame)
+
+class StaticFrames:
+    """
+    Effect results kept for the last processed input frame, to reuse when the
+    next decoded frames repeat it
+
+    Effects without a random stream give the same output for the same input,
+    so a repeated frame reuses the whole output. For pointwise effects (see
+    POINTWISE_STAGES) and fused runs of them (fused_steps_process) the result
+    of the stages before the first stochastic one is kept, and only the grain
+    and flicker stages run again with the repeated frame's own random streams.
+    Other effects draw randomness all over the frame and get no reuse. Repeats are compared with the frame the results came
+    from, not the previous frame, so small changes can't add up.
+    """
+
+    def __init__(self, process_frame_func, kwargs, pass_rng):
+        self.kwargs = kwargs
+        # Fused chains draw their random streams from the frame index instead
+        self.takes_frame_index = getattr(process_frame_func, 'takes_frame_index', False)
+        self.whole = not pass_rng and not self.takes_frame_index
+        if process_frame_func is fused_steps_process:
+            self.build_stages = fused_steps_stages
+        else:
+            self.build_stages = POINTWISE_STAGES.get(process_frame_func) if pass_rng else None
+        self.source = None
+        self.output = None
+        self.prefix = None
+        self.reused = 0
+
+    @property
+    def enabled(self):
+        return self.whole or self.build_stages is not None
+
+    def matches(self, frame, scale):
+        """Whether a decoded BGR frame repeats the input of the kept results at full scale"""
+        if self.source is None or scale < 1.0 or frame.shape != self.source.shape:
+            return False
+        if STATIC_FRAME_TOLERANCE > 0:
+            return int(cv2.absdiff(frame, self.source).max()) <= STATIC_FRAME_TOLERANCE
+        return np.array_equal(frame, self.source)
+
+    def remember(self, frame, output=None, prefix=None):
+        """Keep the results for input frame: the BGR output, or (stage count, prefix values)"""
+        self.source = frame.copy()
+        self.output = output
+        self.prefix = prefix
+
+    def stages(self, shape, job_seed, index):
+        if self.takes_frame_index:
+            return self.build_stages(shape, frame_index=index, **self.kwargs)
+        return self.build_stages(shape, rng=frame_rng(job_seed, index), **self.kwargs)
+
+    def process(self, frame, frame_rgb, job_seed, index):
+        """Run a pointwise effect on a new input frame in two parts, keeping the first"""
+        stages = self.stages(frame_rgb.shape, job_seed, index)
+        count = deterministic_prefix(stages)
+        if not count:
+            return evaluate(frame_rgb, stages)
+        values = evaluate(frame_rgb, stages[:count], quantize=False)
+        self.remember(frame, prefix=(count, values))
+        return evaluate(values.copy(), stages[count:])
+
+    def reuse(self, job_seed, index):
+        """
+        The BGR output for a repeated frame, or None when the kept results don't
+        cover it (its own stochastic stages start earlier)
+        """
+        if self.output is not None:
+            self.reused += 1
+            return self.output
+        if self.prefix is None:
+            return None
+        count, values = self.prefix
+        stages = self.stages(values.shape, job_seed, index)
+        if deterministic_prefix(stages) != count:
+            return None
+        self.reused += 1
+        return cv2.cvtColor(evaluate(values.copy(), stages[count:]), cv2.COLOR_RGB2BGR)
+
+def finish_output(temp_output, output_path, audio_path, frame_size, stage_times, encoder=None):
+    """
+    Encode the frames written to temp_output into output_path with an encoder
+    profile (see encoding.py), muxing in the audio of audio_path if given
+    """
+    stage_start = time.perf_counter()
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    encode_video(temp_output, output_path, audio_path, encoder, frame_size)
+    stage = 'audio_mux' if audio_path is not None else 'remux'
+    stage_times[stage] = stage_times.get(stage, 0.0) + time.perf_counter() - stage_start
+
+def frame_step(fps, target_fps):
+    """Source frames per output frame when reducing fps to target_fps (1.0 keeps every frame)"""
+    if not target_fps or not fps or target_fps >= fps:
+        return 1.0
+    return fps / target_fps
+
+def read_selected_frame(video, frame_index, next_frame, step, image=None):
+    """
+    Read the next frame on the output cadence, starting at source frame frame_index
+    Frames dropped by a reduced frame rate are skipped with grab(), without being
+    retrieved. Returns (frame or None at the end, its source index, the next
+    cadence position). With image, the frame is decoded into that array.
+    """
+    while frame_index < next_frame - 1e-6:
+        if not video.grab():
+            return None, frame_index, next_frame
+        frame_index += 1
+    ret, frame = video.read(image) if image is not None else video.read()
+    return (frame if ret else None), frame_index, next_frame + step
+
+def process_frames_parallel(video, write, pool, step, stage_times, cancel=None, next_frame=0.0, quality=None,
+                            static=None):
+    """
+    Decode into the shared-memory slots of a FrameWorkers pool, let the workers
+    apply the effect in place and write the results in order
+    Only slot numbers pass through the queues. Effect and color conversion
+    times are summed over the workers. write(frame, frame_index, next_frame) gets
+    every frame with the read position following it. quality is an optional
+    QualityController choosing the working scale and the repeated frames.
+    static is an optional StaticFrames of an effect without a random stream;
+    frames repeating the last submitted input are written as its output.
+    Returns the number of frames written.
+    """
+    frame_index = 0
+    submitted = written = in_flight = 0
+    finished = {}
+    positions = {}
+    last_output = None
+    end_of_video = False
+    while True:
+        check_cancel(cancel)
+        
+        # Decode into every free slot
+        while not end_of_video:
+            slot = pool.acquire()
+            if slot is None:
+                break
+            image = pool.ring.input_frame(slot)
+            stage_start = time.perf_counter()
+            frame, index, next_frame = read_selected_frame(video, frame_index, next_frame, step, image)
+            stage_times['decode'] += time.perf_counter() - stage_start
+            if frame is None:
+                pool.release(slot)
+                end_of_video = True
+                break
+            if frame is not image:
+                # OpenCV allocated a new array instead of decoding in place
+                image[...] = frame
+            frame_index = index + 1
+            positions[submitted] = (frame_index, next_frame)
+            scale, repeat = quality.settings(submitted) if quality is not None else (1.0, False)
+            if not repeat and static is not None and static.matches(image, scale):
+                # Nothing written in between ran the effect, so the previous output is this frame's
+                repeat = True
+                static.reused += 1
+            elif not repeat and static is not None and scale >= 1.0:
+                static.remember(image)
+            if repeat:
+                # Written as a copy of the previous output, without running the effect
+                pool.release(slot)
+                finished[submitted] = None
+            else:
+                pool.submit(slot, submitted, index, scale)
+                in_flight += 1
+            submitted += 1
+        
+        # Write finished frames in order and recycle their slots
+        while written in finished:
+            slot = finished.pop(written)
+            stage_start = time.perf_counter()
+            if slot is None:
+                write(last_output, *positions.pop(written))
+            else:
+                output_frame = pool.ring.output_frame(slot)
+                write(output_frame, *positions.pop(written))
+                if quality is not None or static is not None:
+                    # The slot is reused, so keep a copy for repeated frames
+                    last_output = output_frame.copy()
+                pool.release(slot)
+            stage_times['write'] += time.perf_counter() - stage_start
+            written += 1
+            if quality is not None:
+                quality.update(written, stage_times)
+        
+        if end_of_video and written == submitted:
+            return written
+        if not in_flight:
+            # Every slot is free again, go back to decoding
+            continue
+        
+        slot, sequence, effect_seconds, convert_seconds = pool.result()
+        in_flight -= 1
+        stage_times['effect'] += effect_seconds
+        stage_times['color_convert'] += convert_seconds
+        finished[sequence] = slot
+
+def process_video_frames(input_path, output_path, process_frame_func, audio=True, seed=None,
+                         target_fps=None, workers=None, cancel=None, checkpoint_dir=None, quality=None, encoder=None,
+                         reuse_static=None, **kwargs):
     """
     Generic function for processing video frames with a given effect function
     Using OpenCV to process frames directly
+    Effects that accept an rng argument get a per-frame numpy Generator derived
+    from seed, so the same seed renders identical frames (None picks a random seed)
+    With target_fps below the source rate, only the frames on the reduced
+    cadence are decoded and processed; the others are skipped with grab() and
+    the output is written at the reduced rate
+    With workers above 1 (FRAME_WORKERS by default) the effect runs in that many
+    worker processes that share the frames through a shared-memory ring
+    With a CancelToken as cancel, the job stops between two frames once it is
+    cancelled or past its deadline: JobCancelled is raised after the video
+    reader and writer are released and the temp file is deleted
+    With checkpoint_dir, frames are written as segments committed to a manifest
+    in that directory every CHECKPOINT_SECONDS; a later call with the same
+    arguments resumes after the last committed frame with the same random
+    streams, so a crashed job only redoes the uncommitted part
+    With an adaptive.QualityController as quality, the working resolution and
+    effective frame rate are lowered as needed to finish by its deadline
+    encoder names the encoder profile of the output (the deployment's default if None)
+    With reuse_static (STATIC_FRAME_REUSE by default), frames repeating the
+    previous input reuse its effect results (see StaticFrames); with workers,
+    only effects without a random stream do
+    Time spent in each stage (audio probe, decode, color convert, effect, write,
+    audio mux or remux) is reported to the registered stage hooks
     """
     temp_output = None
+    job_seed = np.random.SeedSequence(seed)
+    pass_rng = 'rng' in inspect.signature(process_frame_func).parameters
+    static = None
+    if STATIC_FRAME_REUSE if reuse_static is None else reuse_static:
+        static = StaticFrames(process_frame_func, kwargs, pass_rng)
+        static = static if static.enabled else None
+    stage_times = dict.fromkeys(('audio_probe', 'decode', 'color_convert', 'effect', 'write'), 0.0)
+    frame_count = 0
+    workers = FRAME_WORKERS if workers is None else workers
+    pool = None
+    video = out = checkpoint = None
+    audio_path = None
     try:
-        # Extract audio from original if needed
-        original_audio = None
+        # Check whether the original has audio to mux back in
         if audio:
-            try:
-                original_clip = VideoFileClip(input_path)
-                if original_clip.audio is not None:
-                    original_audio = original_clip.audio
-                original_clip.close()
-            except Exception as e:
-                print(f"Warning: Could not extract audio: {str(e)}")
+            stage_start = time.perf_counter()
+            audio_path = input_path if probe_media(input_path)['has_audio'] else None
+            stage_times['audio_probe'] += time.perf_counter() - stage_start
         
         # Load video with OpenCV for frame extraction
         video = cv2.VideoCapture(input_path)
@@ -34,537 +336,781 @@ def process_video_frames(input_path, output_path, process_frame_func, audio=True
         frame_width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
         frame_height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
         fps = video.get(cv2.CAP_PROP_FPS)
+        step = frame_step(fps, target_fps)
+        output_fps = fps / step
         
-        # Create a temporary file for processed frames
-        temp_output = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False).name
+        # Create a temporary file for processed frames next to the output,
+        # so it lives (and is cleaned up) in the caller's job workspace
+        temp_output = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False,
+                                                  dir=os.path.dirname(output_path) or None).name
         
-        # Create VideoWriter
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(temp_output, fourcc, fps, (frame_width, frame_height))
+        next_frame = 0.0
+        if checkpoint_dir:
+            effect_id = f"{process_frame_func.__module__}.{process_frame_func.__qualname__}"
+            fingerprint = job_fingerprint(effect=effect_id, kwargs=kwargs, seed=seed, target_fps=target_fps,
+                                          input=file_fingerprint(input_path))
+            checkpoint = Checkpoint(checkpoint_dir, fingerprint, output_fps, (frame_width, frame_height))
+            # A resumed run continues the random streams of the run it resumes
+            job_seed = np.random.SeedSequence(checkpoint.entropy(job_seed.entropy))
+            next_frame = checkpoint.manifest['next_frame']
+            if checkpoint.resumed:
+                print(f"Resuming after {checkpoint.manifest['frames']} frames from {checkpoint_dir}")
+            write = checkpoint.write
+        else:
+            # Create VideoWriter
+            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+            out = cv2.VideoWriter(temp_output, fourcc, output_fps, (frame_width, frame_height))
+            write = lambda frame, frame_index, next_frame: out.write(frame)
         
-        # Process frames
-        while True:
-            ret, frame = video.read()
-            if not ret:
-                break
-                
-            # OpenCV uses BGR, convert to RGB for consistency with moviepy
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            # Process the frame
-            try:
-                processed_frame = process_frame_func(frame_rgb, **kwargs)
-            except TypeError:
-                # If that fails, try without kwargs
-                processed_frame = process_frame_func(frame_rgb)
-                
-            # Convert back to BGR for OpenCV
-            processed_frame_bgr = cv2.cvtColor(processed_frame, cv2.COLOR_RGB2BGR)
-            
-            # Write the frame
-            out.write(processed_frame_bgr)
+        if quality is not None:
+            remaining_frames = max(0, video.get(cv2.CAP_PROP_FRAME_COUNT) - next_frame) / step
+            quality.start(int(math.ceil(remaining_frames)), output_fps)
         
-        # Release resources
-        video.release()
-        out.release()
+        if workers > 1:
+            try:
+                pool = FrameWorkers(workers, (frame_height, frame_width, 3), process_frame_func,
+                                    kwargs, job_seed, pass_rng)
+            except (pickle.PicklingError, AttributeError, TypeError) as e:
+                # Effects defined inline can't be sent to other processes
+                print(f"Warning: Processing frames in-process: {str(e)}")
         
-        # If audio is needed, use moviepy to add it back
-        if audio and original_audio is not None:
-            # Load the processed video without audio
-            processed_clip = VideoFileClip(temp_output)
-            
-            # Add audio
-            processed_clip = processed_clip.set_audio(original_audio)
-            
-            # Write the final output with audio
-            processed_clip.write_videofile(output_path, codec='libx264', audio_codec='aac')
-            
-            # Close the clip
-            processed_clip.close()
+        if pool is not None:
+            frame_count = process_frames_parallel(video, write, pool, step, stage_times, cancel, next_frame, quality,
+                                                  static if static is not None and static.whole else None)
         else:
-            # Just copy the temp file if no audio is needed
-            if os.path.exists(output_path):
-                os.remove(output_path)
-            
-            # Use OpenCV to copy the file with proper encoding
-            video = cv2.VideoCapture(temp_output)
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
-            
+            # Resumed runs skip the committed frames with grab()
+            frame_index = 0
             while True:
-                ret, frame = video.read()
-                if not ret:
+                check_cancel(cancel)
+                stage_start = time.perf_counter()
+                frame, index, next_frame = read_selected_frame(video, frame_index, next_frame, step)
+                stage_end = time.perf_counter()
+                stage_times['decode'] += stage_end - stage_start
+                if frame is None:
                     break
-                out.write(frame)
+                frame_index = index + 1
                 
-            video.release()
+                # A frame repeated to keep a deadline reuses the previous output
+                scale, repeat = quality.settings(frame_count) if quality is not None else (1.0, False)
+                reused = None
+                if not repeat and static is not None and static.matches(frame, scale):
+                    # A frame repeating the last processed input reuses its results
+                    stage_start = stage_end
+                    reused = static.reuse(job_seed, index)
+                    stage_end = time.perf_counter()
+                    stage_times['effect'] += stage_end - stage_start
+                if reused is not None:
+                    processed_frame_bgr = reused
+                elif not repeat:
+                    # OpenCV uses BGR, convert to RGB for consistency with moviepy
+                    stage_start = stage_end
+                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    stage_end = time.perf_counter()
+                    stage_times['color_convert'] += stage_end - stage_start
+                    
+                    # Process the frame
+                    stage_start = stage_end
+                    if static is not None and not static.whole and scale >= 1.0:
+                        processed_frame = static.process(frame, frame_rgb, job_seed, index)
+                    else:
+                        processed_frame = apply_frame(process_frame_func, frame_rgb, kwargs, job_seed, index,
+                                                      pass_rng, scale)
+                    stage_end = time.perf_counter()
+                    stage_times['effect'] += stage_end - stage_start
+                    
+                    # Convert back to BGR for OpenCV
+                    stage_start = stage_end
+                    processed_frame_bgr = cv2.cvtColor(processed_frame, cv2.COLOR_RGB2BGR)
+                    stage_end = time.perf_counter()
+                    stage_times['color_convert'] += stage_end - stage_start
+                    if static is not None and static.whole and scale >= 1.0:
+                        static.remember(frame, output=processed_frame_bgr)
+                
+                # Write the frame
+                stage_start = stage_end
+                write(processed_frame_bgr, frame_index, next_frame)
+                stage_times['write'] += time.perf_counter() - stage_start
+                frame_count += 1
+                if quality is not None:
+                    quality.update(frame_count, stage_times)
+        
+        if static is not None and static.reused:
+            print(f"Reused the results of repeated frames for {static.reused} of {frame_count} frames")
+        
+        # Release resources
+        video.release()
+        if checkpoint is not None:
+            check_cancel(cancel)
+            checkpoint.join(temp_output)
+        else:
             out.release()
-            
+        if pool is not None:
+            pool.close()
+            pool = None
+        
+        # Last chance to stop before the final encode, which can't be interrupted
+        check_cancel(cancel)
+        finish_output(temp_output, output_path, audio_path, (frame_width, frame_height), stage_times, encoder)
+        
         # Clean up the temp file if it still exists
         if os.path.exists(temp_output):
             os.remove(temp_output)
+        
+        effect_name = getattr(process_frame_func, '__name__', 'unknown').replace('_process', '')
+        report_stages(effect_name, stage_times, frame_count, os.path.getsize(input_path))
     
+    except JobCancelled:
+        raise
     except Exception as e:
+        raise Exception(f"Error processing video: {str(e)}")
+    
+    finally:
+        if pool is not None:
+            pool.close()
+        if video is not None:
+            video.release()
+        if out is not None:
+            out.release()
+        if checkpoint is not None:
+            checkpoint.release()
         # Clean up temp files
         if temp_output and os.path.exists(temp_output):
             os.remove(temp_output)
-        raise Exception(f"Error processing video: {str(e)}")
 
-# VHS Effect
-def apply_vhs_effect(input_path, output_path, intensity=0.5):
-    def vhs_process(frame, intensity=0.5):
-        # Convert to float for processing
-        frame_float = frame.astype(np.float32) / 255.0
-        
-        # RGB shift
-        height, width = frame.shape[:2]
-        shift_amount = int(7 * intensity)
+def fuse_chain(chain):
+    """
+    Group the (func, job seed, kwargs, pass_rng) steps of a chain into runs:
+    consecutive effects with pointwise stages form one run, every other effect
+    a run of its own
+    """
+    runs = []
+    for step in chain:
+        pointwise = step[0] in POINTWISE_STAGES
+        if pointwise and runs and runs[-1][0]:
+            runs[-1][1].append(step)
+        else:
+            runs.append((pointwise, [step]))
+    return [steps for _, steps in runs]
+
+def apply_steps(steps, frame, frame_index):
+    """
+    Apply one run of fuse_chain to a frame. Several pointwise effects are
+    evaluated in a single pass over the frame, with the same random streams and
+    the same result as applying them one after the other.
+    """
+    if len(steps) == 1:
+        func, job_seed, kwargs, pass_rng = steps[0]
+        return apply_frame(func, frame, kwargs, job_seed, frame_index, pass_rng)
+    stage_lists = []
+    for func, job_seed, kwargs, pass_rng in steps:
+        stage_kwargs = dict(kwargs, rng=frame_rng(job_seed, frame_index)) if pass_rng else kwargs
+        stage_lists.append(POINTWISE_STAGES[func](frame.shape, **stage_kwargs))
+    return evaluate(frame, chain_stages(stage_lists))
+
+def in_ranges(seconds, effect_ranges):
+    """Whether a frame time falls in one of the (start, end) ranges; end None means to the end"""
+    return any(start <= seconds and (end is None or seconds < end) for start, end in effect_ranges)
+
+def process_video_fanout(input_path, outputs, audio=True, effect_ranges=None, cancel=None, encoder=None):
+    """
+    Render several looks of one video from a single decode
+    outputs is a list of (output_path, steps), where steps is the effect chain
+    for that output as a list of (process_frame_func, seed, kwargs). Each decoded
+    frame is shared read-only by every chain and each output has its own writer,
+    so memory stays at one source frame plus one frame per chain. A chain step
+    gets the same per-frame random streams process_video_frames would give it
+    for that seed. Consecutive pointwise effects of a chain are fused into one
+    pass over the frame. With effect_ranges, a list of (start, end) seconds,
+    frames outside the ranges are written unchanged. cancel is checked between
+    frames and encoder names the outputs' encoder profile as in
+    process_video_frames.
+    """
+    temp_outputs = []
+    writers = []
+    chains = []
+    stage_times = dict.fromkeys(('audio_probe', 'decode', 'color_convert', 'effect', 'write'), 0.0)
+    frame_count = 0
+    video = None
+    audio_path = None
+    try:
+        if audio:
+            stage_start = time.perf_counter()
+            audio_path = input_path if probe_media(input_path)['has_audio'] else None
+            stage_times['audio_probe'] += time.perf_counter() - stage_start
         
-        # Red channel shift left
-        red_shifted = np.zeros_like(frame_float)
-        red_shifted[:, :width-shift_amount, 0] = frame_float[:, shift_amount:, 0]
+        video = cv2.VideoCapture(input_path)
+        if not video.isOpened():
+            raise Exception("Could not open video file")
         
-        # Blue channel shift right
-        blue_shifted = np.zeros_like(frame_float)
-        blue_shifted[:, shift_amount:, 2] = frame_float[:, :width-shift_amount, 2]
+        frame_width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
+        frame_height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = video.get(cv2.CAP_PROP_FPS)
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
         
-        # Green stays centered
-        green = frame_float[:, :, 1]
+        for output_path, steps in outputs:
+            temp_output = tempfile.NamedTemporaryFile(suffix='.mp4', delete=False,
+                                                      dir=os.path.dirname(output_path) or None).name
+            temp_outputs.append(temp_output)
+            writers.append(cv2.VideoWriter(temp_output, fourcc, fps, (frame_width, frame_height)))
+            chains.append(fuse_chain([(func, np.random.SeedSequence(seed), kwargs,
+                                       'rng' in inspect.signature(func).parameters)
+                                      for func, seed, kwargs in steps]))
         
-        # Combine the channels
-        result = frame_float.copy()
-        result[:, :, 0] = red_shifted[:, :, 0]
-        result[:, :, 2] = blue_shifted[:, :, 2]
+        while True:
+            check_cancel(cancel)
+            stage_start = time.perf_counter()
+            ret, frame = video.read()
+            stage_end = time.perf_counter()
+            stage_times['decode'] += stage_end - stage_start
+            if not ret:
+                break
+            
+            stage_start = stage_end
+            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            # Every chain reads the same source frame, none may modify it
+            frame_rgb.flags.writeable = False
+            stage_end = time.perf_counter()
+            stage_times['color_convert'] += stage_end - stage_start
+            
+            active = effect_ranges is None or in_ranges(frame_count / fps, effect_ranges)
+            for chain, out in zip(chains, writers):
+                stage_start = time.perf_counter()
+                processed_frame = frame_rgb
+                for steps in (chain if active else ()):
+                    processed_frame = apply_steps(steps, processed_frame, frame_count)
+                stage_end = time.perf_counter()
+                stage_times['effect'] += stage_end - stage_start
+                
+                stage_start = stage_end
+                processed_frame_bgr = cv2.cvtColor(processed_frame, cv2.COLOR_RGB2BGR)
+                stage_end = time.perf_counter()
+                stage_times['color_convert'] += stage_end - stage_start
+                
+                stage_start = stage_end
+                out.write(processed_frame_bgr)
+                stage_times['write'] += time.perf_counter() - stage_start
+            frame_count += 1
         
-        # Add some noise
-        noise_level = 0.08 * intensity
-        noise = np.random.normal(0, noise_level, frame_float.shape)
-        result = np.clip(result + noise, 0, 1)
+        video.release()
+        for out in writers:
+            out.release()
         
-        # Add tracking lines randomly
-        if random.random() < 0.2 * intensity:
-            line_pos = random.randint(0, height - 1)
-            line_height = random.randint(1, max(1, int(5 * intensity)))
-            result[line_pos:line_pos+line_height, :, :] = np.random.uniform(0.7, 1.0)
+        for (output_path, _), temp_output in zip(outputs, temp_outputs):
+            check_cancel(cancel)
+            finish_output(temp_output, output_path, audio_path, (frame_width, frame_height), stage_times, encoder)
         
-        # Convert back to uint8
-        return (result * 255).astype(np.uint8)
+        report_stages('fanout', stage_times, frame_count, os.path.getsize(input_path))
+    
+    except JobCancelled:
+        raise
+    except Exception as e:
+        raise Exception(f"Error processing video: {str(e)}")
+    finally:
+        if video is not None:
+            video.release()
+        for out in writers:
+            out.release()
+        for temp_output in temp_outputs:
+            if os.path.exists(temp_output):
+                os.remove(temp_output)
+
+# VHS Effect
+def vhs_process(frame, intensity=0.5, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    # Works on the uint8 frame directly: every step is a copy or a saturating
+    # add, so nothing needs converting to float and back
+    
+    # RGB shift
+    height, width = frame.shape[:2]
+    shift_amount = int(7 * intensity)
+    result = frame.copy()
+    
+    # Red channel shift left
+    result[:, :width-shift_amount, 0] = frame[:, shift_amount:, 0]
+    result[:, width-shift_amount:, 0] = 0
     
-    process_video_frames(input_path, output_path, vhs_process, intensity=intensity)
+    # Blue channel shift right (green stays centered)
+    result[:, shift_amount:, 2] = frame[:, :width-shift_amount, 2]
+    result[:, :shift_amount, 2] = 0
+    
+    # Add some noise, in 0-255 levels rounded down, with a saturating add
+    noise_level = 0.08 * intensity
+    noise = rng.normal(0, noise_level, frame.shape)
+    noise *= 255
+    np.floor(noise, out=noise)
+    result = cv2.add(result, noise.astype(np.int16), dtype=cv2.CV_8U)
+    
+    # Add tracking lines randomly
+    if rng.random() < 0.2 * intensity:
+        line_pos = rng.integers(0, height - 1, endpoint=True)
+        line_height = rng.integers(1, max(1, int(5 * intensity)), endpoint=True)
+        result[line_pos:line_pos+line_height, :, :] = int(rng.uniform(0.7, 1.0) * 255)
+    
+    return result
+
+def apply_vhs_effect(input_path, output_path, intensity=0.5, seed=None, target_fps=None, cancel=None,
+                     checkpoint_dir=None, quality=None, encoder=None):
+    process_video_frames(input_path, output_path, vhs_process, seed=seed, target_fps=target_fps, cancel=cancel, checkpoint_dir=checkpoint_dir, quality=quality, encoder=encoder, intensity=intensity)
 
 # CRT Scanlines Effect
-def apply_crt_scanlines(input_path, output_path, intensity=0.5):
-    def crt_process(frame, intensity=0.5):
-        h, w = frame.shape[:2]
-        
-        # Create scanlines
-        scanlines = np.ones_like(frame)
-        scanline_intensity = 0.7 - (0.3 * intensity)
-        
-        # Every other line is darkened
-        scanlines[::2, :, :] = scanline_intensity
-        
-        # Apply scanlines to the frame
-        result = frame.astype(np.float32) / 255.0
-        result = result * scanlines
-        
-        # Add slight RGB shift for CRT effect
-        if intensity > 0.3:
-            shift = max(1, int(3 * intensity))
-            # Slight RGB fringing
-            result[:-shift, :, 0] = result[shift:, :, 0]  # Red channel
-            result[:, :-shift, 2] = result[:, shift:, 2]  # Blue channel
-        
-        # Add slight curvature/distortion
-        if intensity > 0.6:
-            # Simple barrel distortion (not physically accurate but gives the impression)
-            center_x, center_y = w // 2, h // 2
-            dist_x = np.tile(np.arange(w) - center_x, (h, 1))
-            dist_y = np.tile(np.arange(h) - center_y, (w, 1)).T
-            dist = np.sqrt(dist_x**2 + dist_y**2)
-            
-            # Normalize distance to 0-1 range
-            dist = dist / (np.sqrt(center_x**2 + center_y**2) * 1.1)
-            
-            # Create bulge effect (outward bulge)
-            distortion = 0.2 * intensity * (dist**2)
-            map_x = np.clip(dist_x * (1 + distortion) + center_x, 0, w - 1).astype(np.float32)
-            map_y = np.clip(dist_y * (1 + distortion) + center_y, 0, h - 1).astype(np.float32)
-            
-            # Remap the image
-            result = cv2.remap(result, map_x, map_y, cv2.INTER_LINEAR)
-        
-        # Convert back to uint8
-        return (result * 255).astype(np.uint8)
+# Helper function to build the barrel distortion maps of a frame size once
+@lru_cache(maxsize=4)
+def crt_distortion_maps(h, w, intensity):
+    # Simple barrel distortion (not physically accurate but gives the impression)
+    center_x, center_y = w // 2, h // 2
+    dist_x = np.tile(np.arange(w) - center_x, (h, 1))
+    dist_y = np.tile(np.arange(h) - center_y, (w, 1)).T
+    dist = np.sqrt(dist_x**2 + dist_y**2)
+    
+    # Normalize distance to 0-1 range
+    dist = dist / (np.sqrt(center_x**2 + center_y**2) * 1.1)
     
-    process_video_frames(input_path, output_path, crt_process, intensity=intensity)
+    # Create bulge effect (outward bulge)
+    distortion = 0.2 * intensity * (dist**2)
+    map_x = np.clip(dist_x * (1 + distortion) + center_x, 0, w - 1).astype(np.float32)
+    map_y = np.clip(dist_y * (1 + distortion) + center_y, 0, h - 1).astype(np.float32)
+    map_x.flags.writeable = False
+    map_y.flags.writeable = False
+    return map_x, map_y
+
+def crt_process(frame, intensity=0.5):
+    h, w = frame.shape[:2]
+    result = frame.copy()
+    
+    # Every other line is darkened. The darkening factor (0.7 - 0.3 * intensity)
+    # has always been stored in a uint8 mask, which rounds it down to 0, so the
+    # darkened lines are black.
+    result[::2, :, :] = 0
+    
+    # Add slight RGB shift for CRT effect
+    if intensity > 0.3:
+        shift = max(1, int(3 * intensity))
+        # Slight RGB fringing
+        result[:-shift, :, 0] = result[shift:, :, 0]  # Red channel
+        result[:, :-shift, 2] = result[:, shift:, 2]  # Blue channel
+    
+    # Add slight curvature/distortion
+    if intensity > 0.6:
+        # Remap the uint8 image, only the maps are float
+        map_x, map_y = crt_distortion_maps(h, w, intensity)
+        result = cv2.remap(result, map_x, map_y, cv2.INTER_LINEAR)
+    
+    return result
+
+def apply_crt_scanlines(input_path, output_path, intensity=0.5, seed=None, target_fps=None, cancel=None,
+                        checkpoint_dir=None, quality=None, encoder=None):
+    process_video_frames(input_path, output_path, crt_process, seed=seed, target_fps=target_fps, cancel=cancel, checkpoint_dir=checkpoint_dir, quality=quality, encoder=encoder, intensity=intensity)
 
 # Film Grain Effect
-def apply_film_grain(input_path, output_path, intensity=0.5):
-    def film_grain_process(frame, intensity=0.5):
-        # Convert to float32
-        frame_float = frame.astype(np.float32) / 255.0
-        
-        # Add film grain noise
-        grain_intensity = 0.2 * intensity
-        grain = random_noise(frame_float, mode='gaussian', var=grain_intensity**2)
-        
-        # Add dust and scratches
-        if random.random() < 0.3 * intensity:
-            # Random vertical scratches
-            scratch_count = int(random.uniform(1, 5) * intensity)
-            for _ in range(scratch_count):
-                x = random.randint(0, frame.shape[1] - 1)
-                width = random.randint(1, max(1, int(3 * intensity)))
-                length = random.randint(int(frame.shape[0] * 0.3), frame.shape[0])
-                y_start = random.randint(0, frame.shape[0] - length)
-                
-                # White scratch
-                grain[y_start:y_start+length, x:x+width, :] = 1.0
-        
-        # Random dust spots
-        dust_intensity = intensity * 30
-        dust_count = int(dust_intensity)
-        for _ in range(dust_count):
-            x = random.randint(0, frame.shape[1] - 1)
-            y = random.randint(0, frame.shape[0] - 1)
-            radius = random.randint(1, max(1, int(4 * intensity)))
-            color = random.choice([0.0, 1.0])  # Black or white dust spots
+def film_grain_process(frame, intensity=0.5, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    # Convert to float and add film grain noise in one pass
+    grain_intensity = 0.2 * intensity
+    grain = evaluate(frame, [gaussian_noise(rng, grain_intensity**2)], quantize=False)
+    
+    # Add dust and scratches
+    if rng.random() < 0.3 * intensity:
+        # Random vertical scratches
+        scratch_count = int(rng.uniform(1, 5) * intensity)
+        for _ in range(scratch_count):
+            x = rng.integers(0, frame.shape[1] - 1, endpoint=True)
+            width = rng.integers(1, max(1, int(3 * intensity)), endpoint=True)
+            length = rng.integers(int(frame.shape[0] * 0.3), frame.shape[0], endpoint=True)
+            y_start = rng.integers(0, frame.shape[0] - length, endpoint=True)
             
-            cv2.circle(grain, (x, y), radius, (color, color, color), -1)
-        
-        # Apply a soft contrast enhancement typical of film
-        grain = np.clip((grain - 0.5) * (1 + 0.2 * intensity) + 0.5, 0, 1)
+            # White scratch
+            grain[y_start:y_start+length, x:x+width, :] = 1.0
+    
+    # Random dust spots
+    dust_intensity = intensity * 30
+    dust_count = int(dust_intensity)
+    for _ in range(dust_count):
+        x = rng.integers(0, frame.shape[1] - 1, endpoint=True)
+        y = rng.integers(0, frame.shape[0] - 1, endpoint=True)
+        radius = rng.integers(1, max(1, int(4 * intensity)), endpoint=True)
+        color = rng.choice([0.0, 1.0])  # Black or white dust spots
         
-        # Convert back to uint8
-        return (grain * 255).astype(np.uint8)
+        cv2.circle(grain, (x, y), radius, (color, color, color), -1)
     
-    process_video_frames(input_path, output_path, film_grain_process, intensity=intensity)
+    # Apply a soft contrast enhancement typical of film and convert back to uint8
+    return evaluate(grain, [contrast(1 + 0.2 * intensity), clip()])
+
+def apply_film_grain(input_path, output_path, intensity=0.5, seed=None, target_fps=None, cancel=None,
+                     checkpoint_dir=None, quality=None, encoder=None):
+    process_video_frames(input_path, output_path, film_grain_process, seed=seed, target_fps=target_fps, cancel=cancel, checkpoint_dir=checkpoint_dir, quality=quality, encoder=encoder, intensity=intensity)
 
 # Old Movie Projector Effect
-def apply_old_movie(input_path, output_path, intensity=0.5):
-    def old_movie_process(frame, intensity=0.5, frame_count=0):
-        # Convert to grayscale with sepia tone
-        sepia = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        sepia = cv2.cvtColor(sepia, cv2.COLOR_GRAY2BGR)
-        
-        # Add sepia tone
-        sepia = sepia.astype(np.float32) / 255.0
-        sepia[:, :, 0] *= 0.85  # Blue channel
-        sepia[:, :, 1] *= 0.95  # Green channel
-        sepia[:, :, 2] *= 1.05  # Red channel
-        sepia = np.clip(sepia, 0, 1)
-        
-        # Add film grain
-        grain_intensity = 0.15 * intensity
-        sepia = random_noise(sepia, mode='gaussian', var=grain_intensity**2)
-        
-        # Add projector flicker - varies brightness
-        flicker_intensity = 0.15 * intensity
-        if random.random() < 0.1 * intensity:
-            flicker = np.random.uniform(1.0 - flicker_intensity, 1.0 + flicker_intensity)
-            sepia = np.clip(sepia * flicker, 0, 1)
-        
-        # Add frame jitter
-        if random.random() < 0.2 * intensity:
-            shift_y = random.randint(-int(10 * intensity), int(10 * intensity))
-            M = np.float32([[1, 0, 0], [0, 1, shift_y]])
-            sepia = cv2.warpAffine(sepia, M, (frame.shape[1], frame.shape[0]))
-        
-        # Add vignette (darkening around edges)
-        h, w = frame.shape[:2]
-        vignette = np.ones((h, w))
-        center = (w // 2, h // 2)
-        radius = min(center[0], center[1])
-        
-        # Create circular vignette
-        Y, X = np.ogrid[:h, :w]
-        dist_from_center = np.sqrt((X - center[0])**2 + (Y - center[1])**2)
-        vignette = np.clip(1 - dist_from_center / radius * 0.6 * intensity, 0.6, 1)
-        
-        # Apply vignette
-        for i in range(3):
-            sepia[:, :, i] = sepia[:, :, i] * vignette
-        
-        # Convert back to uint8
-        return (sepia * 255).astype(np.uint8)
+# Helper function to build the circular vignette of a frame size once
+@lru_cache(maxsize=8)
+def old_movie_vignette(h, w, intensity):
+    center = (w // 2, h // 2)
+    radius = min(center[0], center[1])
+    Y, X = np.ogrid[:h, :w]
+    dist_from_center = np.sqrt((X - center[0])**2 + (Y - center[1])**2)
+    vignette = np.clip(1 - dist_from_center / radius * 0.6 * intensity, 0.6, 1)
+    vignette.flags.writeable = False
+    return vignette
+
+def old_movie_process(frame, intensity=0.5, frame_count=0, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    # Convert to grayscale with sepia tone
+    sepia = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    sepia = cv2.cvtColor(sepia, cv2.COLOR_GRAY2BGR)
+    
+    # Add sepia tone (blue, green and red gains) and film grain in one pass
+    grain_intensity = 0.15 * intensity
+    sepia = evaluate(sepia, [channel_gains((0.85, 0.95, 1.05)), clip(),
+                             gaussian_noise(rng, grain_intensity**2)], quantize=False)
+    
+    # Add projector flicker - varies brightness
+    flicker_intensity = 0.15 * intensity
+    if rng.random() < 0.1 * intensity:
+        flicker = rng.uniform(1.0 - flicker_intensity, 1.0 + flicker_intensity)
+        np.multiply(sepia, flicker, out=sepia)
+        np.clip(sepia, 0, 1, out=sepia)
     
-    process_video_frames(input_path, output_path, old_movie_process, intensity=intensity)
+    # Add frame jitter
+    if rng.random() < 0.2 * intensity:
+        shift_y = rng.integers(-int(10 * intensity), int(10 * intensity), endpoint=True)
+        M = np.float32([[1, 0, 0], [0, 1, shift_y]])
+        sepia = cv2.warpAffine(sepia, M, (frame.shape[1], frame.shape[0]))
+    
+    # Add vignette (darkening around edges) and convert back to uint8
+    h, w = frame.shape[:2]
+    return evaluate(sepia, [multiply_mask(old_movie_vignette(h, w, intensity))])
+
+def apply_old_movie(input_path, output_path, intensity=0.5, seed=None, target_fps=None, cancel=None,
+                    checkpoint_dir=None, quality=None, encoder=None):
+    process_video_frames(input_path, output_path, old_movie_process, seed=seed, target_fps=target_fps, cancel=cancel, checkpoint_dir=checkpoint_dir, quality=quality, encoder=encoder, intensity=intensity)
 
 # Light Leak Effect
-def apply_light_leak(input_path, output_path, intensity=0.5):
-    def light_leak_process(frame, intensity=0.5, frame_count=0):
-        h, w = frame.shape[:2]
-        result = frame.astype(np.float32) / 255.0
-        
-        # Create light leak effect - we'll simulate light streaks
-        leak_mask = np.zeros((h, w), dtype=np.float32)
-        
-        # Create a few random light leaks that stay in place during the video
-        random.seed(1)  # Use fixed seed for consistent light leaks across frames
-        leak_count = max(1, int(3 * intensity))
+# Helper function to build the colored light leaks, which stay in place during
+# the video, once per frame size
+@lru_cache(maxsize=4)
+def light_leak_colors(h, w, intensity, leak_seed):
+    # Create light leak effect - we'll simulate light streaks
+    leak_mask = np.zeros((h, w), dtype=np.float32)
+    
+    # Create a few random light leaks that stay in place during the video
+    layout_rng = np.random.default_rng(leak_seed)  # Fixed seed for consistent light leaks across frames
+    leak_count = max(1, int(3 * intensity))
+    
+    for i in range(leak_count):
+        # Determine leak type
+        leak_type = layout_rng.choice(['edge', 'spot', 'streak'])
         
-        for i in range(leak_count):
-            # Determine leak type
-            leak_type = random.choice(['edge', 'spot', 'streak'])
+        if leak_type == 'edge':
+            # Light coming from an edge
+            edge = layout_rng.choice(['top', 'bottom', 'left', 'right'])
             
-            if leak_type == 'edge':
-                # Light coming from an edge
-                edge = random.choice(['top', 'bottom', 'left', 'right'])
-                
-                if edge == 'top':
-                    start_y, start_x = 0, random.randint(0, w-1)
-                    end_y, end_x = random.randint(int(h * 0.3), int(h * 0.7)), random.randint(0, w-1)
-                elif edge == 'bottom':
-                    start_y, start_x = h-1, random.randint(0, w-1)
-                    end_y, end_x = random.randint(int(h * 0.3), int(h * 0.7)), random.randint(0, w-1)
-                elif edge == 'left':
-                    start_y, start_x = random.randint(0, h-1), 0
-                    end_y, end_x = random.randint(0, h-1), random.randint(int(w * 0.3), int(w * 0.7))
-                else:  # right
-                    start_y, start_x = random.randint(0, h-1), w-1
-                    end_y, end_x = random.randint(0, h-1), random.randint(int(w * 0.3), int(w * 0.7))
-                
-                # Create gradient
-                Y, X = np.ogrid[:h, :w]
-                distances = np.sqrt((X - start_x)**2 + (Y - start_y)**2)
-                max_distance = np.sqrt((end_x - start_x)**2 + (end_y - start_y)**2)
-                gradient = np.clip(1 - distances / max_distance, 0, 1)
-                
-                leak_mask = np.maximum(leak_mask, gradient * random.uniform(0.3, 0.7) * intensity)
-                
-            elif leak_type == 'spot':
-                # Spot of light
-                center_x = random.randint(0, w-1)
-                center_y = random.randint(0, h-1)
-                radius = random.randint(int(min(h, w) * 0.1), int(min(h, w) * 0.3))
-                
-                Y, X = np.ogrid[:h, :w]
-                dist_from_center = np.sqrt((X - center_x)**2 + (Y - center_y)**2)
-                spot = np.clip(1 - dist_from_center / radius, 0, 1)
-                
-                leak_mask = np.maximum(leak_mask, spot * random.uniform(0.4, 0.8) * intensity)
-                
-            else:  # streak
-                # Light streak
-                start_x = random.randint(0, w-1)
-                start_y = random.randint(0, h-1)
-                angle = random.uniform(0, 2 * np.pi)
-                length = random.randint(int(min(h, w) * 0.3), int(min(h, w) * 0.7))
-                width = random.randint(10, 50)
-                
-                end_x = int(start_x + length * np.cos(angle))
-                end_y = int(start_y + length * np.sin(angle))
-                
-                # Create line mask
-                Y, X = np.ogrid[:h, :w]
-                # Use distance from line formula
-                numerator = np.abs((end_y - start_y)*X - (end_x - start_x)*Y + end_x*start_y - end_y*start_x)
-                denominator = np.sqrt((end_y - start_y)**2 + (end_x - start_x)**2)
-                distances = numerator / denominator
-                streak = np.clip(1 - distances / width, 0, 1)
-                
-                leak_mask = np.maximum(leak_mask, streak * random.uniform(0.3, 0.6) * intensity)
-        
-        # Create colored light leaks (warm tones)
-        color_matrix = np.zeros((h, w, 3), dtype=np.float32)
-        color_matrix[:, :, 0] = leak_mask * 0.5  # Blue channel - less
-        color_matrix[:, :, 1] = leak_mask * 0.8  # Green channel - medium
-        color_matrix[:, :, 2] = leak_mask        # Red channel - full
-        
-        # Apply the light leak
-        result = np.clip(result + color_matrix, 0, 1)
-        
-        # Add a slight overall warm tone to the image
-        result[:, :, 2] = np.clip(result[:, :, 2] * (1 + 0.1 * intensity), 0, 1)  # Increase red
-        
-        # Convert back to uint8
-        return (result * 255).astype(np.uint8)
+            if edge == 'top':
+                start_y, start_x = 0, layout_rng.integers(0, w-1, endpoint=True)
+                end_y, end_x = layout_rng.integers(int(h * 0.3), int(h * 0.7), endpoint=True), layout_rng.integers(0, w-1, endpoint=True)
+            elif edge == 'bottom':
+                start_y, start_x = h-1, layout_rng.integers(0, w-1, endpoint=True)
+                end_y, end_x = layout_rng.integers(int(h * 0.3), int(h * 0.7), endpoint=True), layout_rng.integers(0, w-1, endpoint=True)
+            elif edge == 'left':
+                start_y, start_x = layout_rng.integers(0, h-1, endpoint=True), 0
+                end_y, end_x = layout_rng.integers(0, h-1, endpoint=True), layout_rng.integers(int(w * 0.3), int(w * 0.7), endpoint=True)
+            else:  # right
+                start_y, start_x = layout_rng.integers(0, h-1, endpoint=True), w-1
+                end_y, end_x = layout_rng.integers(0, h-1, endpoint=True), layout_rng.integers(int(w * 0.3), int(w * 0.7), endpoint=True)
+            
+            # Create gradient
+            Y, X = np.ogrid[:h, :w]
+            distances = np.sqrt((X - start_x)**2 + (Y - start_y)**2)
+            max_distance = np.sqrt((end_x - start_x)**2 + (end_y - start_y)**2)
+            gradient = np.clip(1 - distances / max_distance, 0, 1)
+            
+            leak_mask = np.maximum(leak_mask, gradient * layout_rng.uniform(0.3, 0.7) * intensity)
+            
+        elif leak_type == 'spot':
+            # Spot of light
+            center_x = layout_rng.integers(0, w-1, endpoint=True)
+            center_y = layout_rng.integers(0, h-1, endpoint=True)
+            radius = layout_rng.integers(int(min(h, w) * 0.1), int(min(h, w) * 0.3), endpoint=True)
+            
+            Y, X = np.ogrid[:h, :w]
+            dist_from_center = np.sqrt((X - center_x)**2 + (Y - center_y)**2)
+            spot = np.clip(1 - dist_from_center / radius, 0, 1)
+            
+            leak_mask = np.maximum(leak_mask, spot * layout_rng.uniform(0.4, 0.8) * intensity)
+            
+        else:  # streak
+            # Light streak
+            start_x = layout_rng.integers(0, w-1, endpoint=True)
+            start_y = layout_rng.integers(0, h-1, endpoint=True)
+            angle = layout_rng.uniform(0, 2 * np.pi)
+            length = layout_rng.integers(int(min(h, w) * 0.3), int(min(h, w) * 0.7), endpoint=True)
+            width = layout_rng.integers(10, 50, endpoint=True)
+            
+            end_x = int(start_x + length * np.cos(angle))
+            end_y = int(start_y + length * np.sin(angle))
+            
+            # Create line mask
+            Y, X = np.ogrid[:h, :w]
+            # Use distance from line formula
+            numerator = np.abs((end_y - start_y)*X - (end_x - start_x)*Y + end_x*start_y - end_y*start_x)
+            denominator = np.sqrt((end_y - start_y)**2 + (end_x - start_x)**2)
+            distances = numerator / denominator
+            streak = np.clip(1 - distances / width, 0, 1)
+            
+            leak_mask = np.maximum(leak_mask, streak * layout_rng.uniform(0.3, 0.6) * intensity)
     
-    process_video_frames(input_path, output_path, light_leak_process, intensity=intensity)
+    # Create colored light leaks (warm tones)
+    color_matrix = np.zeros((h, w, 3), dtype=np.float32)
+    color_matrix[:, :, 0] = leak_mask * 0.5  # Blue channel - less
+    color_matrix[:, :, 1] = leak_mask * 0.8  # Green channel - medium
+    color_matrix[:, :, 2] = leak_mask        # Red channel - full
+    color_matrix.flags.writeable = False
+    return color_matrix
+
+def light_leak_stages(shape, intensity=0.5, frame_count=0, leak_seed=1):
+    """Pointwise stages of light_leak_process for frames of the given shape"""
+    h, w = shape[:2]
+    # Chain steps are seeded with [seed, step]; the cached leak layout needs a
+    # hashable seed, and a tuple seeds the same stream as the list
+    leak_seed = tuple(leak_seed) if isinstance(leak_seed, list) else leak_seed
+    # Apply the light leak, then add a slight overall warm tone to the image (increase red)
+    return [add_frame(light_leak_colors(h, w, intensity, leak_seed)), clip(),
+            channel_gains((None, None, 1 + 0.1 * intensity), clip_high=1)]
+
+def light_leak_process(frame, intensity=0.5, frame_count=0, leak_seed=1):
+    return evaluate(frame, light_leak_stages(frame.shape, intensity, frame_count, leak_seed))
+
+def apply_light_leak(input_path, output_path, intensity=0.5, seed=None, target_fps=None, cancel=None,
+                     checkpoint_dir=None, quality=None, encoder=None):
+    process_video_frames(input_path, output_path, light_leak_process, seed=seed, target_fps=target_fps, cancel=cancel, checkpoint_dir=checkpoint_dir, quality=quality, encoder=encoder, intensity=intensity, leak_seed=1 if seed is None else seed)
 
 # Sepia Tone Effect
-def apply_sepia(input_path, output_path, intensity=0.5):
-    def sepia_process(frame, intensity=0.5):
-        # Original colors in BGR
-        original = frame.astype(np.float32) / 255.0
-        
-        # Create sepia tone
-        sepia = np.zeros_like(original)
-        sepia[:, :, 0] = (original[:, :, 0] * 0.272 + original[:, :, 1] * 0.534 + original[:, :, 2] * 0.131)  # B
-        sepia[:, :, 1] = (original[:, :, 0] * 0.349 + original[:, :, 1] * 0.686 + original[:, :, 2] * 0.168)  # G
-        sepia[:, :, 2] = (original[:, :, 0] * 0.393 + original[:, :, 1] * 0.769 + original[:, :, 2] * 0.189)  # R
-        
-        # Add random flickering
-        if random.random() < 0.15 * intensity:
-            flicker = np.random.uniform(0.85, 1.15)
-            sepia = np.clip(sepia * flicker, 0, 1)
-        
+def sepia_stages(shape, intensity=0.5, rng=None):
+    """Pointwise stages of sepia_process for frames of the given shape"""
+    rng = rng if rng is not None else np.random.default_rng()
+    # Add random flickering
+    flicker = rng.uniform(0.85, 1.15) if rng.random() < 0.15 * intensity else None
+    
+    def tone(original, rows):
+        # Create sepia tone from the original colors in BGR
+        sepia = np.empty_like(original)
+        sepia[..., 0] = (original[..., 0] * 0.272 + original[..., 1] * 0.534 + original[..., 2] * 0.131)  # B
+        sepia[..., 1] = (original[..., 0] * 0.349 + original[..., 1] * 0.686 + original[..., 2] * 0.168)  # G
+        sepia[..., 2] = (original[..., 0] * 0.393 + original[..., 1] * 0.769 + original[..., 2] * 0.189)  # R
+        if flicker is not None:
+            np.multiply(sepia, flicker, out=sepia)
+            np.clip(sepia, 0, 1, out=sepia)
         # Blend original and sepia based on intensity
-        result = cv2.addWeighted(original, 1 - intensity, sepia, intensity, 0)
-        
-        # Add slight grain
-        grain_intensity = 0.03 * intensity
-        if grain_intensity > 0:
-            grain = random_noise(result, mode='gaussian', var=grain_intensity**2)
-            result = grain
-        
-        # Convert back to uint8
-        return (result * 255).astype(np.uint8)
+        return cv2.addWeighted(original, 1 - intensity, sepia, intensity, 0)
     
-    process_video_frames(input_path, output_path, sepia_process, intensity=intensity)
+    stages = [tone if flicker is None else stochastic(tone)]
+    # Add slight grain
+    grain_intensity = 0.03 * intensity
+    if grain_intensity > 0:
+        stages.append(gaussian_noise(rng, grain_intensity**2))
+    return stages
+
+def sepia_process(frame, intensity=0.5, rng=None):
+    return evaluate(frame, sepia_stages(frame.shape, intensity, rng))
+
+def apply_sepia(input_path, output_path, intensity=0.5, seed=None, target_fps=None, cancel=None,
+                checkpoint_dir=None, quality=None, encoder=None):
+    process_video_frames(input_path, output_path, sepia_process, seed=seed, target_fps=target_fps, cancel=cancel, checkpoint_dir=checkpoint_dir, quality=quality, encoder=encoder, intensity=intensity)
 
 # Glitch Effect
-def apply_glitch(input_path, output_path, intensity=0.5):
-    def glitch_process(frame, intensity=0.5, frame_count=0):
-        h, w = frame.shape[:2]
-        result = frame.copy()
+def glitch_process(frame, intensity=0.5, frame_count=0, rng=None):
+    rng = rng if rng is not None else np.random.default_rng()
+    h, w = frame.shape[:2]
+    result = frame.copy()
+    
+    # Apply glitch only on some frames
+    if rng.random() < 0.3 * intensity:
+        # Determine how many glitch blocks to create
+        num_glitches = int(15 * intensity)
         
-        # Apply glitch only on some frames
-        if random.random() < 0.3 * intensity:
-            # Determine how many glitch blocks to create
-            num_glitches = int(15 * intensity)
+        for _ in range(num_glitches):
+            # Select random block
+            block_height = rng.integers(10, max(10, int(h * 0.1)), endpoint=True)
+            y_start = rng.integers(0, h - block_height - 1, endpoint=True)
             
-            for _ in range(num_glitches):
-                # Select random block
-                block_height = random.randint(10, max(10, int(h * 0.1)))
-                y_start = random.randint(0, h - block_height - 1)
-                
-                # Select random effect
-                effect_type = random.choice(['shift', 'color_shift', 'repeat', 'corrupt'])
+            # Select random effect
+            effect_type = rng.choice(['shift', 'color_shift', 'repeat', 'corrupt'])
+            
+            if effect_type == 'shift':
+                # Horizontal shift
+                shift_amount = rng.integers(5, int(w * 0.2), endpoint=True)
+                direction = rng.choice([-1, 1])
                 
-                if effect_type == 'shift':
-                    # Horizontal shift
-                    shift_amount = random.randint(5, int(w * 0.2))
-                    direction = random.choice([-1, 1])
-                    
-                    block = result[y_start:y_start+block_height, :].copy()
-                    if direction > 0:  # Shift right
-                        block[:, shift_amount:] = block[:, :-shift_amount]
-                    else:  # Shift left
-                        block[:, :-shift_amount] = block[:, shift_amount:]
-                        
-                    result[y_start:y_start+block_height, :] = block
-                    
-                elif effect_type == 'color_shift':
-                    # RGB channel shift
-                    shift_amount = random.randint(5, int(w * 0.1))
-                    
-                    block = result[y_start:y_start+block_height, :].copy()
-                    # Shift red channel
-                    if random.random() < 0.5:
-                        if random.random() < 0.5:  # Right shift
-                            block[:, shift_amount:, 2] = block[:, :-shift_amount, 2]
-                        else:  # Left shift
-                            block[:, :-shift_amount, 2] = block[:, shift_amount:, 2]
+                block = result[y_start:y_start+block_height, :].copy()
+                if direction > 0:  # Shift right
+                    block[:, shift_amount:] = block[:, :-shift_amount]
+                else:  # Shift left
+                    block[:, :-shift_amount] = block[:, shift_amount:]
                     
-                    # Shift green channel
-                    if random.random() < 0.5:
-                        if random.random() < 0.5:  # Right shift
-                            block[:, shift_amount:, 1] = block[:, :-shift_amount, 1]
-                        else:  # Left shift
-                            block[:, :-shift_amount, 1] = block[:, shift_amount:, 1]
-                            
-                    # Shift blue channel
-                    if random.random() < 0.5:
-                        if random.random() < 0.5:  # Right shift
-                            block[:, shift_amount:, 0] = block[:, :-shift_amount, 0]
-                        else:  # Left shift
-                            block[:, :-shift_amount, 0] = block[:, shift_amount:, 0]
-                            
-                    result[y_start:y_start+block_height, :] = block
-                    
-                elif effect_type == 'repeat':
-                    # Repeat a block multiple times
-                    repeat_lines = min(5, block_height)
-                    for i in range(block_height):
-                        source_line = y_start + (i % repeat_lines)
-                        result[y_start + i, :] = result[source_line, :]
-                        
-                else:  # corrupt
-                    # Add random noise/corruption
-                    block = result[y_start:y_start+block_height, :].astype(np.float32) / 255.0
-                    noise = np.random.uniform(-0.5, 0.5, block.shape) * intensity
-                    block = np.clip(block + noise, 0, 1)
-                    result[y_start:y_start+block_height, :] = (block * 255).astype(np.uint8)
-            
-            # Add random digital artifacts (pixelation) to parts of the image
-            if random.random() < 0.2 * intensity:
-                pixel_size = random.randint(5, 20)
-                area_width = random.randint(int(w * 0.1), int(w * 0.3))
-                area_height = random.randint(int(h * 0.1), int(h * 0.3))
-                x_start = random.randint(0, w - area_width - 1)
-                y_start = random.randint(0, h - area_height - 1)
+                result[y_start:y_start+block_height, :] = block
                 
-                area = result[y_start:y_start+area_height, x_start:x_start+area_width].copy()
+            elif effect_type == 'color_shift':
+                # RGB channel shift
+                shift_amount = rng.integers(5, int(w * 0.1), endpoint=True)
                 
-                # Pixelate by resizing down and up
-                small = cv2.resize(area, (area_width // pixel_size, area_height // pixel_size), 
-                                   interpolation=cv2.INTER_LINEAR)
-                pixelated = cv2.resize(small, (area_width, area_height), 
-                                       interpolation=cv2.INTER_NEAREST)
+                block = result[y_start:y_start+block_height, :].copy()
+                # Shift red channel
+                if rng.random() < 0.5:
+                    if rng.random() < 0.5:  # Right shift
+                        block[:, shift_amount:, 2] = block[:, :-shift_amount, 2]
+                    else:  # Left shift
+                        block[:, :-shift_amount, 2] = block[:, shift_amount:, 2]
                 
-                result[y_start:y_start+area_height, x_start:x_start+area_width] = pixelated
+                # Shift green channel
+                if rng.random() < 0.5:
+                    if rng.random() < 0.5:  # Right shift
+                        block[:, shift_amount:, 1] = block[:, :-shift_amount, 1]
+                    else:  # Left shift
+                        block[:, :-shift_amount, 1] = block[:, shift_amount:, 1]
+                        
+                # Shift blue channel
+                if rng.random() < 0.5:
+                    if rng.random() < 0.5:  # Right shift
+                        block[:, shift_amount:, 0] = block[:, :-shift_amount, 0]
+                    else:  # Left shift
+                        block[:, :-shift_amount, 0] = block[:, shift_amount:, 0]
+                        
+                result[y_start:y_start+block_height, :] = block
+                
+            elif effect_type == 'repeat':
+                # Repeat a block multiple times
+                repeat_lines = min(5, block_height)
+                for i in range(block_height):
+                    source_line = y_start + (i % repeat_lines)
+                    result[y_start + i, :] = result[source_line, :]
+                    
+            else:  # corrupt
+                # Add random noise/corruption
+                block = result[y_start:y_start+block_height, :].astype(np.float32) / 255.0
+                noise = rng.uniform(-0.5, 0.5, block.shape) * intensity
+                block = np.clip(block + noise, 0, 1)
+                result[y_start:y_start+block_height, :] = (block * 255).astype(np.uint8)
         
-        return result
+        # Add random digital artifacts (pixelation) to parts of the image
+        if rng.random() < 0.2 * intensity:
+            pixel_size = rng.integers(5, 20, endpoint=True)
+            area_width = rng.integers(int(w * 0.1), int(w * 0.3), endpoint=True)
+            area_height = rng.integers(int(h * 0.1), int(h * 0.3), endpoint=True)
+            x_start = rng.integers(0, w - area_width - 1, endpoint=True)
+            y_start = rng.integers(0, h - area_height - 1, endpoint=True)
+            
+            area = result[y_start:y_start+area_height, x_start:x_start+area_width].copy()
+            
+            # Pixelate by resizing down and up
+            small = cv2.resize(area, (max(1, area_width // pixel_size), max(1, area_height // pixel_size)), 
+                               interpolation=cv2.INTER_LINEAR)
+            pixelated = cv2.resize(small, (area_width, area_height), 
+                                   interpolation=cv2.INTER_NEAREST)
+            
+            result[y_start:y_start+area_height, x_start:x_start+area_width] = pixelated
     
-    process_video_frames(input_path, output_path, glitch_process, intensity=intensity)
+    return result
+
+def apply_glitch(input_path, output_path, intensity=0.5, seed=None, target_fps=None, cancel=None,
+                 checkpoint_dir=None, quality=None, encoder=None):
+    process_video_frames(input_path, output_path, glitch_process, seed=seed, target_fps=target_fps, cancel=cancel, checkpoint_dir=checkpoint_dir, quality=quality, encoder=encoder, intensity=intensity)
 
 # Vintage Color Effect
-def apply_vintage_color(input_path, output_path, intensity=0.5):
-    def vintage_color_process(frame, intensity=0.5):
-        # Convert to float for processing
-        frame_float = frame.astype(np.float32) / 255.0
-        
-        # Create vintage look with color adjustments
-        # Increase contrast slightly
-        contrast = 1.2 * intensity + (1 - intensity)
-        frame_float = (frame_float - 0.5) * contrast + 0.5
-        
+# Helper function to build the slight vignette of a frame size once
+@lru_cache(maxsize=8)
+def vintage_color_vignette(h, w, intensity):
+    center_x, center_y = w // 2, h // 2
+    Y, X = np.ogrid[:h, :w]
+    dist_from_center = np.sqrt((X - center_x)**2 + (Y - center_y)**2)
+    max_dist = np.sqrt(center_x**2 + center_y**2)
+    vignette = 1 - dist_from_center / max_dist * 0.3 * intensity
+    vignette = np.clip(vignette, 0.7, 1.0)
+    vignette.flags.writeable = False
+    return vignette
+
+def vintage_color_stages(shape, intensity=0.5, rng=None):
+    """Pointwise stages of vintage_color_process for frames of the given shape"""
+    rng = rng if rng is not None else np.random.default_rng()
+    h, w = shape[:2]
+    
+    # Create vintage look with color adjustments
+    # Increase contrast slightly
+    contrast_amount = 1.2 * intensity + (1 - intensity)
+    shadows_strength = 0.1 * intensity
+    highlights_strength = 0.1 * intensity
+    
+    def cross_process(values, rows):
         # Cross-process effect (common in vintage photos)
         # Boost blue in shadows, yellow-green in highlights
-        shadows = frame_float * frame_float  # Square to target shadows
-        highlights = 1 - ((1 - frame_float) * (1 - frame_float))  # Target highlights
-        
-        # Blue in shadows
-        shadows_strength = 0.1 * intensity
-        frame_float[:, :, 0] += shadows[:, :, 0] * shadows_strength  # Blue channel
-        
-        # Yellow-green in highlights
-        highlights_strength = 0.1 * intensity
-        frame_float[:, :, 1] += highlights[:, :, 1] * highlights_strength  # Green
-        frame_float[:, :, 2] += highlights[:, :, 2] * highlights_strength  # Red
-        
-        # Adjust color balance for vintage look
-        # The original color matrix application was causing broadcasting issues
-        # Instead of matrix multiplication, we'll apply channel adjustments directly
-        
-        # Apply color balance adjustments directly to each channel
-        frame_float[:, :, 0] *= (1 - 0.1 * intensity)  # Reduce blue channel
-        frame_float[:, :, 1] *= (1 + 0.05 * intensity)  # Slightly boost green channel
-        frame_float[:, :, 2] *= (1 + 0.15 * intensity)  # Boost red channel more
-        
+        blue = values[..., 0]
+        shadows = blue * blue  # Square to target shadows
+        shadows *= shadows_strength
+        blue += shadows
+        for channel in (1, 2):  # Green and red
+            channel_values = values[..., channel]
+            highlights = 1 - channel_values
+            highlights *= highlights
+            np.subtract(1, highlights, out=highlights)  # Target highlights
+            highlights *= highlights_strength
+            channel_values += highlights
+        return values
+    
+    stages = [
+        contrast(contrast_amount),
+        cross_process,
+        # Adjust color balance for vintage look: reduce blue, slightly boost
+        # green and boost red more
+        channel_gains((1 - 0.1 * intensity, 1 + 0.05 * intensity, 1 + 0.15 * intensity)),
         # Add slight vignette
-        h, w = frame.shape[:2]
-        center_x, center_y = w // 2, h // 2
-        Y, X = np.ogrid[:h, :w]
-        dist_from_center = np.sqrt((X - center_x)**2 + (Y - center_y)**2)
-        max_dist = np.sqrt(center_x**2 + center_y**2)
-        vignette = 1 - dist_from_center / max_dist * 0.3 * intensity
-        vignette = np.clip(vignette, 0.7, 1.0)
-        
-        # Apply vignette
-        for i in range(3):
-            frame_float[:, :, i] = frame_float[:, :, i] * vignette
-        
-        # Add grain
-        if intensity > 0.3:
-            grain_intensity = 0.05 * intensity
-            grain = random_noise(frame_float, mode='gaussian', var=grain_intensity**2)
-            frame_float = grain
-        
-        # Clip values to valid range and convert back to uint8
-        frame_float = np.clip(frame_float, 0, 1)
-        return (frame_float * 255).astype(np.uint8)
+        multiply_mask(vintage_color_vignette(h, w, intensity))
+    ]
+    
+    # Add grain
+    if intensity > 0.3:
+        grain_intensity = 0.05 * intensity
+        stages.append(gaussian_noise(rng, grain_intensity**2))
     
-    process_video_frames(input_path, output_path, vintage_color_process, intensity=intensity) 
\ No newline at end of file
+    # Clip values to valid range
+    stages.append(clip())
+    return stages
+
+def vintage_color_process(frame, intensity=0.5, rng=None):
+    return evaluate(frame, vintage_color_stages(frame.shape, intensity, rng))
+
+def apply_vintage_color(input_path, output_path, intensity=0.5, seed=None, target_fps=None, cancel=None,
+                        checkpoint_dir=None, quality=None, encoder=None):
+    process_video_frames(input_path, output_path, vintage_color_process, seed=seed, target_fps=target_fps, cancel=cancel, checkpoint_dir=checkpoint_dir, quality=quality, encoder=encoder, intensity=intensity) 
+
+# Effects whose frame function is a list of pointwise stages, built by the
+# function mapped to it from the frame shape and the same arguments.
+# process_video_fanout fuses consecutive ones of a chain into a single pass.
+POINTWISE_STAGES = {
+    vintage_color_process: vintage_color_stages,
+    sepia_process: sepia_stages,
+    light_leak_process: light_leak_stages
+}
+
+# The same effects by function name, for frame functions whose arguments must
+# survive a round trip through a checkpoint manifest
+POINTWISE_EFFECTS = {func.__name__: func for func in POINTWISE_STAGES}
+
+def fused_steps_stages(shape, steps=(), frame_index=0):
+    """
+    Pointwise stages of fused_steps_process for frame frame_index of the given shape
+    Each step draws the random stream process_video_fanout gives it, so the
+    frame matches a fan-out output of the same chain.
+    """
+    stage_lists = []
+    for name, seed, kwargs in steps:
+        func = POINTWISE_EFFECTS[name]
+        if 'rng' in inspect.signature(func).parameters:
+            kwargs = dict(kwargs, rng=frame_rng(np.random.SeedSequence(seed), frame_index))
+        stage_lists.append(POINTWISE_STAGES[func](shape, **kwargs))
+    return chain_stages(stage_lists)
+
+def fused_steps_process(frame, steps=(), frame_index=0):
+    """
+    Frame function applying a run of pointwise effects in a single pass
+    steps are (effect function name, seed, kwargs), see fused_steps_stages.
+    """
+    return evaluate(frame, fused_steps_stages(frame.shape, steps, frame_index))
+
+fused_steps_process.takes_frame_index = True
@@ -0,0 +1,115 @@
+import os
+import time
+
+# Quality levels tried in order when a job would miss its deadline: the scale
+# of the working resolution the effect runs at, and how many output frames
+# share one processed frame (2 halves the effective frame rate)
+QUALITY_LEVELS = (
+    (1.0, 1),
+    (0.75, 1),
+    (0.5, 1),
+    (0.5, 2),
+    (0.35, 2),
+    (0.35, 3)
+)
+
+# Frames processed as a warm-up and then before the first projection, and
+# between two projections
+ADAPTIVE_SAMPLE_FRAMES = int(os.environ.get('ADAPTIVE_SAMPLE_FRAMES', 10))
+ADAPTIVE_CHECK_FRAMES = int(os.environ.get('ADAPTIVE_CHECK_FRAMES', 30))
+
+# Time the final encode and audio mux are expected to take, as a share of the
+# time spent processing frames
+ADAPTIVE_FINISH_SHARE = float(os.environ.get('ADAPTIVE_FINISH_SHARE', 0.5))
+
+# Stages whose cost follows the working resolution and the processed frames
+SCALED_STAGES = ('effect', 'color_convert')
+
+def level_cost(level):
+    scale, hold = QUALITY_LEVELS[level]
+    return scale * scale / hold
+
+class QualityController:
+    """
+    Keeps one process_video_frames run within a deadline by lowering its quality
+
+    After a warm-up of the first frames it projects the finishing time from the
+    measured time per frame, the share of it spent in the stages that scale
+    with the working resolution, and the frames left. When the projection misses the
+    deadline (a time.monotonic() value) it moves to the first level of
+    QUALITY_LEVELS that fits, or the last one. Quality is only ever lowered, so
+    the look doesn't change back and forth.
+    """
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.level = 0
+        self.level_start = 0
+        self.adapted_at_frame = None
+        self.projected_seconds = None
+        self.fps = None
+
+    def start(self, frame_count, fps):
+        """Called once the run knows how many frames it will write, at which rate"""
+        self.frame_count = frame_count
+        self.fps = fps
+        self.start_time = time.monotonic()
+        self.next_check = ADAPTIVE_SAMPLE_FRAMES
+        self.window = (0, self.start_time, None)
+
+    def settings(self, output_index):
+        """(working scale, whether output frame output_index repeats the previous one)"""
+        scale, hold = QUALITY_LEVELS[self.level]
+        return scale, (output_index - self.level_start) % hold != 0
+
+    def update(self, frames_written, stage_times):
+        """Record progress after a frame was written, changing the level when due"""
+        if frames_written < self.next_check:
+            return
+
+        now = time.monotonic()
+        window_frames, window_start, window_stages = self.window
+        self.window = (frames_written, now, dict(stage_times))
+        if window_stages is None:
+            # The first frames include opening the video and writer and starting
+            # the frame workers, so they only serve as the baseline
+            self.next_check = frames_written + ADAPTIVE_SAMPLE_FRAMES
+            return
+        self.next_check = frames_written + ADAPTIVE_CHECK_FRAMES
+        frames = frames_written - window_frames
+        if frames <= 0:
+            return
+
+        seconds_per_frame = (now - window_start) / frames
+        spent = {stage: stage_times[stage] - window_stages.get(stage, 0.0) for stage in stage_times}
+        total = sum(spent.values())
+        scaled_share = sum(spent.get(stage, 0.0) for stage in SCALED_STAGES) / total if total > 0 else 1.0
+        remaining = max(0, self.frame_count - frames_written)
+        elapsed = now - self.start_time
+
+        def projected_end(level):
+            frame_seconds = seconds_per_frame * ((1 - scaled_share) +
+                                                 scaled_share * level_cost(level) / level_cost(self.level))
+            loop_seconds = elapsed + remaining * frame_seconds
+            return now + remaining * frame_seconds + ADAPTIVE_FINISH_SHARE * loop_seconds
+
+        level = self.level
+        while level < len(QUALITY_LEVELS) - 1 and projected_end(level) > self.deadline:
+            level += 1
+        self.projected_seconds = projected_end(level) - self.start_time
+        if level != self.level:
+            print(f"Lowering quality to {QUALITY_LEVELS[level]} at frame {frames_written} to meet the deadline")
+            self.level = level
+            self.level_start = frames_written
+            if self.adapted_at_frame is None:
+                self.adapted_at_frame = frames_written
+
+    def report(self):
+        """The settings the run ended with, for the response"""
+        scale, hold = QUALITY_LEVELS[self.level]
+        return {
+            'scale': scale,
+            'effective_fps': round(self.fps / hold, 3) if self.fps else None,
+            'adapted_at_frame': self.adapted_at_frame,
+            'projected_seconds': None if self.projected_seconds is None else round(self.projected_seconds, 1)
+        }
@@ -1,24 +1,54 @@
 import os
 from flask import Flask, request, jsonify, send_file, render_template, g, session, url_for
 import tempfile
-import cv2
-import numpy as np
 import time
 import shutil
-import glob
+import math
+import threading
+import json
+import queue
+import fcntl
+import re
+import select
+import socket
+from concurrent.futures import ThreadPoolExecutor
 import uuid
-import requests
-from urllib.parse import urlparse
+from urllib.parse import urlparse, quote
 import werkzeug.serving
-from Ventageeffect import (
-    apply_vhs_effect, 
-    apply_crt_scanlines, 
-    apply_film_grain, 
-    apply_old_movie, 
-    apply_light_leak,
-    apply_sepia, 
-    apply_glitch, 
-    apply_vintage_color
+from werkzeug.security import safe_join
+from effect_registry import (
+    apply_effect_by_name,
+    apply_fanout_by_name,
+    apply_fused_by_name,
+    chain_seed,
+    describe_effects,
+    estimate_job_cost,
+    estimate_job_memory,
+    get_effect,
+    is_pointwise,
+    parse_effect,
+    probe_video,
+    step_cost,
+    step_seed
+)
+from Ventageeffect import FRAME_WORKERS, add_stage_hook
+from cancellation import CancelToken, JobCancelled, check_cancel
+from time_ranges import covered_seconds, parse_time_ranges, render_time_ranges
+from janitor import Janitor
+from downloader import download_file
+from adaptive import QualityController
+from encoding import encoder_name
+from checkpoints import job_fingerprint, read_manifest, write_manifest
+from media_probe import file_fingerprint
+from memory_budget import MemoryScheduler
+from metrics import (
+    ACTIVE_JOBS,
+    DOWNLOAD_FAILURES,
+    JOBS_CANCELLED,
+    record_request,
+    record_video_stages,
+    render_metrics,
+    time_stage
 )
 
 app = Flask(__name__)
@@ -30,11 +60,91 @@ OUTPUT_FOLDER = 'output_videos'  # For storing output videos that will be served
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 
+# Every job gets its own working directory under WORKSPACE_ROOT, so concurrent
+# jobs never see or delete each other's files. Point it at a tmpfs mount such
+# as /dev/shm/vintage_jobs to keep intermediate videos in memory.
+WORKSPACE_ROOT = os.environ.get('WORKSPACE_ROOT', UPLOAD_FOLDER)
+os.makedirs(WORKSPACE_ROOT, exist_ok=True)
+
 # Server configuration
 SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
 SERVER_PORT = int(os.environ.get('SERVER_PORT', 5557))
 SERVER_BASE_URL = os.environ.get('SERVER_BASE_URL', f'http://{SERVER_HOST}:{SERVER_PORT}')
 
+# Admission control, in estimated processing seconds (0 disables a limit).
+# MAX_JOB_COST_SECONDS rejects a single oversized job outright, while
+# MAX_ACTIVE_COST_SECONDS caps the work running in this worker process at once
+# and asks clients to come back later with a Retry-After header.
+MAX_JOB_COST_SECONDS = float(os.environ.get('MAX_JOB_COST_SECONDS', 0))
+MAX_ACTIVE_COST_SECONDS = float(os.environ.get('MAX_ACTIVE_COST_SECONDS', 0))
+
+# Memory admission across all worker processes of the host: jobs are admitted
+# while their estimated peak memory fits MEMORY_BUDGET_MB (0 disables it) and
+# otherwise wait, first come first served, for up to MEMORY_QUEUE_TIMEOUT_SECONDS
+# before the client is asked to retry. The workers share the admitted jobs
+# through the ledger file at MEMORY_LEDGER_PATH.
+MEMORY_BUDGET_MB = int(os.environ.get('MEMORY_BUDGET_MB', 0))
+MEMORY_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('MEMORY_QUEUE_TIMEOUT_SECONDS', 300))
+memory_scheduler = MemoryScheduler(
+    os.environ.get('MEMORY_LEDGER_PATH', os.path.join(tempfile.gettempdir(), 'vintage_memory_ledger.json')),
+    budget_bytes=MEMORY_BUDGET_MB * 1024 * 1024,
+    poll_interval=float(os.environ.get('MEMORY_POLL_SECONDS', 0.5)))
+
+# Batch endpoint limits: items per request, and the concurrent downloads and
+# processing jobs each batch may run
+MAX_BATCH_ITEMS = int(os.environ.get('MAX_BATCH_ITEMS', 100))
+BATCH_DOWNLOAD_WORKERS = int(os.environ.get('BATCH_DOWNLOAD_WORKERS', 4))
+BATCH_PROCESS_WORKERS = int(os.environ.get('BATCH_PROCESS_WORKERS', 2))
+
+# Most looks /api/url/fan-out renders from one decode
+MAX_FANOUT_OUTPUTS = int(os.environ.get('MAX_FANOUT_OUTPUTS', 8))
+
+# Cancellation: JOB_TIMEOUT_SECONDS is the longest a job may run (0 for no
+# limit; a request's own timeout can only lower it), and with
+# CANCEL_ON_DISCONNECT a job stops once its client has closed the connection.
+# A job is also stopped by DELETE /api/jobs/<job_id>, which writes the cancel
+# marker into the job's workspace so the worker process running it notices.
+JOB_TIMEOUT_SECONDS = float(os.environ.get('JOB_TIMEOUT_SECONDS', 0))
+CANCEL_ON_DISCONNECT = os.environ.get('CANCEL_ON_DISCONNECT', '1') == '1'
+DISCONNECT_POLL_SECONDS = float(os.environ.get('DISCONNECT_POLL_SECONDS', 1.0))
+CANCEL_MARKER = '.cancel'
+WORKSPACE_LOCK = '.lock'
+JOB_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+# How /videos/<filename> sends the bytes: '' streams them from this worker,
+# 'x-accel' (nginx) or 'x-sendfile' (Apache, lighttpd) only returns a header
+# and lets the front proxy serve the file, freeing the worker immediately.
+# X_ACCEL_PREFIX is the internal nginx location aliased to output_videos.
+VIDEO_OFFLOAD = os.environ.get('VIDEO_OFFLOAD', '').lower()
+X_ACCEL_PREFIX = os.environ.get('X_ACCEL_PREFIX', '/protected_videos/')
+app.config['USE_X_SENDFILE'] = VIDEO_OFFLOAD == 'x-sendfile'
+
+# Background cleanup: entries older than FILE_MAX_AGE_SECONDS are deleted, and
+# when OUTPUT_QUOTA_MB is set the least recently served outputs are evicted to
+# keep output_videos under it
+FILE_MAX_AGE_SECONDS = int(os.environ.get('FILE_MAX_AGE_SECONDS', 3600))
+OUTPUT_QUOTA_MB = int(os.environ.get('OUTPUT_QUOTA_MB', 0))
+janitor = Janitor([UPLOAD_FOLDER, WORKSPACE_ROOT], OUTPUT_FOLDER,
+                  max_age=FILE_MAX_AGE_SECONDS,
+                  quota_bytes=OUTPUT_QUOTA_MB * 1024 * 1024,
+                  interval=int(os.environ.get('JANITOR_INTERVAL_SECONDS', 30)),
+                  rescan_interval=int(os.environ.get('JANITOR_RESCAN_SECONDS', 300)),
+                  workspace_lock=WORKSPACE_LOCK)
+
+# Jobs currently running in this worker: job id -> (start time, estimated seconds)
+active_jobs = {}
+active_jobs_lock = threading.Lock()
+
+# Lock files held on the workspaces of the jobs running in this worker: workspace -> open file
+workspace_locks = {}
+
+# Cancel tokens of the jobs running in this worker: job id -> (token, event stopping its disconnect watcher)
+running_jobs = {}
+running_jobs_lock = threading.Lock()
+
+# Report the stage timings of every processed video as metrics
+add_stage_hook(record_video_stages)
+
 # Helper function to safely delete a file
 def safe_delete(file_path):
     try:
@@ -45,36 +155,410 @@ def safe_delete(file_path):
         print(f"Could not delete {file_path}: {str(e)}")
         # File is still in use, will be cleaned up later
 
-# Helper function to clean all previous output files
-def clean_previous_outputs():
+# Helper function to open the private working directory of a job and lock it
+# for this request. Returns None if a job with that id is running. The lock dies
+# with the process, so the workspace of a job whose worker was killed is
+# reopened as it is and the job resumes from its checkpoints.
+def open_workspace(job_id):
+    workspace = os.path.join(WORKSPACE_ROOT, f"job_{job_id}")
+    os.makedirs(workspace, exist_ok=True)
+    lock_file = open(os.path.join(workspace, WORKSPACE_LOCK), 'a')
     try:
-        # Get all output files in the temp directory
-        output_files = glob.glob(os.path.join(UPLOAD_FOLDER, "output_*.mp4"))
-        output_files.extend(glob.glob(os.path.join(UPLOAD_FOLDER, "step_*.mp4")))
-        
-        # Delete each one
-        for file_path in output_files:
-            safe_delete(file_path)
-            
-        print(f"Cleaned {len(output_files)} previous output files")
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    workspace_locks[workspace] = lock_file
+    # A cancel request meant for the killed run must not stop this one
+    safe_delete(os.path.join(workspace, CANCEL_MARKER))
+    # Let the janitor remove it if the job never finishes
+    janitor.track(workspace)
+    return workspace
+
+# Helper function to delete a job's working directory and everything in it
+def remove_workspace(workspace):
+    try:
+        shutil.rmtree(workspace)
+        print(f"Deleted workspace: {workspace}")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Could not delete workspace {workspace}: {str(e)}")
+    lock_file = workspace_locks.pop(workspace, None)
+    if lock_file is not None:
+        lock_file.close()
+
+# Helper function to end a request's hold on a job's workspace. Resumable jobs
+# (with a client job_id) keep it unless they finished or were cancelled on
+# purpose: after an error, a rejection or an aborted worker (gunicorn's timeout
+# exits the worker through these cleanups) a retry resumes from the checkpoints.
+# The janitor expires kept workspaces that are never retried.
+def close_workspace(workspace, keep=False):
+    if not keep:
+        remove_workspace(workspace)
+        return
+    lock_file = workspace_locks.pop(workspace, None)
+    if lock_file is not None:
+        lock_file.close()
+    janitor.track(workspace)
+
+# Helper function to tell whether a stopped job's workspace is of no further use
+def cancelled_on_purpose(error):
+    return error.reason == 'cancelled'
+
+# Helper function to send a job's output file and drop the job's workspace.
+# The open file handle keeps the output readable until it has been sent.
+def send_workspace_file(workspace, file_path, download_name):
+    output_file = open(file_path, 'rb')
+    remove_workspace(workspace)
+    return send_file(output_file, as_attachment=True,
+                     download_name=download_name,
+                     mimetype='video/mp4')
+
+# Helper function to tell whether a workspace holds checkpoints a retried job can resume from
+def has_checkpoints(workspace):
+    try:
+        return any(name.endswith(('checkpoint', '_progress.json')) for name in os.listdir(workspace))
+    except OSError:
+        return False
+
+# Helper function to remove workspaces left behind by a previous run of the server.
+# Workspaces with checkpoints are kept for their jobs to resume; the janitor expires them.
+def clean_stale_workspaces():
+    try:
+        stale = [name for name in os.listdir(WORKSPACE_ROOT)
+                 if name.startswith('job_') and not has_checkpoints(os.path.join(WORKSPACE_ROOT, name))]
+        for name in stale:
+            remove_workspace(os.path.join(WORKSPACE_ROOT, name))
+        print(f"Cleaned {len(stale)} stale workspaces")
     except Exception as e:
-        print(f"Error cleaning previous outputs: {str(e)}")
+        print(f"Error cleaning stale workspaces: {str(e)}")
 
 # Helper function to download a video from URL
-def download_video(url, output_path):
+def download_video(url, output_path, cancel=None):
     try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()  # Check if the request was successful
-        
-        with open(output_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        with time_stage('download'):
+            # Large sources are fetched as parallel byte ranges when the server allows it
+            download_file(url, output_path, cancel)
         
         return True
+    except JobCancelled:
+        raise
     except Exception as e:
+        DOWNLOAD_FAILURES.inc()
         print(f"Error downloading video from {url}: {str(e)}")
         return False
 
+# Helper function to estimate how long a chain of effects will take on a video,
+# or on the requested time ranges of it, at the requested frame rate
+def estimate_video_cost(input_path, effect_names, ranges=None, target_fps=None):
+    metadata = probe_video(input_path)
+    cost = estimate_job_cost(metadata, effect_names, target_fps)
+    if ranges and metadata['fps'] and metadata['frame_count']:
+        duration = metadata['frame_count'] / metadata['fps']
+        cost *= min(1.0, covered_seconds(ranges, duration) / duration)
+    return cost
+
+# Helper function to estimate the peak memory of rendering a video with each
+# chain of effects; fan-outs render their chains in-process, without frame workers
+def estimate_video_memory(input_path, chains, fanout=False):
+    return estimate_job_memory(probe_video(input_path), chains, 1 if fanout else FRAME_WORKERS)
+
+# Helper function to register a job if it fits the cost and memory budgets,
+# waiting for memory to be freed if needed.
+# Returns None when the job was admitted, otherwise (error body, status, retry after).
+def reserve_job(job_id, estimated_cost, estimated_memory=0, cancel=None):
+    if MAX_JOB_COST_SECONDS and estimated_cost > MAX_JOB_COST_SECONDS:
+        return {
+            'error': 'Video is too large to process',
+            'estimated_seconds': round(estimated_cost, 1),
+            'max_seconds': MAX_JOB_COST_SECONDS
+        }, 413, None
+    if not memory_scheduler.fits_budget(estimated_memory):
+        return {
+            'error': 'Video needs more memory than the server allows',
+            'estimated_mb': round(estimated_memory / 2**20),
+            'memory_budget_mb': MEMORY_BUDGET_MB
+        }, 413, None
+
+    retry_after = memory_scheduler.acquire(job_id, estimated_memory, estimated_cost,
+                                           MEMORY_QUEUE_TIMEOUT_SECONDS, cancel)
+    if retry_after is not None:
+        return {
+            'error': 'Server is busy, retry later',
+            'estimated_mb': round(estimated_memory / 2**20),
+            'retry_after': retry_after
+        }, 503, retry_after
+
+    with active_jobs_lock:
+        now = time.time()
+        remaining = sorted(max(0.0, start + cost - now) for start, cost in active_jobs.values())
+
+        if MAX_ACTIVE_COST_SECONDS and remaining and sum(remaining) + estimated_cost > MAX_ACTIVE_COST_SECONDS:
+            # Wait until enough of the running work has drained for this job to fit
+            retry_after = remaining[-1]
+            for finished_at in remaining:
+                if sum(max(0.0, r - finished_at) for r in remaining) + estimated_cost <= MAX_ACTIVE_COST_SECONDS:
+                    retry_after = finished_at
+                    break
+            retry_after = max(1, int(math.ceil(retry_after)))
+            memory_scheduler.release(job_id)
+            return {
+                'error': 'Server is busy, retry later',
+                'estimated_seconds': round(estimated_cost, 1),
+                'retry_after': retry_after
+            }, 503, retry_after
+
+        active_jobs[job_id] = (now, estimated_cost)
+    ACTIVE_JOBS.inc()
+    return None
+
+# Helper function to admit a job for a request.
+# Returns None when the job was admitted, otherwise the error response to send.
+def admit_job(job_id, estimated_cost, estimated_memory=0, cancel=None):
+    rejection = reserve_job(job_id, estimated_cost, estimated_memory, cancel)
+    if rejection is None:
+        return None
+    body, status, retry_after = rejection
+    if retry_after is None:
+        return jsonify(body), status
+    return jsonify(body), status, {'Retry-After': str(retry_after)}
+
+# Helper function to release the budgets held by a job
+def finish_job(job_id):
+    with active_jobs_lock:
+        finished = active_jobs.pop(job_id, None)
+    if finished is not None:
+        ACTIVE_JOBS.dec()
+    memory_scheduler.release(job_id)
+
+# Helper function to read the optional job_id and timeout (seconds) of a request.
+# A client that picks its own job_id can cancel the job with DELETE /api/jobs/<job_id>.
+def parse_job_options(values, default_id):
+    job_id = str(values.get('job_id') or default_id)
+    if not JOB_ID_PATTERN.match(job_id):
+        raise ValueError('job_id must be 1 to 64 letters, digits, "-" or "_"')
+    
+    timeout = values.get('timeout')
+    if timeout is None or timeout == '':
+        return job_id, JOB_TIMEOUT_SECONDS or None
+    timeout = float(timeout)
+    if not timeout > 0:
+        raise ValueError('timeout must be a positive number of seconds')
+    return job_id, min(timeout, JOB_TIMEOUT_SECONDS) if JOB_TIMEOUT_SECONDS else timeout
+
+# Helper function to find the connection of the current request, if the server exposes it
+def client_socket():
+    return request.environ.get('gunicorn.socket') or request.environ.get('werkzeug.socket')
+
+# Helper function to tell whether the client closed its connection.
+# A closed connection reads as end of file; data it sent meanwhile means it is still open.
+def client_disconnected(sock):
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b''
+    except (ValueError, OSError):
+        return True
+
+def watch_client(sock, cancel, stop):
+    """Cancel a job once its client has gone away"""
+    while not stop.wait(DISCONNECT_POLL_SECONDS):
+        if client_disconnected(sock):
+            cancel.cancel('client disconnected')
+            return
+
+# Helper function to create the cancel token of a job and register it, so it
+# can be cancelled by DELETE /api/jobs/<job_id> or a client disconnect.
+# Must be called while handling the job's request.
+def watch_job(job_id, workspace, timeout):
+    cancel = CancelToken(timeout, os.path.join(workspace, CANCEL_MARKER))
+    stop = threading.Event()
+    with running_jobs_lock:
+        running_jobs[job_id] = (cancel, stop)
+    
+    sock = client_socket() if CANCEL_ON_DISCONNECT else None
+    if sock is not None:
+        threading.Thread(target=watch_client, args=(sock, cancel, stop), daemon=True).start()
+    return cancel
+
+# Helper function to unregister a finished job's cancel token
+def unwatch_job(job_id):
+    with running_jobs_lock:
+        watched = running_jobs.pop(job_id, None)
+    if watched is not None:
+        watched[1].set()
+
+# Helper function to answer a request whose job was stopped: 504 when it ran
+# out of time, otherwise 499 (client closed request, as nginx logs it)
+def cancelled_response(job_id, error):
+    JOBS_CANCELLED.labels(reason=error.reason).inc()
+    print(f"Job {job_id} stopped: {error.reason}")
+    return jsonify({'error': str(error), 'job_id': job_id}), 504 if error.timed_out else 499
+
+# Helper function to read the optional max_seconds of a request: the time the
+# whole request may take before quality is lowered to keep it (None for no limit)
+def parse_max_seconds(value):
+    if value is None or value == '':
+        return None
+    max_seconds = float(value)
+    if not max_seconds > 0:
+        raise ValueError('max_seconds must be a positive number of seconds')
+    return max_seconds
+
+# Helper function to create the quality controller of one effect step. The time
+# left until deadline is split over the remaining steps by their estimated cost.
+def step_quality(deadline, effect_names, steps=1):
+    if deadline is None:
+        return None
+    now = time.monotonic()
+    costs = [step_cost(effect_name) for effect_name in effect_names]
+    return QualityController(now + max(0.0, deadline - now) * sum(costs[:steps]) / sum(costs))
+
+# Helper function to describe the quality a job ended with, for the response
+def describe_quality(max_seconds, steps):
+    reports = [dict(quality.report(), effect=effect_name) for effect_name, quality in steps]
+    return {
+        'max_seconds': max_seconds,
+        'adapted': any(report['adapted_at_frame'] is not None for report in reports),
+        'steps': reports
+    }
+
+# Helper function to read the optional render seed of a request.
+# Without one a random seed is picked and reported back, so any result can be reproduced.
+def parse_seed(value):
+    if value is None or value == '':
+        return int.from_bytes(os.urandom(4), 'big')
+    seed = int(value)
+    if seed < 0:
+        raise ValueError('seed must be a non-negative integer')
+    return seed
+
+# Helper function to read the optional target_fps parameter (None keeps the source rate)
+def parse_target_fps(value):
+    if value is None or value == '':
+        return None
+    target_fps = float(value)
+    if not target_fps >= 1:
+        raise ValueError('target_fps must be at least 1')
+    return target_fps
+
+# Helper function to group the effects of a chain from first_step on into runs
+# rendered in one pass each: consecutive pointwise effects form one run, every
+# other effect a run of its own. Returns (first step, effects) per run.
+def chain_runs(chain, first_step=0):
+    runs = []
+    for i in range(first_step, len(chain)):
+        if runs and is_pointwise(chain[i][0]) and is_pointwise(runs[-1][1][-1][0]):
+            runs[-1][1].append(chain[i])
+        else:
+            runs.append((i, [chain[i]]))
+    return runs
+
+# Helper function to apply a chain of (effect name, intensity) steps inside a workspace.
+# Consecutive pointwise effects are rendered in one pass (see chain_runs). Each
+# run writes <prefix>_<i>.mp4, i being its first step, and the previous
+# intermediate file is deleted.
+# With target_fps the first run drops frames and later runs see the reduced rate.
+# A resumable chain records the finished steps in <prefix>_progress.json and
+# checkpoints the running step, so a rerun in the same workspace continues
+# where the last one stopped. With a deadline (time.monotonic() value) each run
+# gets a QualityController, appended to qualities as (effect names joined with
+# "+", controller).
+def run_effect_chain(input_path, workspace, chain, seed, prefix='step', target_fps=None, cancel=None,
+                     resumable=False, deadline=None, qualities=None, encoder=None):
+    current_file = input_path
+    first_step = 0
+    if resumable:
+        progress_path = os.path.join(workspace, f"{prefix}_progress.json")
+        fingerprint = job_fingerprint(chain=chain, seed=seed, target_fps=target_fps,
+                                      input=file_fingerprint(input_path))
+        progress = read_manifest(progress_path)
+        if (progress is not None and progress['fingerprint'] == fingerprint and
+                os.path.exists(os.path.join(workspace, progress['output']))):
+            first_step, current_file = progress['steps'], os.path.join(workspace, progress['output'])
+            print(f"Resuming effect chain at step {first_step + 1} of {len(chain)}")
+    # Every step seed derives from the same seed, so draw one now if none was given
+    seed = chain_seed(seed)
+    
+    for i, run in chain_runs(chain, first_step):
+        temp_output = os.path.join(workspace, f"{prefix}_{i}.mp4")
+        checkpoint_dir = os.path.join(workspace, f"{prefix}_{i}_checkpoint") if resumable else None
+        quality = step_quality(deadline, [name for name, _ in chain[i:]], len(run))
+        if quality is not None and qualities is not None:
+            qualities.append(('+'.join(name for name, _ in run), quality))
+        check_cancel(cancel)
+        
+        # Apply the current effect, or several pointwise effects in one pass
+        if len(run) > 1:
+            apply_fused_by_name(run, current_file, temp_output, seed, i, target_fps, cancel=cancel,
+                                checkpoint_dir=checkpoint_dir, quality=quality, encoder=encoder)
+        else:
+            effect_name, intensity = run[0]
+            apply_effect_by_name(effect_name, current_file, temp_output, intensity, step_seed(seed, i), target_fps,
+                                 cancel=cancel, checkpoint_dir=checkpoint_dir, quality=quality, encoder=encoder)
+        if resumable:
+            write_manifest(progress_path, {'fingerprint': fingerprint, 'steps': i + len(run),
+                                           'output': os.path.basename(temp_output)})
+            shutil.rmtree(checkpoint_dir, ignore_errors=True)
+        
+        # Cleanup previous step if not the original
+        if current_file != input_path:
+            safe_delete(current_file)
+            
+        current_file = temp_output
+    return current_file
+
+# Helper function to read the effects of a chain request, as "name",
+# "name:intensity" or {"name": ..., "intensity": ...}
+def parse_effect_chain(effects):
+    return [parse_effect(effect_data) for effect_data in effects]
+
+# Helper function to read the optional start/end or ranges parameters of a request
+def parse_request_ranges(values):
+    return parse_time_ranges(values.get('start'), values.get('end'), values.get('ranges'))
+
+# Helper function to apply an effect chain only within time ranges of a video.
+# The keyframe-aligned spans around the ranges are decoded, processed and
+# encoded; everything else is copied as it is.
+def render_on_ranges(input_path, output_path, workspace, chain, single, seed, ranges, cancel=None, encoder=None):
+    render_span = lambda span_input, span_output, effect_ranges: apply_fanout_by_name(
+        span_input, [(span_output, chain, single, seed)], audio=False, effect_ranges=effect_ranges, cancel=cancel,
+        encoder=encoder)
+    if not render_time_ranges(input_path, output_path, ranges, render_span, workspace, encoder):
+        # The input can't be cut without re-encoding, so process every frame
+        # but apply the effects only inside the ranges
+        apply_fanout_by_name(input_path, [(output_path, chain, single, seed)], effect_ranges=ranges, cancel=cancel,
+                             encoder=encoder)
+
+# Helper function to find the first effect name the registry doesn't know
+def find_unknown_effect(effect_names):
+    for effect_name in effect_names:
+        if get_effect(effect_name) is None:
+            return effect_name
+    return None
+
+@app.before_request
+def start_request_timer():
+    """Remember when the request started for the latency metrics"""
+    g.request_start = time.perf_counter()
+    # Start the cleanup thread lazily so it also runs in forked gunicorn workers
+    janitor.ensure_running()
+
+@app.after_request
+def record_request_metrics(response):
+    """Record request latency and status per endpoint"""
+    start = getattr(g, 'request_start', None)
+    if start is not None:
+        record_request(request.endpoint or 'unknown', request.method, response.status_code,
+                       time.perf_counter() - start)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Expose Prometheus metrics for every worker on this host"""
+    body, content_type = render_metrics()
+    return body, 200, {'Content-Type': content_type}
+
 @app.route('/')
 def index():
     """Serve the main page"""
@@ -83,138 +567,185 @@ def index():
 @app.route('/api/effects', methods=['GET'])
 def list_effects():
     """List all available video effects"""
-    effects = {
-        "vhs": "VHS glitch overlay effect",
-        "crt": "CRT scan lines effect",
-        "film_grain": "8mm film grain overlay",
-        "old_movie": "Old movie projector effect",
-        "light_leak": "Vintage light leak effect",
-        "sepia": "Sepia tone effect",
-        "glitch": "Digital glitch effect",
-        "vintage_color": "Vintage color grading"
-    }
-    return jsonify(effects)
+    details = request.args.get('details', '').lower() in ('1', 'true', 'yes')
+    return jsonify(describe_effects(details))
 
 @app.route('/api/apply-effect', methods=['POST'])
 def apply_effect():
     """Apply selected effect to uploaded video"""
-    # Clean previous output files when a new process starts
-    clean_previous_outputs()
-    
     if 'video' not in request.files:
         return jsonify({'error': 'No video file provided'}), 400
     
     video_file = request.files['video']
     effect_name = request.form.get('effect', 'vhs')
     intensity = float(request.form.get('intensity', 0.5))
+    try:
+        seed = parse_seed(request.form.get('seed'))
+    except ValueError:
+        return jsonify({'error': 'seed must be a non-negative integer'}), 400
+    try:
+        ranges = parse_request_ranges(request.form)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Invalid time range: {str(e)}'}), 400
+    try:
+        target_fps = parse_target_fps(request.form.get('target_fps'))
+    except ValueError:
+        return jsonify({'error': 'target_fps must be a number of at least 1'}), 400
+    if ranges and target_fps:
+        return jsonify({'error': 'target_fps cannot be combined with time ranges'}), 400
+    try:
+        encoder = encoder_name(request.form.get('encoder'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        job_id, timeout = parse_job_options(request.form, os.urandom(8).hex())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    resumable = bool(request.form.get('job_id'))
+    
+    if get_effect(effect_name) is None:
+        return jsonify({'error': f'Unknown effect: {effect_name}'}), 400
     
-    # Save uploaded video temporarily
-    temp_input = os.path.join(UPLOAD_FOLDER, f"input_{os.urandom(8).hex()}.mp4")
-    video_file.save(temp_input)
+    # Save uploaded video in the job's workspace
+    workspace = open_workspace(job_id)
+    if workspace is None:
+        return jsonify({'error': f'Job {job_id} is already running'}), 409
+    cancel = watch_job(job_id, workspace, timeout)
+    temp_input = os.path.join(workspace, "input.mp4")
     
     # Output path
-    temp_output = os.path.join(UPLOAD_FOLDER, f"output_{os.urandom(8).hex()}.mp4")
-    
-    # Apply the requested effect
-    try:
-        if effect_name == 'vhs':
-            apply_vhs_effect(temp_input, temp_output, intensity)
-        elif effect_name == 'crt':
-            apply_crt_scanlines(temp_input, temp_output, intensity)
-        elif effect_name == 'film_grain':
-            apply_film_grain(temp_input, temp_output, intensity)
-        elif effect_name == 'old_movie':
-            apply_old_movie(temp_input, temp_output, intensity)
-        elif effect_name == 'light_leak':
-            apply_light_leak(temp_input, temp_output, intensity)
-        elif effect_name == 'sepia':
-            apply_sepia(temp_input, temp_output, intensity)
-        elif effect_name == 'glitch':
-            apply_glitch(temp_input, temp_output, intensity)
-        elif effect_name == 'vintage_color':
-            apply_vintage_color(temp_input, temp_output, intensity)
+    temp_output = os.path.join(workspace, "output.mp4")
+    
+    done = False
+    try:
+        video_file.save(temp_input)
+        
+        # Check the job fits the budget before doing any work
+        rejection = admit_job(job_id, estimate_video_cost(temp_input, [effect_name], ranges, target_fps),
+                              estimate_video_memory(temp_input, [[effect_name]]), cancel)
+        if rejection is not None:
+            return rejection
+        
+        # Apply the requested effect, to the whole video or only within the requested ranges
+        if ranges:
+            render_on_ranges(temp_input, temp_output, workspace, ((effect_name, intensity),), True, seed, ranges,
+                             cancel, encoder)
         else:
-            return jsonify({'error': f'Unknown effect: {effect_name}'}), 400
+            # With a client job_id a retry after a worker crash resumes from the checkpoints
+            checkpoint_dir = os.path.join(workspace, 'checkpoint') if resumable else None
+            apply_effect_by_name(effect_name, temp_input, temp_output, intensity, seed, target_fps, cancel=cancel,
+                                 checkpoint_dir=checkpoint_dir, encoder=encoder)
         
         # Return the processed video
-        return send_file(temp_output, as_attachment=True, 
-                         download_name=f"{effect_name}_video.mp4", 
-                         mimetype='video/mp4')
+        done = True
+        response = send_workspace_file(workspace, temp_output, f"{effect_name}_video.mp4")
+        response.headers['X-Seed'] = str(seed)
+        response.headers['X-Encoder'] = encoder
+        return response
+    
+    except JobCancelled as e:
+        done = cancelled_on_purpose(e)
+        return cancelled_response(job_id, e)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
     finally:
-        # Clean up temp files - use safe delete to avoid errors
-        safe_delete(temp_input)
-        # We don't remove output here because it's being sent
+        finish_job(job_id)
+        unwatch_job(job_id)
+        # Clean up the input and any intermediate files, unless a retry can resume from them
+        close_workspace(workspace, keep=resumable and not done)
 
 @app.route('/api/combine-effects', methods=['POST'])
 def combine_effects():
     """Apply multiple effects in sequence"""
-    # Clean previous output files when a new process starts
-    clean_previous_outputs()
-    
     if 'video' not in request.files:
         return jsonify({'error': 'No video file provided'}), 400
     
     video_file = request.files['video']
     effects = request.form.getlist('effects')
+    try:
+        seed = parse_seed(request.form.get('seed'))
+    except ValueError:
+        return jsonify({'error': 'seed must be a non-negative integer'}), 400
+    try:
+        ranges = parse_request_ranges(request.form)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Invalid time range: {str(e)}'}), 400
+    try:
+        target_fps = parse_target_fps(request.form.get('target_fps'))
+    except ValueError:
+        return jsonify({'error': 'target_fps must be a number of at least 1'}), 400
+    if ranges and target_fps:
+        return jsonify({'error': 'target_fps cannot be combined with time ranges'}), 400
+    try:
+        encoder = encoder_name(request.form.get('encoder'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        job_id, timeout = parse_job_options(request.form, os.urandom(8).hex())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    resumable = bool(request.form.get('job_id'))
     
     if not effects:
         return jsonify({'error': 'No effects specified'}), 400
     
-    # Save uploaded video temporarily
-    temp_input = os.path.join(UPLOAD_FOLDER, f"input_{os.urandom(8).hex()}.mp4")
-    video_file.save(temp_input)
+    try:
+        chain = parse_effect_chain(effects)
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({'error': f'Invalid effect: {str(e)}'}), 400
+    unknown = find_unknown_effect(effect_name for effect_name, _ in chain)
+    if unknown is not None:
+        return jsonify({'error': f'Unknown effect: {unknown}'}), 400
     
-    current_file = temp_input
+    # Save uploaded video in the job's workspace
+    workspace = open_workspace(job_id)
+    if workspace is None:
+        return jsonify({'error': f'Job {job_id} is already running'}), 409
+    cancel = watch_job(job_id, workspace, timeout)
+    temp_input = os.path.join(workspace, "input.mp4")
     
+    done = False
     try:
-        for i, effect in enumerate(effects):
-            effect_name, intensity = effect.split(':') if ':' in effect else (effect, 0.5)
-            intensity = float(intensity)
-            
-            temp_output = os.path.join(UPLOAD_FOLDER, f"step_{i}_{os.urandom(8).hex()}.mp4")
-            
-            # Apply the current effect
-            if effect_name == 'vhs':
-                apply_vhs_effect(current_file, temp_output, intensity)
-            elif effect_name == 'crt':
-                apply_crt_scanlines(current_file, temp_output, intensity)
-            elif effect_name == 'film_grain':
-                apply_film_grain(current_file, temp_output, intensity)
-            elif effect_name == 'old_movie':
-                apply_old_movie(current_file, temp_output, intensity)
-            elif effect_name == 'light_leak':
-                apply_light_leak(current_file, temp_output, intensity)
-            elif effect_name == 'sepia':
-                apply_sepia(current_file, temp_output, intensity)
-            elif effect_name == 'glitch':
-                apply_glitch(current_file, temp_output, intensity)
-            elif effect_name == 'vintage_color':
-                apply_vintage_color(current_file, temp_output, intensity)
-            else:
-                return jsonify({'error': f'Unknown effect: {effect_name}'}), 400
-            
-            # Cleanup previous step if not the original
-            if current_file != temp_input:
-                safe_delete(current_file)
-                
-            current_file = temp_output
+        video_file.save(temp_input)
+        
+        # Check the job fits the budget before doing any work
+        effect_names = [effect_name for effect_name, _ in chain]
+        rejection = admit_job(job_id, estimate_video_cost(temp_input, effect_names, ranges, target_fps),
+                              estimate_video_memory(temp_input, [effect_names]), cancel)
+        if rejection is not None:
+            return rejection
+        
+        # Process each effect in sequence, or all of them within the requested ranges
+        if ranges:
+            current_file = os.path.join(workspace, "output.mp4")
+            render_on_ranges(temp_input, current_file, workspace, tuple(chain), False, seed, ranges, cancel,
+                             encoder)
+        else:
+            # With a client job_id a retry after a worker crash resumes from the checkpoints
+            current_file = run_effect_chain(temp_input, workspace, chain, seed, target_fps=target_fps, cancel=cancel,
+                                            resumable=resumable, encoder=encoder)
         
         # Return the final processed video
-        return send_file(current_file, as_attachment=True, 
-                         download_name="combined_effects_video.mp4", 
-                         mimetype='video/mp4')
+        done = True
+        response = send_workspace_file(workspace, current_file, "combined_effects_video.mp4")
+        response.headers['X-Seed'] = str(seed)
+        response.headers['X-Encoder'] = encoder
+        return response
+    
+    except JobCancelled as e:
+        done = cancelled_on_purpose(e)
+        return cancelled_response(job_id, e)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
     finally:
-        # Clean up the original temp file
-        safe_delete(temp_input)
-        # Other temp files are cleaned up during processing
+        finish_job(job_id)
+        unwatch_job(job_id)
+        # Clean up the input and any intermediate files, unless a retry can resume from them
+        close_workspace(workspace, keep=resumable and not done)
 
 # New API endpoints that work with URLs instead of file uploads
 @app.route('/api/url/apply-effect', methods=['POST'])
@@ -227,61 +758,109 @@ def apply_effect_url():
     video_url = data.get('video_url')
     effect_name = data.get('effect', 'vhs')
     intensity = float(data.get('intensity', 0.5))
+    try:
+        seed = parse_seed(data.get('seed'))
+    except ValueError:
+        return jsonify({'error': 'seed must be a non-negative integer'}), 400
+    try:
+        ranges = parse_request_ranges(data)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Invalid time range: {str(e)}'}), 400
+    try:
+        target_fps = parse_target_fps(data.get('target_fps'))
+    except ValueError:
+        return jsonify({'error': 'target_fps must be a number of at least 1'}), 400
+    if ranges and target_fps:
+        return jsonify({'error': 'target_fps cannot be combined with time ranges'}), 400
+    try:
+        encoder = encoder_name(data.get('encoder'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        max_seconds = parse_max_seconds(data.get('max_seconds'))
+    except ValueError:
+        return jsonify({'error': 'max_seconds must be a positive number of seconds'}), 400
+    if ranges and max_seconds:
+        return jsonify({'error': 'max_seconds cannot be combined with time ranges'}), 400
+    # The time budget counts from the request, so it includes the download
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    try:
+        video_id, timeout = parse_job_options(data, str(uuid.uuid4()))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    resumable = bool(data.get('job_id'))
+    
+    if get_effect(effect_name) is None:
+        return jsonify({'error': f'Unknown effect: {effect_name}'}), 400
     
-    # Create unique filenames
-    video_id = str(uuid.uuid4())
-    temp_input = os.path.join(UPLOAD_FOLDER, f"input_{video_id}.mp4")
+    # Create unique filenames inside the job's workspace
+    workspace = open_workspace(video_id)
+    if workspace is None:
+        return jsonify({'error': f'Job {video_id} is already running'}), 409
+    cancel = watch_job(video_id, workspace, timeout)
+    temp_input = os.path.join(workspace, "input.mp4")
     
     # Generate a recognizable output filename
-    output_filename = f"{effect_name}_{video_id}.mp4"
-    temp_output = os.path.join(UPLOAD_FOLDER, output_filename)
+    output_filename = f"{effect_name}_{uuid.uuid4()}.mp4"
+    temp_output = os.path.join(workspace, output_filename)
     final_output = os.path.join(OUTPUT_FOLDER, output_filename)
     
+    done = False
     try:
         # Download the video
-        if not download_video(video_url, temp_input):
+        if not download_video(video_url, temp_input, cancel):
             return jsonify({'error': 'Failed to download video from URL'}), 400
         
-        # Apply the requested effect
-        if effect_name == 'vhs':
-            apply_vhs_effect(temp_input, temp_output, intensity)
-        elif effect_name == 'crt':
-            apply_crt_scanlines(temp_input, temp_output, intensity)
-        elif effect_name == 'film_grain':
-            apply_film_grain(temp_input, temp_output, intensity)
-        elif effect_name == 'old_movie':
-            apply_old_movie(temp_input, temp_output, intensity)
-        elif effect_name == 'light_leak':
-            apply_light_leak(temp_input, temp_output, intensity)
-        elif effect_name == 'sepia':
-            apply_sepia(temp_input, temp_output, intensity)
-        elif effect_name == 'glitch':
-            apply_glitch(temp_input, temp_output, intensity)
-        elif effect_name == 'vintage_color':
-            apply_vintage_color(temp_input, temp_output, intensity)
+        # Check the job fits the budget before doing any work
+        rejection = admit_job(video_id, estimate_video_cost(temp_input, [effect_name], ranges, target_fps),
+                              estimate_video_memory(temp_input, [[effect_name]]), cancel)
+        if rejection is not None:
+            return rejection
+        
+        # Apply the requested effect, to the whole video or only within the requested ranges
+        if ranges:
+            render_on_ranges(temp_input, temp_output, workspace, ((effect_name, intensity),), True, seed, ranges,
+                             cancel, encoder)
         else:
-            return jsonify({'error': f'Unknown effect: {effect_name}'}), 400
+            # With a client job_id a retry after a worker crash resumes from the checkpoints
+            checkpoint_dir = os.path.join(workspace, 'checkpoint') if resumable else None
+            quality = step_quality(deadline, [effect_name])
+            apply_effect_by_name(effect_name, temp_input, temp_output, intensity, seed, target_fps, cancel=cancel,
+                                 checkpoint_dir=checkpoint_dir, quality=quality, encoder=encoder)
         
         # Move the output to the served directory
         shutil.copy2(temp_output, final_output)
+        janitor.track(final_output)
         
         # Generate a publicly accessible URL
         output_url = f"{SERVER_BASE_URL}/videos/{output_filename}"
         
-        return jsonify({
+        response = {
             'success': True,
             'video_url': output_url,
             'effect': effect_name,
-            'intensity': intensity
-        })
+            'intensity': intensity,
+            'seed': seed,
+            'target_fps': target_fps,
+            'encoder': encoder
+        }
+        if max_seconds:
+            response['quality'] = describe_quality(max_seconds, [(effect_name, quality)])
+        done = True
+        return jsonify(response)
+    
+    except JobCancelled as e:
+        done = cancelled_on_purpose(e)
+        return cancelled_response(video_id, e)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
     finally:
-        # Clean up temp files
-        safe_delete(temp_input)
-        safe_delete(temp_output)
+        finish_job(video_id)
+        unwatch_job(video_id)
+        # Clean up the input and any intermediate files, unless a retry can resume from them
+        close_workspace(workspace, keep=resumable and not done)
 
 @app.route('/api/url/combine-effects', methods=['POST'])
 def combine_effects_url():
@@ -292,116 +871,439 @@ def combine_effects_url():
     
     video_url = data.get('video_url')
     effects = data.get('effects', [])
+    try:
+        seed = parse_seed(data.get('seed'))
+    except ValueError:
+        return jsonify({'error': 'seed must be a non-negative integer'}), 400
+    try:
+        ranges = parse_request_ranges(data)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Invalid time range: {str(e)}'}), 400
+    try:
+        target_fps = parse_target_fps(data.get('target_fps'))
+    except ValueError:
+        return jsonify({'error': 'target_fps must be a number of at least 1'}), 400
+    if ranges and target_fps:
+        return jsonify({'error': 'target_fps cannot be combined with time ranges'}), 400
+    try:
+        encoder = encoder_name(data.get('encoder'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        max_seconds = parse_max_seconds(data.get('max_seconds'))
+    except ValueError:
+        return jsonify({'error': 'max_seconds must be a positive number of seconds'}), 400
+    if ranges and max_seconds:
+        return jsonify({'error': 'max_seconds cannot be combined with time ranges'}), 400
+    # The time budget counts from the request, so it includes the download
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    try:
+        video_id, timeout = parse_job_options(data, str(uuid.uuid4()))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    resumable = bool(data.get('job_id'))
     
     if not effects:
         return jsonify({'error': 'No effects specified'}), 400
     
-    # Create unique filenames
-    video_id = str(uuid.uuid4())
-    temp_input = os.path.join(UPLOAD_FOLDER, f"input_{video_id}.mp4")
+    # Handle both string format and dictionary format
+    try:
+        chain = parse_effect_chain(effects)
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({'error': f'Invalid effect: {str(e)}'}), 400
+    unknown = find_unknown_effect(effect_name for effect_name, _ in chain)
+    if unknown is not None:
+        return jsonify({'error': f'Unknown effect: {unknown}'}), 400
+    
+    # Create unique filenames inside the job's workspace
+    workspace = open_workspace(video_id)
+    if workspace is None:
+        return jsonify({'error': f'Job {video_id} is already running'}), 409
+    cancel = watch_job(video_id, workspace, timeout)
+    temp_input = os.path.join(workspace, "input.mp4")
     
     # Generate a recognizable output filename
-    output_filename = f"combined_{video_id}.mp4"
+    output_filename = f"combined_{uuid.uuid4()}.mp4"
     final_output = os.path.join(OUTPUT_FOLDER, output_filename)
     
+    done = False
     try:
         # Download the video
-        if not download_video(video_url, temp_input):
+        if not download_video(video_url, temp_input, cancel):
             return jsonify({'error': 'Failed to download video from URL'}), 400
         
-        current_file = temp_input
+        # Check the job fits the budget before doing any work
+        effect_names = [effect_name for effect_name, _ in chain]
+        rejection = admit_job(video_id, estimate_video_cost(temp_input, effect_names, ranges, target_fps),
+                              estimate_video_memory(temp_input, [effect_names]), cancel)
+        if rejection is not None:
+            return rejection
         
-        # Process each effect in sequence
-        for i, effect_data in enumerate(effects):
-            # Handle both string format and dictionary format
-            if isinstance(effect_data, str):
-                effect_name, intensity = effect_data.split(':') if ':' in effect_data else (effect_data, 0.5)
-                intensity = float(intensity)
-            else:
-                effect_name = effect_data.get('name', 'vhs')
-                intensity = float(effect_data.get('intensity', 0.5))
-            
-            temp_output = os.path.join(UPLOAD_FOLDER, f"step_{i}_{video_id}.mp4")
-            
-            # Apply the current effect
-            if effect_name == 'vhs':
-                apply_vhs_effect(current_file, temp_output, intensity)
-            elif effect_name == 'crt':
-                apply_crt_scanlines(current_file, temp_output, intensity)
-            elif effect_name == 'film_grain':
-                apply_film_grain(current_file, temp_output, intensity)
-            elif effect_name == 'old_movie':
-                apply_old_movie(current_file, temp_output, intensity)
-            elif effect_name == 'light_leak':
-                apply_light_leak(current_file, temp_output, intensity)
-            elif effect_name == 'sepia':
-                apply_sepia(current_file, temp_output, intensity)
-            elif effect_name == 'glitch':
-                apply_glitch(current_file, temp_output, intensity)
-            elif effect_name == 'vintage_color':
-                apply_vintage_color(current_file, temp_output, intensity)
-            else:
-                return jsonify({'error': f'Unknown effect: {effect_name}'}), 400
-            
-            # Cleanup previous step if not the original
-            if current_file != temp_input:
-                safe_delete(current_file)
-                
-            current_file = temp_output
+        # Process each effect in sequence, or all of them within the requested ranges
+        qualities = []
+        if ranges:
+            current_file = os.path.join(workspace, "output.mp4")
+            render_on_ranges(temp_input, current_file, workspace, tuple(chain), False, seed, ranges, cancel,
+                             encoder)
+        else:
+            # With a client job_id a retry after a worker crash resumes from the checkpoints
+            current_file = run_effect_chain(temp_input, workspace, chain, seed, target_fps=target_fps, cancel=cancel,
+                                            resumable=resumable, deadline=deadline, qualities=qualities,
+                                            encoder=encoder)
         
         # Move the final output to the served directory
         shutil.copy2(current_file, final_output)
+        janitor.track(final_output)
         
         # Generate a publicly accessible URL
         output_url = f"{SERVER_BASE_URL}/videos/{output_filename}"
         
-        return jsonify({
+        response = {
             'success': True,
             'video_url': output_url,
-            'effects': effects
+            'effects': effects,
+            'seed': seed,
+            'target_fps': target_fps,
+            'encoder': encoder
+        }
+        if max_seconds:
+            response['quality'] = describe_quality(max_seconds, qualities)
+        done = True
+        return jsonify(response)
+    
+    except JobCancelled as e:
+        done = cancelled_on_purpose(e)
+        return cancelled_response(video_id, e)
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    finally:
+        finish_job(video_id)
+        unwatch_job(video_id)
+        # Clean up the input and any intermediate files, unless a retry can resume from them
+        close_workspace(workspace, keep=resumable and not done)
+
+# Helper function to read the effects of one requested output: a single
+# effect/intensity pair, or an effects chain as for /api/url/combine-effects
+def parse_output_effects(spec):
+    if 'effects' in spec:
+        if not spec['effects']:
+            raise ValueError('No effects specified')
+        try:
+            chain = parse_effect_chain(spec['effects'])
+        except (ValueError, TypeError, AttributeError) as e:
+            raise ValueError(f'Invalid effect: {str(e)}')
+        single = False
+    else:
+        chain = [(spec.get('effect', 'vhs'), float(spec.get('intensity', 0.5)))]
+        single = True
+    
+    unknown = find_unknown_effect(effect_name for effect_name, _ in chain)
+    if unknown is not None:
+        raise ValueError(f'Unknown effect: {unknown}')
+    return tuple(chain), single
+
+# Helper function to describe a rendered output in a response
+def describe_output(chain, single, output_filename):
+    description = {'video_url': f"{SERVER_BASE_URL}/videos/{output_filename}"}
+    if single:
+        description['effect'], description['intensity'] = chain[0]
+    else:
+        description['effects'] = [{'name': effect_name, 'intensity': intensity} for effect_name, intensity in chain]
+    return description
+
+# Helper function to render several outputs of one source from a single decode
+# and move them to the served directory. outputs is a list of (chain, single, seed).
+def render_outputs(source_path, workspace, outputs, cancel=None, encoder=None):
+    rendered = []
+    for i, (chain, single, seed) in enumerate(outputs):
+        name = chain[0][0] if single else 'combined'
+        rendered.append((os.path.join(workspace, f"output_{i}.mp4"), f"{name}_{uuid.uuid4()}.mp4"))
+    
+    apply_fanout_by_name(source_path, [(output_file, chain, single, seed)
+                                       for (output_file, _), (chain, single, seed) in zip(rendered, outputs)],
+                         cancel=cancel, encoder=encoder)
+    
+    for output_file, output_filename in rendered:
+        shutil.copy2(output_file, os.path.join(OUTPUT_FOLDER, output_filename))
+        janitor.track(os.path.join(OUTPUT_FOLDER, output_filename))
+        safe_delete(output_file)
+    return [output_filename for _, output_filename in rendered]
+
+@app.route('/api/url/fan-out', methods=['POST'])
+def fan_out_url():
+    """Render several looks of one video URL from a single decode and return a URL for each"""
+    data = request.json
+    if not data or 'video_url' not in data:
+        return jsonify({'error': 'No video URL provided in JSON body'}), 400
+    
+    specs = data.get('outputs', [])
+    if not isinstance(specs, list) or not specs:
+        return jsonify({'error': 'No outputs specified'}), 400
+    if len(specs) > MAX_FANOUT_OUTPUTS:
+        return jsonify({'error': f'Too many outputs, the limit is {MAX_FANOUT_OUTPUTS}'}), 400
+    
+    try:
+        seed = parse_seed(data.get('seed'))
+    except ValueError:
+        return jsonify({'error': 'seed must be a non-negative integer'}), 400
+    try:
+        encoder = encoder_name(data.get('encoder'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        video_id, timeout = parse_job_options(data, str(uuid.uuid4()))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        outputs = [parse_output_effects(spec) for spec in specs]
+    except (ValueError, TypeError, AttributeError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    workspace = open_workspace(video_id)
+    if workspace is None:
+        return jsonify({'error': f'Job {video_id} is already running'}), 409
+    cancel = watch_job(video_id, workspace, timeout)
+    temp_input = os.path.join(workspace, "input.mp4")
+    
+    try:
+        if not download_video(data['video_url'], temp_input, cancel):
+            return jsonify({'error': 'Failed to download video from URL'}), 400
+        
+        effect_names = [effect_name for chain, _ in outputs for effect_name, _ in chain]
+        rejection = admit_job(video_id, estimate_video_cost(temp_input, effect_names),
+                              estimate_video_memory(temp_input, [[effect_name for effect_name, _ in chain]
+                                                                 for chain, _ in outputs], fanout=True),
+                              cancel)
+        if rejection is not None:
+            return rejection
+        
+        # Every output uses the request's seed, so each renders what the
+        # matching apply-effect or combine-effects request would
+        output_filenames = render_outputs(temp_input, workspace, [(chain, single, seed) for chain, single in outputs],
+                                          cancel, encoder)
+        
+        return jsonify({
+            'success': True,
+            'outputs': [describe_output(chain, single, output_filename)
+                        for (chain, single), output_filename in zip(outputs, output_filenames)],
+            'seed': seed,
+            'encoder': encoder
         })
     
+    except JobCancelled as e:
+        return cancelled_response(video_id, e)
+    
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
     finally:
-        # Clean up temp files
-        safe_delete(temp_input)
-        # Clean up any intermediate files
-        for i in range(len(effects)):
-            safe_delete(os.path.join(UPLOAD_FOLDER, f"step_{i}_{video_id}.mp4"))
+        finish_job(video_id)
+        unwatch_job(video_id)
+        remove_workspace(workspace)
+
+# Helper function to validate one item of a batch request
+def parse_batch_item(item):
+    if not isinstance(item, dict) or not item.get('video_url'):
+        raise ValueError('Each item needs a video_url')
+    
+    # Items take the same fields as /api/url/apply-effect or /api/url/combine-effects
+    chain, single = parse_output_effects(item)
+    return {
+        'video_url': item['video_url'],
+        'chain': chain,
+        'single': single,
+        'seed': parse_seed(item.get('seed'))
+    }
+
+# Helper function to render batch items of one downloaded source from a single
+# decode; returns one result per item
+def process_batch_source(workspace, job_id, items, source_path, cancel=None, encoder=None):
+    effect_names = [effect_name for item in items for effect_name, _ in item['chain']]
+    chains = [[effect_name for effect_name, _ in item['chain']] for item in items]
+    rejection = reserve_job(job_id, estimate_video_cost(source_path, effect_names),
+                            estimate_video_memory(source_path, chains, fanout=True), cancel)
+    if rejection is not None:
+        body, status, retry_after = rejection
+        return [dict(body, success=False, status=status, retry_after=retry_after)] * len(items)
+    
+    source_workspace = os.path.join(workspace, f"render_{job_id}")
+    try:
+        os.makedirs(source_workspace, exist_ok=True)
+        output_filenames = render_outputs(source_path, source_workspace,
+                                          [(item['chain'], item['single'], item['seed']) for item in items],
+                                          cancel, encoder)
+        return [{
+            'success': True,
+            'video_url': f"{SERVER_BASE_URL}/videos/{output_filename}",
+            'seed': item['seed'],
+            'encoder': encoder
+        } for item, output_filename in zip(items, output_filenames)]
+    finally:
+        finish_job(job_id)
+        remove_workspace(source_workspace)
+
+@app.route('/api/url/batch', methods=['POST'])
+def batch_url():
+    """Process many video URLs concurrently, reporting each item as it finishes"""
+    data = request.json
+    if not data or not isinstance(data.get('items'), list) or not data['items']:
+        return jsonify({'error': 'No items provided in JSON body'}), 400
+    
+    items = data['items']
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({'error': f'Too many items, the limit is {MAX_BATCH_ITEMS}'}), 400
+    stream = data.get('stream', True)
+    try:
+        encoder = encoder_name(data.get('encoder'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        batch_id, timeout = parse_job_options(data, str(uuid.uuid4()))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    workspace = open_workspace(batch_id)
+    if workspace is None:
+        return jsonify({'error': f'Job {batch_id} is already running'}), 409
+    # One token covers the whole batch: a cancelled or timed out batch fails its unfinished items
+    cancel = watch_job(batch_id, workspace, timeout)
+    results = queue.Queue()
+    
+    # Identical items are processed once, and every source is downloaded and
+    # decoded once no matter how many items use it
+    groups = {}
+    for index, item in enumerate(items):
+        try:
+            parsed = parse_batch_item(item)
+        except (ValueError, TypeError, AttributeError) as e:
+            item_id = item.get('id') if isinstance(item, dict) else None
+            results.put({'index': index, 'id': item_id, 'success': False, 'error': str(e)})
+            continue
+        key = (parsed['video_url'], parsed['chain'], parsed['single'], parsed['seed'])
+        groups.setdefault(key, (parsed, []))[1].append(index)
+    
+    sources = {}
+    for key in groups:
+        sources.setdefault(key[0], []).append(key)
+    
+    download_pool = ThreadPoolExecutor(max_workers=BATCH_DOWNLOAD_WORKERS)
+    process_pool = ThreadPoolExecutor(max_workers=BATCH_PROCESS_WORKERS)
+    
+    def report(key, result):
+        for index in groups[key][1]:
+            item_id = items[index].get('id') if isinstance(items[index], dict) else None
+            results.put(dict(result, index=index, id=item_id))
+    
+    def run_source(source_index, video_url, download):
+        keys = sources[video_url]
+        # A fan-out renders at most MAX_FANOUT_OUTPUTS items, each one admitted
+        # on its own, and every chunk reuses the one download
+        for start in range(0, len(keys), MAX_FANOUT_OUTPUTS):
+            chunk = keys[start:start + MAX_FANOUT_OUTPUTS]
+            try:
+                results_for_keys = process_batch_source(workspace,
+                                                        f"{batch_id}_{source_index}_{start // MAX_FANOUT_OUTPUTS}",
+                                                        [groups[key][0] for key in chunk], download.result(), cancel,
+                                                        encoder)
+            except Exception as e:
+                results_for_keys = [{'success': False, 'error': str(e)}] * len(chunk)
+            for key, result in zip(chunk, results_for_keys):
+                report(key, result)
+    
+    def download_source(video_url, source_path):
+        if not download_video(video_url, source_path, cancel):
+            raise Exception('Failed to download video from URL')
+        return source_path
+    
+    for source_index, video_url in enumerate(sources):
+        source_path = os.path.join(workspace, f"source_{source_index}.mp4")
+        download = download_pool.submit(download_source, video_url, source_path)
+        # Every item of a source is rendered from one decode as soon as it is downloaded
+        download.add_done_callback(lambda future, source_index=source_index, video_url=video_url:
+                                   process_pool.submit(run_source, source_index, video_url, future))
+    
+    def generate():
+        succeeded = failed = 0
+        try:
+            for _ in range(len(items)):
+                result = results.get()
+                if result['success']:
+                    succeeded += 1
+                else:
+                    failed += 1
+                yield result
+        except GeneratorExit:
+            # The client went away: stop the running work too
+            cancel.cancel('client disconnected')
+            raise
+        finally:
+            # Stop waiting work if the client went away, then drop the sources
+            download_pool.shutdown(wait=True, cancel_futures=True)
+            process_pool.shutdown(wait=True, cancel_futures=True)
+            unwatch_job(batch_id)
+            remove_workspace(workspace)
+        
+        status = 'completed' if not failed else ('failed' if not succeeded else 'partial')
+        yield {'done': True, 'status': status, 'succeeded': succeeded, 'failed': failed}
+    
+    if not stream:
+        records = list(generate())
+        summary = records.pop()
+        return jsonify(dict(summary, results=sorted(records, key=lambda record: record['index'])))
+    
+    # One JSON object per line, as each item finishes, then the aggregate status
+    return app.response_class((json.dumps(record) + '\n' for record in generate()),
+                              mimetype='application/x-ndjson')
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a running job; it stops at its next frame and answers its own request with 499"""
+    if not JOB_ID_PATTERN.match(job_id):
+        return jsonify({'error': 'Invalid job_id'}), 400
+    
+    with running_jobs_lock:
+        watched = running_jobs.get(job_id)
+    if watched is not None:
+        watched[0].cancel()
+    
+    # The job may run in another worker process, which finds the marker in its workspace
+    try:
+        with open(os.path.join(WORKSPACE_ROOT, f"job_{job_id}", CANCEL_MARKER), 'w'):
+            pass
+    except FileNotFoundError:
+        if watched is None:
+            return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify({'job_id': job_id, 'status': 'cancelling'}), 202
 
 # Route to serve processed videos by URL
 @app.route('/videos/<filename>')
 def serve_video(filename):
-    """Serve a processed video file"""
-    video_path = os.path.join(OUTPUT_FOLDER, filename)
-    if not os.path.exists(video_path):
+    """Serve a processed video file, with byte ranges and conditional requests"""
+    video_path = safe_join(OUTPUT_FOLDER, filename)
+    if video_path is None or not os.path.isfile(video_path):
         return jsonify({'error': 'Video not found'}), 404
     
-    return send_file(video_path, mimetype='video/mp4')
-
-# Add a cleanup function to remove temporary files
-@app.after_request
-def cleanup_temp_files(response):
-    """Cleanup temporary files that might be left over"""
-    try:
-        # Find files older than 1 hour and delete them
-        current_time = time.time()
-        for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER]:
-            for filename in os.listdir(folder):
-                file_path = os.path.join(folder, filename)
-                # If the file is older than 1 hour (3600 seconds)
-                if os.path.isfile(file_path) and os.path.getmtime(file_path) < current_time - 3600:
-                    safe_delete(file_path)
-    except Exception as e:
-        # Don't fail if cleanup doesn't work
-        print(f"Error during cleanup: {str(e)}")
-    return response
+    janitor.touch(video_path)
+    
+    if VIDEO_OFFLOAD == 'x-accel':
+        # nginx serves the file itself, including Range, ETag and Last-Modified
+        response = app.response_class(mimetype='video/mp4')
+        response.headers['X-Accel-Redirect'] = X_ACCEL_PREFIX.rstrip('/') + '/' + quote(filename)
+        return response
+    
+    # Outputs never change once written, so clients may cache and resume them.
+    # With USE_X_SENDFILE set, send_file only emits the X-Sendfile header.
+    return send_file(os.path.abspath(video_path), mimetype='video/mp4',
+                     conditional=True, etag=True, max_age=FILE_MAX_AGE_SECONDS)
 
 if __name__ == '__main__':
-    # Clean up any existing output files on startup
-    clean_previous_outputs()
+    # Clean up any workspaces left over from a previous run on startup
+    clean_stale_workspaces()
     
     # Run the application on the specified port
     print(f"Starting server on {SERVER_HOST}:{SERVER_PORT}")
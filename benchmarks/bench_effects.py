@@ -0,0 +1,225 @@
+"""
+Per-effect throughput benchmark
+
+Generates synthetic videos in-process, runs every apply_* effect and a few common
+chains from Ventageeffect.py and SimplifiedVentageeffect.py on them, and reports
+ms/frame, fps, peak RSS and the share of time spent decoding/encoding as JSON.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_effects --resolutions 480p,720p --output results.json
+    python -m benchmarks.bench_effects --compare results.json --threshold 0.15
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import resource
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import PATTERNS, RESOLUTIONS, write_synthetic_video
+
+MODULES = ('Ventageeffect', 'SimplifiedVentageeffect')
+
+EFFECT_FUNCTIONS = (
+    'apply_vhs_effect',
+    'apply_crt_scanlines',
+    'apply_film_grain',
+    'apply_old_movie',
+    'apply_light_leak',
+    'apply_sepia',
+    'apply_glitch',
+    'apply_vintage_color'
+)
+
+# Common chains, as used in the README examples
+CHAINS = {
+    'retro_film': ('apply_film_grain', 'apply_old_movie', 'apply_light_leak'),
+    'tv': ('apply_vhs_effect', 'apply_crt_scanlines')
+}
+
+# Name of the null effect that only measures the decode/encode path
+PASSTHROUGH = 'passthrough'
+
+def _passthrough(module, input_path, output_path):
+    """Run a video through a module's decode/encode path without any effect"""
+    if module.__name__ == 'Ventageeffect':
+        module.process_video_frames(input_path, output_path, lambda frame: frame)
+        return
+
+    # SimplifiedVentageeffect has no generic frame hook, so mirror its I/O
+    from moviepy.editor import VideoFileClip, ImageSequenceClip
+    import numpy as np
+    clip = VideoFileClip(input_path)
+    frames = [clip.get_frame(t) for t in np.arange(0, clip.duration, 1 / clip.fps)]
+    processed_clip = ImageSequenceClip(frames, fps=clip.fps)
+    processed_clip.write_videofile(output_path, codec='libx264', logger=None)
+    clip.close()
+    processed_clip.close()
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return peak / 1024
+
+def _run_case(module_name, steps, input_path, results):
+    """Run one benchmark case in a fresh process so peak RSS is per case"""
+    # Keep the progress output of the encoders out of the JSON report
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+
+    import importlib
+    module = importlib.import_module(module_name)
+
+    workdir = tempfile.mkdtemp(prefix='bench_')
+    current = input_path
+    start = time.perf_counter()
+    for i, step in enumerate(steps):
+        output_path = os.path.join(workdir, f"step_{i}.mp4")
+        if step == PASSTHROUGH:
+            _passthrough(module, current, output_path)
+        else:
+            getattr(module, step)(current, output_path, 0.5)
+        current = output_path
+    elapsed = time.perf_counter() - start
+
+    for filename in os.listdir(workdir):
+        os.remove(os.path.join(workdir, filename))
+    os.rmdir(workdir)
+
+    results.put({'seconds': elapsed, 'peak_rss_mb': _peak_rss_mb()})
+
+def run_case(module_name, steps, input_path):
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=_run_case, args=(module_name, steps, input_path, results))
+    process.start()
+    try:
+        # Poll so a case that crashes doesn't hang the whole run
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    raise Exception(f"Benchmark case {module_name} {steps} exited with code {process.exitcode}")
+    finally:
+        process.join()
+
+def run_benchmarks(resolutions, patterns, frames, modules, effects, include_chains=True, log=print):
+    """Run every case and return the list of result records"""
+    records = []
+    workdir = tempfile.mkdtemp(prefix='bench_inputs_')
+    try:
+        for resolution in resolutions:
+            for pattern in patterns:
+                input_path = os.path.join(workdir, f"{pattern}_{resolution}.mp4")
+                write_synthetic_video(input_path, pattern, resolution, frames)
+
+                for module_name in modules:
+                    cases = [(PASSTHROUGH, (PASSTHROUGH,))]
+                    cases += [(effect, (effect,)) for effect in effects]
+                    if include_chains:
+                        cases += [(f"chain:{name}", steps) for name, steps in CHAINS.items()]
+
+                    baseline_ms = None
+                    for case, steps in cases:
+                        log(f"{module_name} {resolution} {pattern} {case}...")
+                        result = run_case(module_name, steps, input_path)
+                        ms_per_frame = result['seconds'] * 1000 / frames
+                        if case == PASSTHROUGH:
+                            baseline_ms = ms_per_frame
+
+                        # Every step decodes and re-encodes the video once
+                        io_ms = baseline_ms * len(steps)
+                        records.append({
+                            'module': module_name,
+                            'case': case,
+                            'resolution': resolution,
+                            'pattern': pattern,
+                            'frames': frames,
+                            'ms_per_frame': round(ms_per_frame, 2),
+                            'fps': round(1000 / ms_per_frame, 2) if ms_per_frame else None,
+                            'peak_rss_mb': round(result['peak_rss_mb'], 1),
+                            'encode_decode_share': round(min(1.0, io_ms / ms_per_frame), 3) if ms_per_frame else None
+                        })
+    finally:
+        for filename in os.listdir(workdir):
+            os.remove(os.path.join(workdir, filename))
+        os.rmdir(workdir)
+    return records
+
+def compare_results(baseline, current, threshold):
+    """Return the cases whose ms/frame grew by more than threshold (a fraction)"""
+    key = lambda record: (record['module'], record['case'], record['resolution'], record['pattern'])
+    previous = {key(record): record for record in baseline['results']}
+    regressions = []
+    for record in current['results']:
+        old = previous.get(key(record))
+        if old is None or not old['ms_per_frame']:
+            continue
+        change = record['ms_per_frame'] / old['ms_per_frame'] - 1
+        if change > threshold:
+            regressions.append({
+                'module': record['module'],
+                'case': record['case'],
+                'resolution': record['resolution'],
+                'pattern': record['pattern'],
+                'baseline_ms_per_frame': old['ms_per_frame'],
+                'ms_per_frame': record['ms_per_frame'],
+                'change': round(change, 3)
+            })
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the vintage video effects')
+    parser.add_argument('--resolutions', default='480p,720p',
+                        help=f"Comma separated list from {','.join(RESOLUTIONS)}")
+    parser.add_argument('--patterns', default='motion',
+                        help=f"Comma separated list from {','.join(PATTERNS)}")
+    parser.add_argument('--frames', type=int, default=24, help='Frames per synthetic video')
+    parser.add_argument('--modules', default=','.join(MODULES))
+    parser.add_argument('--effects', default=','.join(EFFECT_FUNCTIONS))
+    parser.add_argument('--no-chains', action='store_true', help='Skip the effect chains')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--compare', help='Previous JSON report to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Slowdown fraction reported as a regression (default 0.1)')
+    args = parser.parse_args(argv)
+
+    log = lambda message: print(message, file=sys.stderr)
+    results = run_benchmarks(args.resolutions.split(','), args.patterns.split(','), args.frames,
+                             args.modules.split(','), args.effects.split(','),
+                             include_chains=not args.no_chains, log=log)
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'results': results
+    }
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(json.load(f), report, args.threshold)
+        report['regressions'] = regressions
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    for regression in regressions:
+        log(f"REGRESSION {regression['module']} {regression['case']} {regression['resolution']} "
+            f"{regression['pattern']}: {regression['baseline_ms_per_frame']} -> "
+            f"{regression['ms_per_frame']} ms/frame ({regression['change']:+.0%})")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
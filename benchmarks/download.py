@@ -0,0 +1,181 @@
+"""
+Download benchmark for downloader.download_file
+
+Serves a random file from a local threaded HTTP server that imitates a remote
+object store: every request waits --latency seconds before the first byte and
+every connection is capped at --connection-mbps. Then times downloading it:
+- stream: the server ignores Range headers, so a single request is streamed
+- ranged: byte ranges fetched over each of the --connections counts
+With --fail-rate, that share of the responses is cut off halfway, which the
+downloader has to retry. Every download is checked against the served bytes.
+
+Usage (from the repository root):
+    python -m benchmarks.download --size-mb 64 --connections 1,4,8 --output download.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import downloader
+
+RANGE_PATTERN = re.compile(r'bytes=(\d+)-(\d+)')
+
+class ObjectStoreHandler(BaseHTTPRequestHandler):
+    """
+    Serves server.data with the latency, bandwidth and failures set on the server
+    Also used by the downloader tests: the Range header of every request is
+    recorded in server.requests, server.status answers every request with that
+    error status instead, and the first server.fail_first responses are cut off
+    halfway.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        data = server.data
+        with server.lock:
+            server.requests.append(self.headers.get('Range'))
+        time.sleep(server.latency)
+
+        if server.status:
+            self.send_response(server.status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        match = RANGE_PATTERN.match(self.headers.get('Range', ''))
+        if match and server.ranges and int(match.group(1)) >= len(data):
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{len(data)}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if match and server.ranges:
+            start, end = int(match.group(1)), min(int(match.group(2)), len(data) - 1)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        else:
+            start, end = 0, len(data) - 1
+            self.send_response(200)
+        self.send_header('Content-Length', str(end + 1 - start))
+        self.end_headers()
+
+        cut_at = end + 1
+        with server.lock:
+            if server.fail_first > 0 or server.random.random() < server.fail_rate:
+                server.fail_first -= 1
+                cut_at = start + (end + 1 - start) // 2
+        chunk = 64 * 1024
+        for offset in range(start, cut_at, chunk):
+            self.wfile.write(data[offset:min(offset + chunk, cut_at)])
+            if server.connection_bytes_per_second:
+                time.sleep(min(chunk, cut_at - offset) / server.connection_bytes_per_second)
+        if cut_at <= end:
+            self.close_connection = True
+
+def start_server(data, latency, connection_mbps, fail_rate, seed=0):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ObjectStoreHandler)
+    server.daemon_threads = True
+    server.data = data
+    server.latency = latency
+    server.connection_bytes_per_second = connection_mbps * 1024 * 1024 / 8
+    server.fail_rate = fail_rate
+    server.ranges = True
+    server.status = None
+    server.fail_first = 0
+    server.requests = []
+    server.random = random.Random(seed)
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def time_download(url, expected_md5, workdir):
+    output_path = os.path.join(workdir, 'download.bin')
+    start = time.perf_counter()
+    downloader.download_file(url, output_path)
+    seconds = time.perf_counter() - start
+    with open(output_path, 'rb') as f:
+        if hashlib.md5(f.read()).hexdigest() != expected_md5:
+            raise Exception('Downloaded file differs from the served file')
+    os.remove(output_path)
+    return seconds
+
+def run_benchmarks(size_mb, connection_counts, repeats, latency, connection_mbps, fail_rate, log=print):
+    data = os.urandom(int(size_mb * 1024 * 1024))
+    expected_md5 = hashlib.md5(data).hexdigest()
+    server = start_server(data, latency, connection_mbps, fail_rate)
+    url = f"http://127.0.0.1:{server.server_address[1]}/source.mp4"
+
+    cases = [('stream', 1)] + [('ranged', count) for count in connection_counts]
+    records = []
+    try:
+        with tempfile.TemporaryDirectory(prefix='bench_download_') as workdir:
+            for mode, connections in cases:
+                log(f"{mode} x{connections}...")
+                server.ranges = mode == 'ranged'
+                downloader.DOWNLOAD_CONNECTIONS = connections
+                runs = [time_download(url, expected_md5, workdir) for _ in range(repeats)]
+                seconds = statistics.median(runs)
+                records.append({
+                    'mode': mode,
+                    'connections': connections,
+                    'seconds': round(seconds, 3),
+                    'mb_per_second': round(size_mb / seconds, 1)
+                })
+    finally:
+        server.shutdown()
+    return records
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure single-stream against ranged downloads')
+    parser.add_argument('--size-mb', type=float, default=64)
+    parser.add_argument('--connections', default='1,4,8', help='Comma separated connection counts')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds before each response starts')
+    parser.add_argument('--connection-mbps', type=float, default=200,
+                        help='Bandwidth cap of each connection in Mbit/s (0 for none)')
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help='Share of responses cut off halfway')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    log = lambda message: print(message, file=sys.stderr)
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'size_mb': args.size_mb,
+        'latency': args.latency,
+        'connection_mbps': args.connection_mbps,
+        'fail_rate': args.fail_rate,
+        'part_mb': downloader.DOWNLOAD_PART_BYTES / (1024 * 1024),
+        'results': run_benchmarks(args.size_mb, [int(count) for count in args.connections.split(',')],
+                                  args.repeats, args.latency, args.connection_mbps, args.fail_rate, log=log)
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    for record in report['results']:
+        log(f"{record['mode']:<8} x{record['connections']:<3} {record['seconds']:>8.3f}s "
+            f"{record['mb_per_second']:>8.1f} MB/s")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Encoder profile benchmark
+
+Writes a synthetic video per pattern and resolution with the effects' mp4v
+writer, then encodes it with every encoder profile of encoding.py, as
+finish_output does for each output. Reports the wall time, encoded fps, file
+size, bitrate and PSNR against the source frames of each profile, so the
+speed, size and quality trade-offs can be compared. The mp4v case re-encodes
+with OpenCV as outputs without audio were written before the profiles.
+
+Usage (from the repository root):
+    python -m benchmarks.encoding --resolutions 480p,720p --patterns motion,noise --output encoding.json
+    python -m benchmarks.encoding --threads 1,0
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+import encoding
+from benchmarks.synthetic import RESOLUTIONS, write_synthetic_video
+from time_ranges import encode_video
+
+# The re-encode outputs without audio got before the profiles existed
+MP4V = 'mp4v'
+
+def encode_mp4v(input_path, output_path, fps, frame_size):
+    video = cv2.VideoCapture(input_path)
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, frame_size)
+    while True:
+        ret, frame = video.read()
+        if not ret:
+            break
+        out.write(frame)
+    video.release()
+    out.release()
+
+def mean_psnr(reference_path, encoded_path):
+    """Mean PSNR (dB) of the encoded frames against the reference frames"""
+    reference = cv2.VideoCapture(reference_path)
+    encoded = cv2.VideoCapture(encoded_path)
+    values = []
+    while True:
+        ret_reference, reference_frame = reference.read()
+        ret_encoded, encoded_frame = encoded.read()
+        if not ret_reference or not ret_encoded:
+            break
+        mse = np.mean((reference_frame.astype(np.float32) - encoded_frame.astype(np.float32)) ** 2)
+        values.append(100.0 if mse == 0 else 10 * np.log10(255.0 ** 2 / mse))
+    reference.release()
+    encoded.release()
+    return float(np.mean(values)) if values else None
+
+def time_encode(case, input_path, output_path, fps, frame_size):
+    start = time.perf_counter()
+    if case == MP4V:
+        encode_mp4v(input_path, output_path, fps, frame_size)
+    else:
+        encode_video(input_path, output_path, encoder=case, frame_size=frame_size)
+    return time.perf_counter() - start
+
+def run_benchmarks(resolutions, patterns, frames, fps, profiles, thread_counts, repeats, log=print):
+    """Encode every input with every profile and thread count; returns the result records"""
+    records = []
+    with tempfile.TemporaryDirectory(prefix='bench_encoding_') as workdir:
+        for resolution in resolutions:
+            frame_size = RESOLUTIONS[resolution]
+            for pattern in patterns:
+                input_path = os.path.join(workdir, f"{pattern}_{resolution}.mp4")
+                write_synthetic_video(input_path, pattern, resolution, frames, fps)
+
+                cases = [(MP4V, None)] + [(profile, threads) for profile in profiles for threads in thread_counts]
+                for case, threads in cases:
+                    log(f"{resolution} {pattern} {case}" + ('' if threads is None else f" threads={threads}") + '...')
+                    if threads is not None:
+                        encoding.ENCODER_THREADS = threads
+                    output_path = os.path.join(workdir, f"{case}.mp4")
+                    seconds = statistics.median(time_encode(case, input_path, output_path, fps, frame_size)
+                                                for _ in range(repeats))
+                    size = os.path.getsize(output_path)
+                    records.append({
+                        'resolution': resolution,
+                        'pattern': pattern,
+                        'profile': case,
+                        'threads': threads,
+                        'seconds': round(seconds, 3),
+                        'fps': round(frames / seconds, 1),
+                        'bytes': size,
+                        'kbps': round(size * 8 / (frames / fps) / 1000, 1),
+                        'psnr': round(mean_psnr(input_path, output_path), 2)
+                    })
+                    os.remove(output_path)
+    return records
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure wall time, size and quality of the encoder profiles')
+    parser.add_argument('--resolutions', default='480p,720p', help=f"Comma separated, from {', '.join(RESOLUTIONS)}")
+    parser.add_argument('--patterns', default='motion,noise', help='Comma separated synthetic patterns')
+    parser.add_argument('--frames', type=int, default=96)
+    parser.add_argument('--fps', type=float, default=24.0)
+    parser.add_argument('--profiles', default=','.join(encoding.ENCODER_PROFILES),
+                        help='Comma separated encoder profiles')
+    parser.add_argument('--threads', default=str(encoding.ENCODER_THREADS),
+                        help='Comma separated encoder thread counts (0 lets x264 pick)')
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    log = lambda message: print(message, file=sys.stderr)
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'frames': args.frames,
+        'profiles': {name: encoding.ENCODER_PROFILES[name] for name in args.profiles.split(',')},
+        'results': run_benchmarks(args.resolutions.split(','), args.patterns.split(','), args.frames, args.fps,
+                                  args.profiles.split(','), [int(count) for count in args.threads.split(',')],
+                                  args.repeats, log=log)
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    for record in report['results']:
+        threads = '' if record['threads'] is None else f"t{record['threads']}"
+        log(f"{record['resolution']:<6} {record['pattern']:<8} {record['profile']:<9} {threads:<4} "
+            f"{record['seconds']:>8.3f}s {record['fps']:>7.1f} fps {record['kbps']:>9.1f} kb/s "
+            f"{record['psnr']:>6.2f} dB")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
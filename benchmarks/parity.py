@@ -0,0 +1,176 @@
+"""
+Golden-output parity harness for the per-frame effect functions
+
+Runs each registered effect's frame function on fixed, seeded input frames and
+compares the result with the reference outputs stored in benchmarks/golden.
+Alternative (faster) implementations listed in CANDIDATES, or passed with
+--candidate, are checked against the same references and timed against the
+reference implementation, so every fast path ships with proof that it is both
+faster and visually equivalent.
+
+Usage (from the repository root):
+    python -m benchmarks.parity                    # check everything
+    python -m benchmarks.parity --update           # regenerate the references
+    python -m benchmarks.parity --candidate vhs=mymodule:fast_vhs_process
+"""
+import argparse
+import importlib
+import inspect
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import RESOLUTIONS, make_frame
+from effect_registry import EFFECTS
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), 'golden', 'effects.npz')
+
+# Small fixed inputs keep the stored references compact
+INPUT_SIZE = (192, 108)
+INPUT_FRAMES = (('gradient', 3), ('motion', 17))
+INTENSITIES = (0.5, 1.0)
+SEED = 1234
+
+# Minimum PSNR (dB) and maximum absolute per-pixel error allowed against the
+# references. Deterministic effects must match closely; effects dominated by
+# per-pixel noise are allowed rounding differences in how the noise is added.
+DEFAULT_TOLERANCE = {'min_psnr': 45.0, 'max_abs': 2}
+TOLERANCES = {
+    'vhs': {'min_psnr': 40.0, 'max_abs': 4},
+    'film_grain': {'min_psnr': 40.0, 'max_abs': 4},
+    'old_movie': {'min_psnr': 40.0, 'max_abs': 4},
+    'sepia': {'min_psnr': 40.0, 'max_abs': 4},
+    'vintage_color': {'min_psnr': 40.0, 'max_abs': 4}
+}
+
+# Alternative implementations to verify: effect name -> {label: frame function}
+CANDIDATES = {}
+
+def golden_inputs():
+    """The fixed input frames every effect is rendered on"""
+    width, height = INPUT_SIZE
+    return [make_frame(pattern, width, height, index) for pattern, index in INPUT_FRAMES]
+
+def render(frame_func, frame, intensity, seed=SEED):
+    """Render one frame with a fresh Generator so every implementation sees the same stream"""
+    kwargs = {'intensity': intensity}
+    if 'rng' in inspect.signature(frame_func).parameters:
+        kwargs['rng'] = np.random.default_rng(seed)
+    return frame_func(frame.copy(), **kwargs)
+
+def case_key(effect_name, frame_index, intensity):
+    return f"{effect_name}/{frame_index}/{intensity}"
+
+def psnr(expected, actual):
+    mse = np.mean((expected.astype(np.float64) - actual.astype(np.float64)) ** 2)
+    if mse == 0:
+        return float('inf')
+    return 10 * np.log10(255.0 ** 2 / mse)
+
+def update_golden(path=GOLDEN_PATH):
+    """Regenerate the stored references from the registered implementations"""
+    outputs = {}
+    for effect_name, effect in EFFECTS.items():
+        for frame_index, frame in enumerate(golden_inputs()):
+            for intensity in INTENSITIES:
+                outputs[case_key(effect_name, frame_index, intensity)] = render(effect.process_frame, frame, intensity)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez_compressed(path, **outputs)
+    return len(outputs)
+
+def check_implementation(effect_name, frame_func, golden):
+    """Compare an implementation against the references; returns (passed, worst psnr, worst max abs)"""
+    tolerance = TOLERANCES.get(effect_name, DEFAULT_TOLERANCE)
+    worst_psnr, worst_abs = float('inf'), 0
+    for frame_index, frame in enumerate(golden_inputs()):
+        for intensity in INTENSITIES:
+            expected = golden[case_key(effect_name, frame_index, intensity)]
+            actual = render(frame_func, frame, intensity)
+            if actual.shape != expected.shape or actual.dtype != expected.dtype:
+                return False, None, None
+            worst_psnr = min(worst_psnr, psnr(expected, actual))
+            worst_abs = max(worst_abs, int(np.abs(expected.astype(np.int16) - actual.astype(np.int16)).max()))
+    passed = worst_psnr >= tolerance['min_psnr'] and worst_abs <= tolerance['max_abs']
+    return passed, worst_psnr, worst_abs
+
+def time_implementation(frame_func, frame, intensity=1.0, repeats=5):
+    """Median milliseconds per frame"""
+    render(frame_func, frame, intensity)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        render(frame_func, frame, intensity)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+def load_candidate(spec):
+    """Parse effect=module:function into (effect name, label, frame function)"""
+    effect_name, target = spec.split('=', 1)
+    module_name, function_name = target.split(':', 1)
+    return effect_name, target, getattr(importlib.import_module(module_name), function_name)
+
+def run_parity(candidates, timing_resolution='720p', repeats=5, golden_path=GOLDEN_PATH):
+    """Check the reference implementations and every candidate; returns the report records"""
+    with np.load(golden_path) as data:
+        golden = {key: data[key] for key in data.files}
+
+    width, height = RESOLUTIONS[timing_resolution]
+    timing_frame = make_frame('motion', width, height, 0)
+
+    records = []
+    for effect_name, effect in EFFECTS.items():
+        reference_ms = time_implementation(effect.process_frame, timing_frame, repeats=repeats)
+        implementations = [('reference', effect.process_frame)]
+        implementations += list(candidates.get(effect_name, {}).items())
+
+        for label, frame_func in implementations:
+            passed, worst_psnr, worst_abs = check_implementation(effect_name, frame_func, golden)
+            ms = reference_ms if label == 'reference' else time_implementation(frame_func, timing_frame, repeats=repeats)
+            records.append({
+                'effect': effect_name,
+                'implementation': label,
+                'passed': passed,
+                'psnr_db': None if worst_psnr is None else (round(worst_psnr, 2) if np.isfinite(worst_psnr) else 'inf'),
+                'max_abs_error': worst_abs,
+                'tolerance': TOLERANCES.get(effect_name, DEFAULT_TOLERANCE),
+                'ms_per_frame': round(ms, 2),
+                'speedup': round(reference_ms / ms, 2) if ms else None
+            })
+    return records
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check effect implementations against golden outputs')
+    parser.add_argument('--update', action='store_true', help='Regenerate the golden references and exit')
+    parser.add_argument('--candidate', action='append', default=[],
+                        help='Extra implementation to check, as effect=module:function (repeatable)')
+    parser.add_argument('--timing-resolution', default='720p', choices=sorted(RESOLUTIONS))
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args(argv)
+
+    if args.update:
+        count = update_golden()
+        print(f"Wrote {count} reference frames to {GOLDEN_PATH}")
+        return 0
+
+    candidates = {effect_name: dict(labels) for effect_name, labels in CANDIDATES.items()}
+    for spec in args.candidate:
+        effect_name, label, frame_func = load_candidate(spec)
+        candidates.setdefault(effect_name, {})[label] = frame_func
+
+    records = run_parity(candidates, args.timing_resolution, args.repeats)
+    if args.json:
+        print(json.dumps(records, indent=2))
+    else:
+        print(f"{'effect':<14} {'implementation':<32} {'result':<6} {'psnr':>8} {'maxabs':>6} {'ms/frame':>9} {'speedup':>7}")
+        for record in records:
+            print(f"{record['effect']:<14} {record['implementation']:<32} "
+                  f"{'PASS' if record['passed'] else 'FAIL':<6} {str(record['psnr_db']):>8} "
+                  f"{str(record['max_abs_error']):>6} {record['ms_per_frame']:>9} {str(record['speedup']):>7}")
+    return 0 if all(record['passed'] for record in records) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Startup benchmark for the API workers
+
+Imports app.py in fresh interpreters and reports the import time, the resident
+memory afterwards and which video backends got loaded, for:
+- lazy: importing the app as a worker does now
+- eager: importing the app and then every backend, as app.py did before the
+  backends were loaded lazily
+- warm: importing the app and running effect_registry.warm_up (what a
+  --preload master pays once before forking)
+- effects_request: importing the app and serving GET /api/effects
+
+Usage (from the repository root):
+    python -m benchmarks.startup --repeats 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The modules app.py imported at startup before they were made lazy
+EAGER_MODULES = ('cv2', 'skimage.util', 'moviepy.editor')
+
+# Backends reported as loaded or not after each scenario
+REPORTED_MODULES = ('cv2', 'skimage', 'moviepy', 'scipy')
+
+SCENARIOS = {
+    'lazy': '',
+    'eager': f"from lazy_imports import load_modules\nload_modules({EAGER_MODULES!r})\n",
+    'warm': "from effect_registry import warm_up\nwarm_up()\n",
+    'effects_request': "app.app.test_client().get('/api/effects')\n"
+}
+
+CHILD_TEMPLATE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+{scenario}seconds = time.perf_counter() - start
+
+rss_kb = None
+with open('/proc/self/status') as f:
+    for line in f:
+        if line.startswith('VmRSS:'):
+            rss_kb = int(line.split()[1])
+if rss_kb is None:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+# A module still waiting in a lazy_import proxy doesn't count as loaded
+loaded = [name for name in {modules!r}
+          if name in sys.modules and type(sys.modules[name]).__name__ != '_LazyModule']
+json.dump({{'seconds': seconds, 'rss_mb': rss_kb / 1024, 'loaded': loaded}}, sys.stdout)
+"""
+
+def run_scenario(name):
+    """Run one scenario in a fresh interpreter and return its measurements"""
+    code = CHILD_TEMPLATE.format(scenario=SCENARIOS[name], modules=REPORTED_MODULES)
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    # Run in a scratch directory so the folders app.py creates don't end up in the repository
+    with tempfile.TemporaryDirectory(prefix='bench_startup_') as workdir:
+        result = subprocess.run([sys.executable, '-c', code], cwd=workdir, env=env,
+                                capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"Startup scenario {name} failed: {result.stderr.strip()}")
+    # warm_up and the app print progress lines before the JSON record
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def run_benchmarks(scenarios, repeats, log=print):
+    records = []
+    for name in scenarios:
+        log(f"{name}...")
+        runs = [run_scenario(name) for _ in range(repeats)]
+        records.append({
+            'scenario': name,
+            'repeats': repeats,
+            'seconds': round(statistics.median(run['seconds'] for run in runs), 3),
+            'rss_mb': round(statistics.median(run['rss_mb'] for run in runs), 1),
+            'loaded': runs[-1]['loaded']
+        })
+    return records
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure API worker import time and memory')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"Comma separated list from {','.join(SCENARIOS)}")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args(argv)
+
+    log = lambda message: print(message, file=sys.stderr)
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'results': run_benchmarks(args.scenarios.split(','), args.repeats, log=log)
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    for record in report['results']:
+        log(f"{record['scenario']:<16} {record['seconds']:>7.3f}s {record['rss_mb']:>8.1f} MB  "
+            f"loaded: {', '.join(record['loaded']) or '-'}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import cv2
+import numpy as np
+
+# Standard benchmark resolutions as (width, height)
+RESOLUTIONS = {
+    '480p': (854, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '4k': (3840, 2160)
+}
+
+PATTERNS = ('gradient', 'noise', 'motion')
+
+def make_frame(pattern, width, height, index, rng=None):
+    """
+    Build one RGB uint8 frame of a synthetic test pattern
+    - gradient: smooth diagonal color ramps that drift slowly (compresses well)
+    - noise: uniform random pixels (worst case for the encoder)
+    - motion: moving shapes over a gradient background (typical footage)
+    """
+    if pattern == 'noise':
+        rng = rng if rng is not None else np.random.default_rng(index)
+        return rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+    # Diagonal gradient with a per-frame phase so consecutive frames differ
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    phase = (index % 100) / 100.0
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:, :, 0] = ((x + phase) % 1.0 * 255).astype(np.uint8)
+    frame[:, :, 1] = ((y + phase) % 1.0 * 255).astype(np.uint8)
+    frame[:, :, 2] = (((x + y) / 2 + phase) % 1.0 * 255).astype(np.uint8)
+
+    if pattern == 'motion':
+        # A bouncing box and a circle crossing the frame
+        size = max(8, height // 6)
+        box_x = int((index * width / 60) % max(1, width - size))
+        box_y = int(abs((index * height / 40) % (2 * (height - size)) - (height - size)))
+        frame[box_y:box_y + size, box_x:box_x + size] = (255, 255, 255)
+        circle_x = int(width - (index * width / 90) % width)
+        cv2.circle(frame, (circle_x, height // 2), size // 2, (20, 20, 200), -1)
+    elif pattern != 'gradient':
+        raise ValueError(f"Unknown pattern: {pattern}")
+
+    return frame
+
+def write_synthetic_video(output_path, pattern='motion', resolution='720p', frames=30, fps=24.0):
+    """Write a synthetic test video with the same mp4v writer the effects use"""
+    width, height = RESOLUTIONS[resolution]
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not writer.isOpened():
+        raise Exception(f"Could not open video writer for {output_path}")
+
+    rng = np.random.default_rng(0)
+    try:
+        for index in range(frames):
+            frame = make_frame(pattern, width, height, index, rng)
+            writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+    finally:
+        writer.release()
+    return output_path
@@ -0,0 +1,63 @@
+import os
+import threading
+import time
+
+# Seconds between checks for a cancel marker file written by another worker process
+MARKER_POLL_SECONDS = 0.5
+
+class JobCancelled(Exception):
+    """Raised inside a job when its CancelToken was cancelled or its deadline passed"""
+
+    def __init__(self, reason):
+        super().__init__(f"Job {reason}")
+        self.reason = reason
+
+    @property
+    def timed_out(self):
+        return self.reason == CancelToken.DEADLINE
+
+class CancelToken:
+    """
+    Cooperative cancellation for one job
+
+    The processing loops call check() between frames (and between chain steps),
+    which raises JobCancelled once cancel() was called, the deadline (seconds
+    from now) has passed or the marker file exists. The marker file lets a
+    request handled by another worker process cancel the job.
+    """
+
+    DEADLINE = 'deadline exceeded'
+
+    def __init__(self, timeout=None, marker_path=None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.marker_path = marker_path
+        self.next_marker_check = 0.0
+        self.reason = None
+        self.event = threading.Event()
+
+    def cancel(self, reason='cancelled'):
+        if not self.event.is_set():
+            self.reason = reason
+            self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        """Raise JobCancelled if the job should stop"""
+        if not self.event.is_set():
+            now = time.monotonic()
+            if self.deadline is not None and now >= self.deadline:
+                self.cancel(self.DEADLINE)
+            elif self.marker_path and now >= self.next_marker_check:
+                self.next_marker_check = now + MARKER_POLL_SECONDS
+                if os.path.exists(self.marker_path):
+                    self.cancel()
+        if self.event.is_set():
+            raise JobCancelled(self.reason)
+
+def check_cancel(cancel):
+    """check() a token that may be None"""
+    if cancel is not None:
+        cancel.check()
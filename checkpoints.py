@@ -0,0 +1,122 @@
+import json
+import os
+import shutil
+import time
+from lazy_imports import lazy_import
+from time_ranges import join_segments
+
+cv2 = lazy_import('cv2')
+
+# Seconds of processing between two committed segments, i.e. the most work a
+# crashed job loses when it is resumed
+CHECKPOINT_SECONDS = float(os.environ.get('CHECKPOINT_SECONDS', 15))
+
+MANIFEST_NAME = 'manifest.json'
+
+def job_fingerprint(**values):
+    """The values in the form they have after a round trip through a manifest, for comparing"""
+    return json.loads(json.dumps(values, sort_keys=True, default=repr))
+
+def read_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def write_manifest(path, manifest):
+    """Replace the manifest atomically, so a crash leaves either the old or the new one"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+class Checkpoint:
+    """
+    Output of one process_video_frames run written as committed segments
+
+    Frames go to segment_<n>.mp4. Every CHECKPOINT_SECONDS the segment is closed
+    and recorded in the manifest with the position to resume from: the next
+    source frame index, the output cadence position, the frames written and the
+    entropy the per-frame random streams derive from. A run with the same
+    fingerprint finds the manifest, skips the committed frames and appends new
+    segments; join() concatenates them without re-encoding.
+    """
+
+    def __init__(self, directory, fingerprint, fps, frame_size):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.fps = fps
+        self.frame_size = frame_size
+        self.writer = None
+        self.segment_frames = 0
+
+        manifest = read_manifest(self.manifest_path)
+        if manifest is None or manifest['fingerprint'] != fingerprint:
+            # Nothing to resume, or left behind by a different job
+            shutil.rmtree(directory, ignore_errors=True)
+            manifest = {'fingerprint': fingerprint, 'segments': [], 'entropy': None,
+                        'frame_index': 0, 'next_frame': 0.0, 'frames': 0}
+        os.makedirs(directory, exist_ok=True)
+        self.manifest = manifest
+
+    @property
+    def resumed(self):
+        return bool(self.manifest['segments'])
+
+    def entropy(self, job_seed_entropy):
+        """The entropy of the random streams: the stored one when resuming, else job_seed_entropy"""
+        if self.manifest['entropy'] is None:
+            self.manifest['entropy'] = job_seed_entropy
+        return self.manifest['entropy']
+
+    def write(self, frame, frame_index, next_frame):
+        """Write one output frame; frame_index and next_frame are where reading resumes after it"""
+        if self.writer is None:
+            self.segment_path = os.path.join(self.directory, f"segment_{len(self.manifest['segments']):04d}.mp4")
+            self.writer = cv2.VideoWriter(self.segment_path, cv2.VideoWriter_fourcc(*'mp4v'),
+                                          self.fps, self.frame_size)
+            self.segment_start = time.monotonic()
+        self.writer.write(frame)
+        self.segment_frames += 1
+        self.position = (frame_index, next_frame)
+        if time.monotonic() - self.segment_start >= CHECKPOINT_SECONDS:
+            self.commit()
+
+    def commit(self):
+        """Close the current segment and record it in the manifest"""
+        if self.writer is None:
+            return
+        self.writer.release()
+        self.writer = None
+        self.manifest['segments'].append(os.path.basename(self.segment_path))
+        self.manifest['frame_index'], self.manifest['next_frame'] = self.position
+        self.manifest['frames'] += self.segment_frames
+        self.segment_frames = 0
+        write_manifest(self.manifest_path, self.manifest)
+        # Segments go to a subdirectory, so refresh the job workspace holding it
+        # to keep the janitor from expiring a job that is making progress
+        try:
+            os.utime(os.path.dirname(os.path.abspath(self.directory)))
+        except OSError:
+            pass
+
+    def release(self):
+        """Drop an uncommitted segment, e.g. when the run failed"""
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+    def join(self, output_path):
+        """Commit the last segment and concatenate all segments into output_path"""
+        self.commit()
+        segment_paths = [os.path.join(self.directory, name) for name in self.manifest['segments']]
+        if len(segment_paths) == 1:
+            shutil.copyfile(segment_paths[0], output_path)
+        elif segment_paths:
+            join_segments(segment_paths, output_path)
+        else:
+            # No frames at all: leave an empty video as the plain writer would
+            cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), self.fps, self.frame_size).release()
@@ -21,15 +21,26 @@ export SERVER_HOST="0.0.0.0"
 export SERVER_PORT="5557"
 export SERVER_BASE_URL="http://62.171.168.74:5557"
 
+# Shared directory where every gunicorn worker writes its Prometheus samples,
+# emptied on each deploy so stale samples from old workers are dropped
+export PROMETHEUS_MULTIPROC_DIR="$(pwd)/prometheus_metrics"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# Host memory the processing jobs of all workers may use together, 75% of what
+# is available now unless set; jobs that don't fit wait for running ones to finish
+export MEMORY_BUDGET_MB="${MEMORY_BUDGET_MB:-$(awk '/MemAvailable/ {print int($2 / 1024 * 0.75)}' /proc/meminfo)}"
+export MEMORY_LEDGER_PATH="$(pwd)/memory_ledger.json"
+
 # Check required files
-if [ ! -f "app.py" ] || [ ! -f "Ventageeffect.py" ]; then
-    echo "Error: Required files are missing. Make sure app.py and Ventageeffect.py exist."
+if [ ! -f "app.py" ] || [ ! -f "Ventageeffect.py" ] || [ ! -f "effect_registry.py" ]; then
+    echo "Error: Required files are missing. Make sure app.py, Ventageeffect.py and effect_registry.py exist."
     exit 1
 fi
 
 # Start server with gunicorn
 echo "Starting server on port 5557..."
-nohup gunicorn --bind 0.0.0.0:5557 --workers 4 app:app > logs/vintage_effects.log 2>&1 &
+nohup gunicorn -c gunicorn.conf.py --bind 0.0.0.0:5557 --workers 4 app:app > logs/vintage_effects.log 2>&1 &
 
 # Check if server started
 sleep 2
@@ -38,6 +49,7 @@ then
     echo "Server started successfully on port 5557."
     echo "API is accessible at: http://62.171.168.74:5557"
     echo "Visit /api/effects to get a list of available effects."
+    echo "Prometheus metrics are exposed at /metrics."
     echo "Use /api/url/apply-effect and /api/url/combine-effects for URL-based processing."
 else
     echo "Failed to start server. Check logs/vintage_effects.log for details."
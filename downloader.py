@@ -0,0 +1,197 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+import requests
+from requests.adapters import HTTPAdapter
+from cancellation import CancelToken, check_cancel
+from metrics import BYTES_DOWNLOADED, DOWNLOAD_RETRIES
+
+# Byte ranges of a source fetched at once, and the size of each range request.
+# Files no larger than one part are fetched with a single request.
+DOWNLOAD_CONNECTIONS = int(os.environ.get('DOWNLOAD_CONNECTIONS', 4))
+DOWNLOAD_PART_BYTES = int(os.environ.get('DOWNLOAD_PART_MB', 8)) * 1024 * 1024
+
+# Retries of a failed range (or of the whole stream when the server doesn't
+# support ranges), with exponential backoff. A retried range resumes at the
+# first byte it hasn't written yet.
+DOWNLOAD_RETRIES_PER_PART = int(os.environ.get('DOWNLOAD_RETRIES', 3))
+DOWNLOAD_RETRY_SECONDS = 0.5
+
+# Connect and read timeout of every request, in seconds
+DOWNLOAD_TIMEOUT_SECONDS = float(os.environ.get('DOWNLOAD_TIMEOUT_SECONDS', 30))
+
+# Keep-alive connections per host kept by the shared session, enough for a few
+# concurrent downloads to reuse theirs
+DOWNLOAD_POOL_SIZE = int(os.environ.get('DOWNLOAD_POOL_SIZE', 16))
+
+CHUNK_BYTES = 64 * 1024
+CONTENT_RANGE_PATTERN = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+session = None
+session_lock = threading.Lock()
+
+class IncompleteDownload(Exception):
+    """A response ended early or didn't hold the requested bytes"""
+
+def get_session():
+    """The requests.Session shared by the downloads of this process, created on first use"""
+    global session
+    with session_lock:
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=DOWNLOAD_POOL_SIZE, pool_maxsize=DOWNLOAD_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            # Ranges are byte offsets of the stored file, so ask for it unencoded
+            session.headers['Accept-Encoding'] = 'identity'
+        return session
+
+def get(url, byte_range=None):
+    headers = {'Range': f'bytes={byte_range[0]}-{byte_range[1]}'} if byte_range else None
+    response = get_session().get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT_SECONDS)
+    try:
+        response.raise_for_status()
+    except Exception:
+        response.close()
+        raise
+    return response
+
+def retryable(error):
+    """Network errors and 5xx or 429 answers are worth retrying, other HTTP errors aren't"""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return isinstance(error, (requests.RequestException, IncompleteDownload))
+
+def with_retries(attempt, cancel):
+    """Call attempt() until it succeeds or the retries of DOWNLOAD_RETRIES_PER_PART are used up"""
+    for retry in range(DOWNLOAD_RETRIES_PER_PART + 1):
+        try:
+            return attempt()
+        except Exception as e:
+            if retry == DOWNLOAD_RETRIES_PER_PART or not retryable(e):
+                raise
+            print(f"Retrying download after error: {str(e)}")
+            DOWNLOAD_RETRIES.inc()
+            check_cancel(cancel)
+            time.sleep(DOWNLOAD_RETRY_SECONDS * 2 ** retry)
+
+def fetch_range(url, fd, start, end, cancel, stop, response=None):
+    """
+    Write bytes start to end (inclusive) of url at the same offsets of the file fd
+    response may be an open 206 response for the range, as returned by the probe.
+    """
+    position = start
+
+    def attempt():
+        nonlocal position, response
+        current, response = response, None
+        if current is None:
+            current = get(url, (position, end))
+        with current:
+            match = CONTENT_RANGE_PATTERN.match(current.headers.get('Content-Range', ''))
+            if current.status_code != 206 or not match or int(match.group(1)) != position:
+                raise IncompleteDownload(f"Server did not return bytes {position}-{end}")
+            for chunk in current.iter_content(chunk_size=CHUNK_BYTES):
+                check_cancel(cancel)
+                check_cancel(stop)
+                chunk = chunk[:end + 1 - position]
+                os.pwrite(fd, chunk, position)
+                position += len(chunk)
+                BYTES_DOWNLOADED.inc(len(chunk))
+                if position > end:
+                    return
+        raise IncompleteDownload(f"Connection closed at byte {position} of range {start}-{end}")
+
+    with_retries(attempt, cancel)
+
+def fetch_stream(url, output_path, cancel, response=None):
+    """Download url with one request per attempt, for servers that don't support ranges"""
+    def attempt():
+        nonlocal response
+        current, response = response, None
+        if current is None:
+            current = get(url)
+        with current, open(output_path, 'wb') as f:
+            for chunk in current.iter_content(chunk_size=CHUNK_BYTES):
+                check_cancel(cancel)
+                f.write(chunk)
+                BYTES_DOWNLOADED.inc(len(chunk))
+
+    with_retries(attempt, cancel)
+
+def probe(url, cancel):
+    """
+    Request the first part of url as a byte range
+    Returns (total size, open response). A server that supports ranges answers
+    206 with a Content-Range giving the size, which both probes Accept-Ranges and
+    Content-Length and already fetches the first part. Otherwise the total is
+    None and the response is the plain 200 stream of the whole file, or None
+    when the server refused the range (416 for an empty file).
+    """
+    def attempt():
+        try:
+            return get(url, (0, DOWNLOAD_PART_BYTES - 1))
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code == 416:
+                return None
+            raise
+
+    response = with_retries(attempt, cancel)
+    if response is None:
+        return None, None
+    match = CONTENT_RANGE_PATTERN.match(response.headers.get('Content-Range', ''))
+    if response.status_code == 206 and match and match.group(1) == '0':
+        return int(match.group(3)), response
+    if response.status_code == 206:
+        # A range answer without a usable size, start over with a plain request
+        response.close()
+        return None, None
+    return None, response
+
+def download_file(url, output_path, cancel=None):
+    """
+    Download url to output_path, fetching DOWNLOAD_CONNECTIONS byte ranges at
+    once over the shared session when the server supports ranges
+    The file is preallocated and every range is written at its own offset.
+    Failed ranges are retried; servers without range support get a single
+    streamed request. cancel is checked between chunks.
+    """
+    total, response = probe(url, cancel)
+    if total is None:
+        fetch_stream(url, output_path, cancel, response)
+        return
+
+    parts = [(start, min(total, start + DOWNLOAD_PART_BYTES) - 1)
+             for start in range(0, total, DOWNLOAD_PART_BYTES)]
+    # Lets the other ranges stop early once one of them has failed
+    stop = CancelToken()
+    fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if hasattr(os, 'posix_fallocate') and total:
+            os.posix_fallocate(fd, 0, total)
+        else:
+            os.ftruncate(fd, total)
+
+        if len(parts) == 1:
+            fetch_range(url, fd, 0, parts[0][1], cancel, stop, response)
+            return
+
+        with ThreadPoolExecutor(max_workers=min(DOWNLOAD_CONNECTIONS, len(parts))) as pool:
+            futures = [pool.submit(fetch_range, url, fd, start, end, cancel, stop, response if not i else None)
+                       for i, (start, end) in enumerate(parts)]
+            done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+            failed = [future for future in futures if future in done and future.exception() is not None]
+            if failed:
+                stop.cancel('download failed')
+                for future in futures:
+                    future.cancel()
+        if failed:
+            # Prefer the job's own cancellation, then the error that stopped the download
+            check_cancel(cancel)
+            raise failed[0].exception()
+    finally:
+        os.close(fd)
+        # The first range closes the probe response itself unless it never ran
+        response.close()
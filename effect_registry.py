@@ -0,0 +1,236 @@
+import inspect
+import time
+import numpy as np
+from collections import namedtuple
+from Ventageeffect import (
+    vhs_process,
+    crt_process,
+    film_grain_process,
+    old_movie_process,
+    light_leak_process,
+    sepia_process,
+    glitch_process,
+    vintage_color_process,
+    process_video_fanout,
+    process_video_frames,
+    fused_steps_process,
+    apply_vhs_effect,
+    apply_crt_scanlines,
+    apply_film_grain,
+    apply_old_movie,
+    apply_light_leak,
+    apply_sepia,
+    apply_glitch,
+    apply_vintage_color,
+    apply_frame,
+    POINTWISE_STAGES
+)
+from lazy_imports import lazy_import, load_modules
+from media_probe import ffmpeg_binary, probe_media
+
+cv2 = lazy_import('cv2')
+
+# An effect entry: the whole-video function used by the endpoints, the per-frame
+# function it wraps, the parameters it accepts, its measured cost and its peak
+# memory in full frames (frame size x 3 bytes), cached maps and overlays included
+Effect = namedtuple('Effect', ['name', 'description', 'apply', 'process_frame', 'params', 'cost_ms_per_mp',
+                               'peak_frames'])
+
+# Parameters shared by every effect
+INTENSITY_PARAM = {'type': 'float', 'min': 0.0, 'max': 1.0, 'default': 0.5}
+SEED_PARAM = {'type': 'int', 'min': 0, 'default': None}
+TARGET_FPS_PARAM = {'type': 'float', 'min': 1.0, 'default': None}
+EFFECT_PARAMS = {'intensity': INTENSITY_PARAM, 'seed': SEED_PARAM, 'target_fps': TARGET_FPS_PARAM}
+
+# Decode, color conversion and the two encode passes of process_video_frames,
+# paid once per effect step on top of the effect itself
+PIPELINE_COST_MS_PER_MP = 25.0
+
+# Full frames process_video_frames holds besides the effect (decoded, RGB,
+# processed and BGR frames and the writer's buffers), and the peak of the final
+# x264 encode, mostly its lookahead, in frames of the output size (measured with
+# the balanced profile on 1080p)
+PIPELINE_FRAMES = 6
+ENCODE_FRAMES = 60
+
+# Input and output frames of the two ring slots per frame worker
+RING_FRAMES_PER_WORKER = 4
+
+# Per-frame costs were measured on 1280x720 frames on a single core, using
+# intensity 1.0 for the effects whose work grows with intensity, and peak
+# memory with tracemalloc on the same frames
+EFFECTS = {
+    'vhs': Effect('vhs', 'VHS glitch overlay effect', apply_vhs_effect, vhs_process,
+                  EFFECT_PARAMS, 103.0, 12),
+    'crt': Effect('crt', 'CRT scan lines effect', apply_crt_scanlines, crt_process,
+                  EFFECT_PARAMS, 9.0, 5),
+    'film_grain': Effect('film_grain', '8mm film grain overlay', apply_film_grain, film_grain_process,
+                         EFFECT_PARAMS, 91.0, 9),
+    'old_movie': Effect('old_movie', 'Old movie projector effect', apply_old_movie, old_movie_process,
+                        EFFECT_PARAMS, 106.0, 11),
+    'light_leak': Effect('light_leak', 'Vintage light leak effect', apply_light_leak, light_leak_process,
+                         EFFECT_PARAMS, 6.0, 6),
+    'sepia': Effect('sepia', 'Sepia tone effect', apply_sepia, sepia_process,
+                    EFFECT_PARAMS, 107.0, 3),
+    'glitch': Effect('glitch', 'Digital glitch effect', apply_glitch, glitch_process,
+                     EFFECT_PARAMS, 3.0, 2),
+    'vintage_color': Effect('vintage_color', 'Vintage color grading', apply_vintage_color, vintage_color_process,
+                            EFFECT_PARAMS, 79.0, 4)
+}
+
+def get_effect(name):
+    """Return the registered effect called name, or None"""
+    return EFFECTS.get(name)
+
+def describe_effects(details=False):
+    """Describe every registered effect, optionally with its parameters and cost"""
+    if not details:
+        return {name: effect.description for name, effect in EFFECTS.items()}
+
+    return {
+        name: {
+            'description': effect.description,
+            'params': effect.params,
+            'cost_ms_per_mp': effect.cost_ms_per_mp,
+            'peak_frames': effect.peak_frames
+        }
+        for name, effect in EFFECTS.items()
+    }
+
+def parse_effect(effect_data):
+    """Turn "name", "name:intensity" or {"name": ..., "intensity": ...} into (name, intensity)"""
+    if isinstance(effect_data, str):
+        effect_name, intensity = effect_data.split(':') if ':' in effect_data else (effect_data, 0.5)
+    else:
+        effect_name = effect_data.get('name', 'vhs')
+        intensity = effect_data.get('intensity', 0.5)
+    return effect_name, float(intensity)
+
+def apply_effect_by_name(effect_name, input_path, output_path, intensity=0.5, seed=None, target_fps=None, cancel=None,
+                         checkpoint_dir=None, quality=None, encoder=None):
+    """
+    Look up effect_name in the registry and apply it to a whole video, optionally at a reduced frame rate
+    With checkpoint_dir the output is written in resumable segments, and with a
+    QualityController as quality it is rendered at lower quality where needed
+    to meet a deadline. encoder names the encoder profile (see process_video_frames).
+    """
+    effect = get_effect(effect_name)
+    if effect is None:
+        raise ValueError(f"Unknown effect: {effect_name}")
+    effect.apply(input_path, output_path, intensity, seed, target_fps, cancel=cancel, checkpoint_dir=checkpoint_dir,
+                 quality=quality, encoder=encoder)
+
+def step_seed(seed, step):
+    """Seed for one step of an effect chain, so chained effects draw independent streams"""
+    return [seed, step]
+
+def chain_seed(seed=None):
+    """The seed step_seed derives a chain's step seeds from, fresh entropy when seed is None"""
+    return np.random.SeedSequence().entropy if seed is None else seed
+
+def frame_steps(chain, seed=None, single=False, first_step=0):
+    """
+    Per-frame steps (process_frame, seed, kwargs) for process_video_fanout that
+    render what apply_effect_by_name does for a single effect, or what a chain of
+    apply_effect_by_name calls seeded with step_seed does
+    first_step is the position of chain's first effect in a longer chain.
+    """
+    steps = []
+    if not single:
+        seed = chain_seed(seed)
+    for step, (effect_name, intensity) in enumerate(chain, first_step):
+        effect = get_effect(effect_name)
+        if effect is None:
+            raise ValueError(f"Unknown effect: {effect_name}")
+        effect_seed = seed if single else step_seed(seed, step)
+        kwargs = {'intensity': intensity}
+        # apply_light_leak places its leaks from the seed rather than a per-frame stream
+        if effect_name == 'light_leak':
+            kwargs['leak_seed'] = 1 if effect_seed is None else effect_seed
+        steps.append((effect.process_frame, effect_seed, kwargs))
+    return steps
+
+def is_pointwise(effect_name):
+    """Whether an effect's frame function is a list of pointwise stages that can be fused with its neighbours"""
+    return EFFECTS[effect_name].process_frame in POINTWISE_STAGES
+
+def apply_fused_by_name(chain, input_path, output_path, seed=None, first_step=0, target_fps=None, cancel=None,
+                        checkpoint_dir=None, quality=None, encoder=None):
+    """
+    Apply consecutive pointwise effects of a chain starting at first_step in a
+    single pass per frame, with one decode and encode instead of one per effect
+    The steps draw the random streams of step_seed like apply_effect_by_name in
+    a chain. Takes the other arguments of apply_effect_by_name.
+    """
+    steps = [(func.__name__, effect_seed, kwargs) for func, effect_seed, kwargs
+             in frame_steps(chain, seed, first_step=first_step)]
+    process_video_frames(input_path, output_path, fused_steps_process, seed=seed, target_fps=target_fps,
+                         cancel=cancel, checkpoint_dir=checkpoint_dir, quality=quality, encoder=encoder, steps=steps)
+
+def apply_fanout_by_name(input_path, outputs, audio=True, effect_ranges=None, cancel=None, encoder=None):
+    """Decode input_path once and render every (output path, chain, single, seed) in outputs"""
+    process_video_fanout(input_path, [(output_path, frame_steps(chain, seed, single))
+                                      for output_path, chain, single, seed in outputs],
+                         audio=audio, effect_ranges=effect_ranges, cancel=cancel, encoder=encoder)
+
+# Helper function to read the container metadata needed for cost estimation,
+# from the probe the job's other metadata lookups share
+def probe_video(input_path):
+    metadata = probe_media(input_path)
+    if metadata['video_codec'] is None:
+        raise Exception("Could not open video file")
+    return metadata
+
+def step_cost(effect_name):
+    """Estimated milliseconds per megapixel-frame of one effect step, pipeline included"""
+    return EFFECTS[effect_name].cost_ms_per_mp + PIPELINE_COST_MS_PER_MP
+
+def estimate_job_cost(metadata, effect_names, target_fps=None):
+    """Estimate the seconds needed to run a chain of effects: frames x megapixels x chain cost"""
+    megapixels = metadata['width'] * metadata['height'] / 1e6
+    chain_cost = sum(step_cost(name) for name in effect_names)
+    frame_count = metadata['frame_count']
+    # Frames dropped by a reduced frame rate are skipped before any work is done
+    if target_fps and metadata['fps'] and target_fps < metadata['fps']:
+        frame_count *= target_fps / metadata['fps']
+    return frame_count * megapixels * chain_cost / 1000.0
+
+def estimate_job_memory(metadata, chains, workers=1):
+    """
+    Estimate the peak bytes of rendering a video with each chain of effects
+    The steps of a chain run one after another, so its largest step counts; the
+    chains of a fan-out are rendered side by side from one decode. With workers
+    above 1 every frame worker runs the effect on its own. The final encode runs
+    after the frames, so it only counts when it is larger.
+    """
+    frame_bytes = metadata['width'] * metadata['height'] * 3
+    chain_frames = [max(EFFECTS[name].peak_frames for name in chain) for chain in chains if chain]
+    effect_frames = sum(chain_frames)
+    if workers > 1:
+        effect_frames = workers * (effect_frames + RING_FRAMES_PER_WORKER)
+    return frame_bytes * max(PIPELINE_FRAMES + effect_frames, ENCODE_FRAMES)
+
+def warm_up(frame_size=(64, 36)):
+    """
+    Load the video backends and run every effect once on a small frame, so the
+    first job doesn't pay for the imports and first-call setup. Call it before
+    forking (gunicorn --preload) and every worker shares the loaded modules.
+    """
+    start = time.perf_counter()
+    load_modules()
+    ffmpeg_binary()
+
+    # Keep OpenCV from starting its thread pool in a process that will fork:
+    # forked children don't inherit the threads but would inherit their locks
+    threads = cv2.getNumThreads()
+    cv2.setNumThreads(0)
+    try:
+        width, height = frame_size
+        frame = np.zeros((height, width, 3), dtype=np.uint8)
+        job_seed = np.random.SeedSequence(0)
+        for process_frame, _, kwargs in frame_steps([(name, 0.5) for name in EFFECTS], seed=0, single=True):
+            pass_rng = 'rng' in inspect.signature(process_frame).parameters
+            apply_frame(process_frame, frame.copy(), kwargs, job_seed, 0, pass_rng)
+    finally:
+        cv2.setNumThreads(threads)
+    print(f"Warmed up the video backends in {time.perf_counter() - start:.2f}s")
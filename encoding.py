@@ -0,0 +1,65 @@
+import os
+
+# Named encoder profiles for the final H.264 encode of every output. All of
+# them produce yuv420p H.264, so outputs stay playable everywhere and rendered
+# spans can be joined with the copied parts of a time-ranged source.
+# - fast: a much quicker preset at the same quality target, larger files
+# - balanced: x264's defaults, as outputs with audio were encoded before
+# - archive: a slower preset and higher quality, keeping fine grain and noise,
+#   at larger files
+ENCODER_PROFILES = {
+    'fast': {
+        'codec': 'libx264',
+        'preset': 'veryfast',
+        'crf': 23,
+        'pix_fmt': 'yuv420p',
+        'faststart': True
+    },
+    'balanced': {
+        'codec': 'libx264',
+        'preset': 'medium',
+        'crf': 23,
+        'pix_fmt': 'yuv420p',
+        'faststart': True
+    },
+    'archive': {
+        'codec': 'libx264',
+        'preset': 'slow',
+        'crf': 18,
+        'pix_fmt': 'yuv420p',
+        'faststart': True
+    }
+}
+
+# Profile used when a request doesn't name one
+ENCODER_PROFILE = os.environ.get('ENCODER_PROFILE', 'balanced')
+
+# Encoder threads of every profile (0 lets x264 pick, about 1.5 per core).
+# With several gunicorn workers encoding at once, a lower count avoids
+# oversubscribing the cores.
+ENCODER_THREADS = int(os.environ.get('ENCODER_THREADS', 0))
+
+def encoder_name(name=None):
+    """The profile name to use for a request's encoder value, raising ValueError for unknown names"""
+    name = name or ENCODER_PROFILE
+    if name not in ENCODER_PROFILES:
+        raise ValueError(f"Unknown encoder profile: {name} (choose from {', '.join(ENCODER_PROFILES)})")
+    return name
+
+def video_args(encoder=None, frame_size=None):
+    """
+    ffmpeg output arguments encoding the video stream with a profile
+    x264 only takes yuv420p at even frame sizes; odd sizes keep the pixel
+    format ffmpeg picks.
+    """
+    profile = ENCODER_PROFILES[encoder_name(encoder)]
+    args = ['-c:v', profile['codec'], '-preset', profile['preset'], '-crf', str(profile['crf']),
+            '-threads', str(profile.get('threads', ENCODER_THREADS))]
+    if frame_size is None or (frame_size[0] % 2 == 0 and frame_size[1] % 2 == 0):
+        args += ['-pix_fmt', profile['pix_fmt']]
+    return args
+
+def container_args(encoder=None):
+    """ffmpeg output arguments for the MP4 container, moving the index to the front for faststart profiles"""
+    profile = ENCODER_PROFILES[encoder_name(encoder)]
+    return ['-movflags', '+faststart'] if profile['faststart'] else []
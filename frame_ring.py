@@ -0,0 +1,157 @@
+import os
+import queue
+import time
+import numpy as np
+from multiprocessing import get_context, shared_memory
+
+# How frame worker processes are started. "spawn" avoids forking a process
+# that already runs OpenCV and server threads.
+FRAME_WORKER_START_METHOD = os.environ.get('FRAME_WORKER_START_METHOD', 'spawn')
+
+# Seconds to wait for a processed frame before checking the workers are alive
+WORKER_POLL_SECONDS = 1.0
+
+class FrameRing:
+    """
+    Fixed ring of frame slots in shared memory
+
+    Each slot holds an input frame (written by the decoder) and an output frame
+    (written by a worker), both as NumPy views on the same shared block, so frames
+    are never pickled: only slot numbers travel between processes. The creating
+    process owns the block and must call close() to unlink it; workers attach by
+    name and only close their own mapping.
+    """
+
+    def __init__(self, slot_count, frame_shape, name=None):
+        self.slot_count = slot_count
+        self.frame_shape = tuple(frame_shape)
+        self.frame_bytes = int(np.prod(self.frame_shape))
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=slot_count * 2 * self.frame_bytes)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.frames = np.ndarray((slot_count, 2) + self.frame_shape, dtype=np.uint8, buffer=self.memory.buf)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def input_frame(self, slot):
+        return self.frames[slot, 0]
+
+    def output_frame(self, slot):
+        return self.frames[slot, 1]
+
+    def close(self):
+        # Views must be dropped before the mapping can be closed
+        self.frames = None
+        self.memory.close()
+        if self.owner:
+            try:
+                self.memory.unlink()
+            except FileNotFoundError:
+                pass
+
+def frame_worker(ring_name, slot_count, frame_shape, process_frame_func, kwargs, job_seed, pass_rng, tasks, done):
+    """
+    Worker process loop: take (slot, sequence, frame index, working scale) tasks,
+    run the effect on the slot's input frame and write the result to the slot's
+    output frame
+    Reports (slot, sequence, effect seconds, convert seconds, error) for every
+    task and stops at a None task.
+    """
+    import cv2
+    from Ventageeffect import apply_frame
+
+    ring = FrameRing(slot_count, frame_shape, name=ring_name)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            slot, sequence, frame_index, scale = task
+            try:
+                stage_start = time.perf_counter()
+                frame_rgb = cv2.cvtColor(ring.input_frame(slot), cv2.COLOR_BGR2RGB)
+                convert_seconds = time.perf_counter() - stage_start
+
+                stage_start = time.perf_counter()
+                processed_frame = apply_frame(process_frame_func, frame_rgb, kwargs, job_seed, frame_index, pass_rng,
+                                              scale)
+                effect_seconds = time.perf_counter() - stage_start
+
+                stage_start = time.perf_counter()
+                if processed_frame.shape != ring.frame_shape:
+                    raise Exception(f"Effect changed the frame shape to {processed_frame.shape}")
+                cv2.cvtColor(processed_frame, cv2.COLOR_RGB2BGR, dst=ring.output_frame(slot))
+                convert_seconds += time.perf_counter() - stage_start
+                done.put((slot, sequence, effect_seconds, convert_seconds, None))
+            except Exception as e:
+                done.put((slot, sequence, 0.0, 0.0, str(e)))
+    finally:
+        ring.close()
+
+class FrameWorkers:
+    """A pool of frame_worker processes sharing one FrameRing"""
+
+    def __init__(self, workers, frame_shape, process_frame_func, kwargs, job_seed, pass_rng, slot_count=None):
+        context = get_context(FRAME_WORKER_START_METHOD)
+        # Two slots per worker keep every worker busy while the decoder fills
+        # the next frames and the encoder drains finished ones
+        self.ring = FrameRing(slot_count or 2 * workers + 2, frame_shape)
+        self.free_slots = list(range(self.ring.slot_count))
+        self.tasks = context.Queue()
+        self.done = context.Queue()
+        self.processes = [
+            context.Process(target=frame_worker, daemon=True,
+                            args=(self.ring.name, self.ring.slot_count, self.ring.frame_shape, process_frame_func,
+                                  kwargs, job_seed, pass_rng, self.tasks, self.done))
+            for _ in range(workers)
+        ]
+        try:
+            for process in self.processes:
+                process.start()
+        except Exception:
+            self.close()
+            raise
+
+    def acquire(self):
+        """Take a free slot, or None when every slot is in flight"""
+        return self.free_slots.pop() if self.free_slots else None
+
+    def release(self, slot):
+        self.free_slots.append(slot)
+
+    def submit(self, slot, sequence, frame_index, scale=1.0):
+        self.tasks.put((slot, sequence, frame_index, scale))
+
+    def result(self):
+        """Wait for the next processed frame, failing if a worker died"""
+        while True:
+            try:
+                slot, sequence, effect_seconds, convert_seconds, error = self.done.get(timeout=WORKER_POLL_SECONDS)
+            except queue.Empty:
+                dead = [process.exitcode for process in self.processes if not process.is_alive()]
+                if dead:
+                    raise Exception(f"Frame worker exited with code {dead[0]}")
+                continue
+            if error is not None:
+                raise Exception(f"Frame worker failed: {error}")
+            return slot, sequence, effect_seconds, convert_seconds
+
+    def close(self):
+        """Stop the workers and free the shared memory, also after a failure"""
+        for process in self.processes:
+            if process.is_alive():
+                self.tasks.put(None)
+        for process in self.processes:
+            if process.pid is None:
+                continue
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.tasks.close()
+        self.done.close()
+        self.ring.close()
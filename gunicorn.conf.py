@@ -0,0 +1,26 @@
+# Gunicorn settings shared by every deployment, loaded with -c gunicorn.conf.py
+# (bind address and worker count are passed on the command line by deploy.sh)
+import os
+
+# The video backends (OpenCV, moviepy) are imported on first use.
+# WARM_UP_BACKENDS=1 loads them and runs every effect once before any request:
+# with --preload this happens once in the master and the forked workers share
+# the loaded pages, otherwise each worker warms itself up after booting.
+WARM_UP_BACKENDS = os.environ.get('WARM_UP_BACKENDS', '0') == '1'
+
+def when_ready(server):
+    """Warm up the preloaded app in the master, before the workers are forked"""
+    if WARM_UP_BACKENDS and server.cfg.preload_app:
+        from effect_registry import warm_up
+        warm_up()
+
+def post_worker_init(worker):
+    """Without --preload every worker loads the app itself, so warm it up there"""
+    if WARM_UP_BACKENDS and not worker.cfg.preload_app:
+        from effect_registry import warm_up
+        warm_up()
+
+def child_exit(server, worker):
+    """Drop the live metrics of a worker that exited so /metrics stays accurate"""
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid)
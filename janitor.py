@@ -0,0 +1,265 @@
+import fcntl
+import heapq
+import os
+import shutil
+import threading
+import time
+
+from metrics import (
+    JANITOR_BYTES_FREED,
+    JANITOR_DELETED,
+    JANITOR_OUTPUT_BYTES,
+    JANITOR_SCAN_SECONDS,
+    JANITOR_TRACKED_FILES
+)
+
+class Janitor:
+    """
+    Background cleanup of temporary files, job workspaces and served outputs
+
+    Instead of listing the folders after every request, the janitor keeps an
+    in-memory index of the entries it knows about with a heap ordered by expiry
+    time, so each pass only looks at what is due. A full rescan every
+    rescan_interval seconds picks up files written by other worker processes.
+    Served outputs also count against an optional disk quota: when it is
+    exceeded the least recently served outputs are evicted first.
+
+    With several gunicorn workers every process runs a janitor thread, but only
+    the one holding the lock file does any work. The other workers don't index
+    what they write either, since nothing would expire it from their index; the
+    leader picks it up in its next rescan.
+
+    A job workspace whose workspace_lock file is locked belongs to a running job
+    and is never expired, however old it looks.
+    """
+
+    def __init__(self, folders, output_folder, max_age=3600, quota_bytes=0,
+                 interval=30, rescan_interval=300, workspace_lock=None):
+        self.folders = list(dict.fromkeys(folders + [output_folder]))
+        self.output_folder = output_folder
+        self.max_age = max_age
+        self.quota_bytes = quota_bytes
+        self.interval = interval
+        self.rescan_interval = rescan_interval
+        self.workspace_lock = workspace_lock
+
+        # path -> [mtime, size, last access]; the heap holds (expires at, path)
+        # and may contain outdated entries, which are skipped when popped
+        self.entries = {}
+        self.expiry_heap = []
+        self.output_bytes = 0
+        self.lock = threading.Lock()
+        self.last_rescan = 0
+        self.lock_file = None
+        self.pid = None
+
+    def ensure_running(self):
+        """Start the janitor thread in this process if it isn't running yet (safe after fork)"""
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            # Forget anything inherited from the parent process
+            self.entries, self.expiry_heap, self.output_bytes = {}, [], 0
+            self.lock_file, self.last_rescan = None, 0
+        thread = threading.Thread(target=self.run, name='janitor', daemon=True)
+        thread.start()
+
+    def track(self, path):
+        """Add or refresh an entry right after it was written"""
+        if self.lock_file is None:
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self.lock:
+            self._index(path, stat.st_mtime, self._size(path, stat), stat.st_atime)
+
+    def touch(self, path):
+        """Record that an output was just served, for the LRU eviction order"""
+        now = time.time()
+        try:
+            # Store the access time on disk so every worker's janitor sees it
+            os.utime(path, (now, os.stat(path).st_mtime))
+        except OSError:
+            return
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None:
+                entry[2] = now
+
+    def run(self):
+        while True:
+            try:
+                if self._is_leader():
+                    self.run_once()
+            except Exception as e:
+                print(f"Error during cleanup: {str(e)}")
+            time.sleep(self.interval)
+
+    def run_once(self, now=None):
+        """One janitor pass: rescan if due, expire old entries, then enforce the quota"""
+        now = now if now is not None else time.time()
+        if now - self.last_rescan >= self.rescan_interval:
+            self.rescan()
+            self.last_rescan = now
+        self.expire(now)
+        self.enforce_quota()
+
+    def rescan(self):
+        """Rebuild the index from disk"""
+        start = time.perf_counter()
+        entries = {}
+        for folder in self.folders:
+            try:
+                names = os.listdir(folder)
+            except FileNotFoundError:
+                continue
+            for name in names:
+                # Skip hidden files such as the janitor's own lock file
+                if name.startswith('.'):
+                    continue
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if os.path.isfile(path) or name.startswith('job_'):
+                    entries[path] = [stat.st_mtime, self._size(path, stat), stat.st_atime]
+
+        with self.lock:
+            self.entries = {}
+            self.expiry_heap = []
+            self.output_bytes = 0
+            for path, (mtime, size, atime) in entries.items():
+                self._index(path, mtime, size, atime)
+        JANITOR_SCAN_SECONDS.observe(time.perf_counter() - start)
+        self._update_gauges()
+
+    def expire(self, now):
+        """Delete every entry older than max_age"""
+        cutoff = now - self.max_age
+        while True:
+            with self.lock:
+                if not self.expiry_heap or self.expiry_heap[0][0] > now:
+                    break
+                expires_at, path = heapq.heappop(self.expiry_heap)
+                entry = self.entries.get(path)
+                # Skip heap records superseded by a newer mtime
+                if entry is None or entry[0] + self.max_age != expires_at:
+                    continue
+
+            # Check the disk in case the file was rewritten by another process
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                self._forget(path)
+                continue
+            if mtime > cutoff:
+                self.track(path)
+                continue
+            self._expire_entry(path, now)
+        self._update_gauges()
+
+    def _expire_entry(self, path, now):
+        """Delete an expired entry, unless it is the workspace of a running job"""
+        lock_path = os.path.join(path, self.workspace_lock) if self.workspace_lock else None
+        if lock_path is None or not os.path.isfile(lock_path):
+            self._delete(path, 'expired')
+            return
+        with open(lock_path, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Still running: look again once another max_age has passed
+                with self.lock:
+                    entry = self.entries.get(path)
+                    if entry is not None:
+                        self._index(path, now, entry[1], entry[2])
+                return
+            # Holding the lock keeps the job from being restarted in it meanwhile
+            self._delete(path, 'expired')
+
+    def enforce_quota(self):
+        """Evict the least recently served outputs until the output folder fits the quota"""
+        if not self.quota_bytes:
+            return
+        with self.lock:
+            if self.output_bytes <= self.quota_bytes:
+                return
+            outputs = sorted((entry[2], path) for path, entry in self.entries.items()
+                             if self._is_output(path))
+        for _, path in outputs:
+            if self.output_bytes <= self.quota_bytes:
+                break
+            self._delete(path, 'evicted')
+        self._update_gauges()
+
+    def _is_leader(self):
+        if self.lock_file is not None:
+            return True
+        lock_file = open(os.path.join(self.output_folder, '.janitor.lock'), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self.lock_file = lock_file
+        return True
+
+    def _is_output(self, path):
+        return os.path.dirname(path) == self.output_folder
+
+    def _size(self, path, stat):
+        if not os.path.isdir(path):
+            return stat.st_size
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def _index(self, path, mtime, size, atime):
+        # Caller holds self.lock
+        previous = self.entries.get(path)
+        if previous is not None and self._is_output(path):
+            self.output_bytes -= previous[1]
+        self.entries[path] = [mtime, size, atime]
+        if self._is_output(path):
+            self.output_bytes += size
+        heapq.heappush(self.expiry_heap, (mtime + self.max_age, path))
+
+    def _forget(self, path):
+        with self.lock:
+            entry = self.entries.pop(path, None)
+            if entry is not None and self._is_output(path):
+                self.output_bytes -= entry[1]
+        return entry
+
+    def _delete(self, path, reason):
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            print(f"Deleted ({reason}): {path}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Could not delete {path}: {str(e)}")
+            return
+        entry = self._forget(path)
+        JANITOR_DELETED.labels(reason=reason).inc()
+        if entry is not None:
+            JANITOR_BYTES_FREED.labels(reason=reason).inc(entry[1])
+
+    def _update_gauges(self):
+        with self.lock:
+            JANITOR_TRACKED_FILES.set(len(self.entries))
+            JANITOR_OUTPUT_BYTES.set(self.output_bytes)
@@ -0,0 +1,37 @@
+import importlib
+import importlib.util
+import sys
+
+# Heavy video backends that lazy_import defers and warm_up loads up front
+BACKEND_MODULES = (
+    'cv2',
+    'moviepy.video.io.VideoFileClip',
+    'moviepy.audio.io.AudioFileClip'
+)
+
+def lazy_import(name):
+    """
+    Return a module that is only executed when one of its attributes is first used
+
+    Lets modules keep their usual "cv2.something" calls while importing them stays
+    cheap, so a worker that only lists effects or serves files never loads the
+    video backends. Once loaded, attribute access is as fast as a normal import.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named '{name}'")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+def load_modules(names=BACKEND_MODULES):
+    """Fully import the given modules now, including the ones deferred by lazy_import"""
+    for name in names:
+        module = importlib.import_module(name)
+        # Touching an attribute finishes loading a lazy module
+        getattr(module, '__name__')
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import re
+import subprocess
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from metrics import PROBE_CACHE
+
+# Probed inputs remembered per worker process, keyed by file_fingerprint, so the
+# admission check, the audio decision and the time-range planning of a job (and
+# later jobs on the same source) share one ffmpeg run
+PROBE_CACHE_SIZE = int(os.environ.get('PROBE_CACHE_SIZE', 256))
+
+DURATION_PATTERN = re.compile(r'Duration: (\d+):(\d+):([\d.]+)')
+STREAM_PATTERN = re.compile(r'Stream #\d+:\d+.*?: (Video|Audio|Subtitle|Data): (\w+)(.*)')
+SIZE_PATTERN = re.compile(r', (\d+)x(\d+)')
+FPS_PATTERN = re.compile(r', ([\d.]+)(k?) (?:fps|tbr)')
+
+probe_cache = OrderedDict()
+probe_cache_lock = threading.Lock()
+
+@lru_cache(maxsize=None)
+def ffmpeg_binary():
+    """The ffmpeg binary moviepy uses, looked up on first use since importing moviepy is slow"""
+    from moviepy.config import get_setting
+    return get_setting('FFMPEG_BINARY')
+
+def file_fingerprint(path, sample_bytes=1024 * 1024):
+    """Size and hash of the first and last MB of a file, enough to tell a re-sent input from another one"""
+    size = os.path.getsize(path)
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        digest.update(f.read(sample_bytes))
+        if size > sample_bytes:
+            f.seek(max(sample_bytes, size - sample_bytes))
+            digest.update(f.read(sample_bytes))
+    return {'size': size, 'sha1': digest.hexdigest()}
+
+def parse_stream_summary(info):
+    """Read the metadata of probe_media from the stream summary ffmpeg -i prints"""
+    duration = DURATION_PATTERN.search(info)
+    metadata = {
+        'duration': int(duration.group(1)) * 3600 + int(duration.group(2)) * 60 + float(duration.group(3)) if duration else None,
+        'streams': [],
+        'video_codec': None,
+        'audio_codec': None,
+        'width': 0,
+        'height': 0,
+        'fps': 0.0,
+        'frame_count': 0
+    }
+    for match in STREAM_PATTERN.finditer(info):
+        kind, codec, details = match.group(1).lower(), match.group(2), match.group(3)
+        metadata['streams'].append({'type': kind, 'codec': codec})
+        if kind == 'video' and metadata['video_codec'] is None:
+            metadata['video_codec'] = codec
+            size = SIZE_PATTERN.search(details)
+            fps = FPS_PATTERN.search(details)
+            if size:
+                metadata['width'], metadata['height'] = int(size.group(1)), int(size.group(2))
+            if fps:
+                metadata['fps'] = float(fps.group(1)) * (1000 if fps.group(2) else 1)
+        elif kind == 'audio' and metadata['audio_codec'] is None:
+            metadata['audio_codec'] = codec
+    # The summary has no frame count; the container's duration and rate give it
+    if metadata['duration'] and metadata['fps']:
+        metadata['frame_count'] = int(round(metadata['duration'] * metadata['fps']))
+    metadata['has_audio'] = metadata['audio_codec'] is not None
+    return metadata
+
+def probe_media(input_path):
+    """
+    Streams, duration, frame rate, frame count and frame size of a video, from
+    a single ffmpeg run per distinct input
+    Results are cached by the input's fingerprint, so the same bytes at another
+    path (a retried or re-sent source) are a cache hit too. A file ffmpeg can't
+    read has no video_codec. The returned dict is shared, don't modify it.
+    """
+    key = tuple(file_fingerprint(input_path).values())
+    with probe_cache_lock:
+        metadata = probe_cache.get(key)
+        if metadata is not None:
+            probe_cache.move_to_end(key)
+            PROBE_CACHE.labels(result='hit').inc()
+            return metadata
+    PROBE_CACHE.labels(result='miss').inc()
+
+    result = subprocess.run([ffmpeg_binary(), '-hide_banner', '-i', input_path],
+                            capture_output=True, text=True)
+    metadata = parse_stream_summary(result.stderr)
+    with probe_cache_lock:
+        probe_cache[key] = metadata
+        while len(probe_cache) > PROBE_CACHE_SIZE:
+            probe_cache.popitem(last=False)
+    return metadata
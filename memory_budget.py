@@ -0,0 +1,172 @@
+import fcntl
+import json
+import math
+import os
+import time
+
+from cancellation import check_cancel
+from metrics import MEMORY_ADMITTED_BYTES, MEMORY_QUEUED_JOBS, MEMORY_WORKER_RSS, observe_stage
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+def process_rss(pid):
+    """Resident set size of a process in bytes, or None if it can't be read"""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class MemoryScheduler:
+    """
+    Host-wide memory budget for the processing jobs of every worker process
+
+    Each job is admitted with an estimate of its peak memory. The admitted jobs,
+    the queue of waiting jobs and the idle RSS of every worker process are kept
+    in a ledger file that all gunicorn workers update under a file lock. A
+    worker's use counts as the larger of its admitted estimates and its RSS
+    above its idle RSS, so a job that needs more than estimated holds back the
+    next ones. Waiting jobs are admitted in arrival order once they fit.
+    Entries of worker processes that died are dropped.
+    """
+
+    def __init__(self, ledger_path, budget_bytes=0, poll_interval=0.5):
+        self.ledger_path = ledger_path
+        self.budget_bytes = budget_bytes
+        self.poll_interval = poll_interval
+
+    def key(self, job_id):
+        return f"{os.getpid()}:{job_id}"
+
+    def fits_budget(self, estimated_bytes):
+        """Whether a job could ever be admitted, i.e. fits an otherwise idle host"""
+        return not self.budget_bytes or estimated_bytes <= self.budget_bytes
+
+    def _update(self, change):
+        """Run change(ledger) on the ledger under the file lock, saving the ledger and returning the result"""
+        with open(self.ledger_path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    ledger = json.loads(f.read() or '{}')
+                except ValueError:
+                    ledger = {}
+                ledger.setdefault('workers', {})
+                ledger.setdefault('jobs', {})
+                ledger.setdefault('queue', [])
+                self._prune(ledger)
+                result = change(ledger)
+                f.seek(0)
+                f.truncate()
+                json.dump(ledger, f)
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _prune(self, ledger):
+        """Drop the entries of dead worker processes and refresh this worker's idle RSS"""
+        alive = {}
+        def is_alive(pid):
+            if pid not in alive:
+                alive[pid] = process_alive(int(pid))
+            return alive[pid]
+        ledger['jobs'] = {key: job for key, job in ledger['jobs'].items() if is_alive(job['pid'])}
+        ledger['queue'] = [entry for entry in ledger['queue'] if is_alive(entry['pid'])]
+        ledger['workers'] = {pid: rss for pid, rss in ledger['workers'].items() if is_alive(pid)}
+
+        pid = str(os.getpid())
+        rss = process_rss(pid)
+        if rss is not None:
+            MEMORY_WORKER_RSS.set(rss)
+            if not any(job['pid'] == pid for job in ledger['jobs'].values()):
+                ledger['workers'][pid] = rss
+
+    def used_bytes(self, ledger):
+        """Memory taken by the admitted jobs: per worker, its estimates or its RSS growth, whichever is larger"""
+        estimates = {}
+        for job in ledger['jobs'].values():
+            estimates[job['pid']] = estimates.get(job['pid'], 0) + job['bytes']
+        used = 0
+        for pid, estimate in estimates.items():
+            rss, idle_rss = process_rss(pid), ledger['workers'].get(pid)
+            growth = rss - idle_rss if rss is not None and idle_rss is not None else 0
+            used += max(estimate, growth)
+        return used
+
+    def _try_admit(self, ledger, key, estimated_bytes, estimated_seconds):
+        queue = ledger['queue']
+        if not any(entry['key'] == key for entry in queue):
+            queue.append({'key': key, 'pid': str(os.getpid()), 'bytes': estimated_bytes, 'since': time.time()})
+        # First come, first served, so large jobs aren't overtaken forever
+        if queue[0]['key'] != key:
+            return False
+        if ledger['jobs'] and self.used_bytes(ledger) + estimated_bytes > self.budget_bytes:
+            return False
+        queue.pop(0)
+        ledger['jobs'][key] = {'pid': str(os.getpid()), 'bytes': estimated_bytes,
+                               'seconds': estimated_seconds, 'admitted': time.time()}
+        return True
+
+    def _leave_queue(self, ledger, key):
+        ledger['queue'] = [entry for entry in ledger['queue'] if entry['key'] != key]
+
+    def _retry_after(self, ledger):
+        """Seconds until the first admitted job is expected to finish"""
+        now = time.time()
+        remaining = [job['admitted'] + job['seconds'] - now for job in ledger['jobs'].values()]
+        return max(1, int(math.ceil(min(remaining)))) if remaining else 1
+
+    def acquire(self, job_id, estimated_bytes, estimated_seconds=0.0, timeout=None, cancel=None):
+        """
+        Wait until the job fits the budget and admit it
+        Returns None once admitted, or the seconds to retry after when it was
+        still waiting after timeout seconds. Raises JobCancelled if the job is
+        cancelled while it waits.
+        """
+        if not self.budget_bytes:
+            return None
+        key = self.key(job_id)
+        start = time.monotonic()
+        queued = False
+        try:
+            while True:
+                if self._update(lambda ledger: self._try_admit(ledger, key, estimated_bytes, estimated_seconds)):
+                    MEMORY_ADMITTED_BYTES.inc(estimated_bytes)
+                    observe_stage('memory_queue', time.monotonic() - start)
+                    return None
+                if not queued:
+                    queued = True
+                    MEMORY_QUEUED_JOBS.inc()
+                    print(f"Job {job_id} waits for {estimated_bytes / 2**20:.0f} MB of memory")
+                check_cancel(cancel)
+                if timeout is not None and time.monotonic() - start >= timeout:
+                    def give_up(ledger):
+                        self._leave_queue(ledger, key)
+                        return self._retry_after(ledger)
+                    return self._update(give_up)
+                time.sleep(self.poll_interval)
+        except BaseException:
+            self._update(lambda ledger: self._leave_queue(ledger, key))
+            raise
+        finally:
+            if queued:
+                MEMORY_QUEUED_JOBS.dec()
+
+    def release(self, job_id):
+        """Return the memory of a finished job (nothing happens for jobs that weren't admitted)"""
+        if not self.budget_bytes:
+            return
+        key = self.key(job_id)
+        job = self._update(lambda ledger: ledger['jobs'].pop(key, None))
+        if job is not None:
+            MEMORY_ADMITTED_BYTES.dec(job['bytes'])
@@ -0,0 +1,154 @@
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    multiprocess
+)
+
+# With several gunicorn workers every process writes its samples to the
+# directory in PROMETHEUS_MULTIPROC_DIR and /metrics aggregates them
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+# Stage timings range from milliseconds (color conversion of a short clip)
+# to many minutes (effects on long 4K videos)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+STAGE_SECONDS = Histogram(
+    'vintage_stage_seconds',
+    'Time spent per job in each processing stage',
+    ['stage', 'effect'],
+    buckets=STAGE_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    'vintage_request_seconds',
+    'HTTP request latency by endpoint',
+    ['endpoint', 'method', 'status'],
+    buckets=STAGE_BUCKETS
+)
+REQUESTS = Counter(
+    'vintage_requests_total',
+    'HTTP requests by endpoint and status',
+    ['endpoint', 'method', 'status']
+)
+FRAMES_PROCESSED = Counter(
+    'vintage_frames_processed_total',
+    'Video frames processed by effect',
+    ['effect']
+)
+BYTES_PROCESSED = Counter(
+    'vintage_bytes_processed_total',
+    'Input video bytes processed by effect',
+    ['effect']
+)
+BYTES_DOWNLOADED = Counter(
+    'vintage_bytes_downloaded_total',
+    'Bytes downloaded from source video URLs'
+)
+DOWNLOAD_FAILURES = Counter(
+    'vintage_download_failures_total',
+    'Source video downloads that failed'
+)
+DOWNLOAD_RETRIES = Counter(
+    'vintage_download_retries_total',
+    'Source download requests retried after an error, per byte range or whole stream'
+)
+PROBE_CACHE = Counter(
+    'vintage_probe_cache_total',
+    'Input metadata lookups by result (hit, or miss that ran ffmpeg)',
+    ['result']
+)
+ACTIVE_JOBS = Gauge(
+    'vintage_active_jobs',
+    'Processing jobs currently running',
+    multiprocess_mode='livesum'
+)
+MEMORY_QUEUED_JOBS = Gauge(
+    'vintage_memory_queued_jobs',
+    'Jobs waiting for the memory budget to admit them',
+    multiprocess_mode='livesum'
+)
+MEMORY_ADMITTED_BYTES = Gauge(
+    'vintage_memory_admitted_bytes',
+    'Estimated peak memory of the admitted jobs',
+    multiprocess_mode='livesum'
+)
+MEMORY_WORKER_RSS = Gauge(
+    'vintage_memory_worker_rss_bytes',
+    'Resident memory of the worker processes, as of their last admission or release',
+    multiprocess_mode='livesum'
+)
+JOBS_CANCELLED = Counter(
+    'vintage_jobs_cancelled_total',
+    'Jobs stopped before finishing, by reason (cancelled, client disconnected, deadline exceeded)',
+    ['reason']
+)
+
+JANITOR_DELETED = Counter(
+    'vintage_janitor_deleted_total',
+    'Files and workspaces deleted by the janitor',
+    ['reason']
+)
+JANITOR_BYTES_FREED = Counter(
+    'vintage_janitor_bytes_freed_total',
+    'Bytes freed by the janitor',
+    ['reason']
+)
+JANITOR_SCAN_SECONDS = Histogram(
+    'vintage_janitor_scan_seconds',
+    'Time taken by a full janitor rescan of the video folders',
+    buckets=STAGE_BUCKETS
+)
+JANITOR_TRACKED_FILES = Gauge(
+    'vintage_janitor_tracked_files',
+    'Files and workspaces in the janitor index',
+    multiprocess_mode='livemax'
+)
+JANITOR_OUTPUT_BYTES = Gauge(
+    'vintage_janitor_output_bytes',
+    'Bytes of served output videos counted against the quota',
+    multiprocess_mode='livemax'
+)
+
+def observe_stage(stage, seconds, effect=''):
+    STAGE_SECONDS.labels(stage=stage, effect=effect).observe(seconds)
+
+@contextmanager
+def time_stage(stage, effect=''):
+    """Time a block of code as one processing stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start, effect)
+
+def record_video_stages(effect_name, stage_times, frame_count, input_bytes):
+    """Stage hook for Ventageeffect.process_video_frames"""
+    for stage, seconds in stage_times.items():
+        observe_stage(stage, seconds, effect_name)
+    FRAMES_PROCESSED.labels(effect=effect_name).inc(frame_count)
+    BYTES_PROCESSED.labels(effect=effect_name).inc(input_bytes)
+
+def record_request(endpoint, method, status, seconds):
+    REQUEST_SECONDS.labels(endpoint=endpoint, method=method, status=status).observe(seconds)
+    REQUESTS.labels(endpoint=endpoint, method=method, status=status).inc()
+
+def render_metrics():
+    """Return the (body, content type) of the Prometheus exposition for this host"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def mark_process_dead(pid):
+    """Drop the live gauges of a gunicorn worker that exited"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,138 @@
+import os
+import numpy as np
+
+# Pixels per block when evaluating pointwise stages. A block of float values is
+# kept small enough to stay in the CPU cache while every stage runs over it, so
+# a chain of stages reads and writes the full frame only once.
+BLOCK_PIXELS = int(os.environ.get('POINTWISE_BLOCK_PIXELS', 65536))
+
+# Pointwise stages work on frames scaled to [0, 1]. A stage is a function
+# stage(values, rows) that updates a block of values (a few full-width rows of
+# the frame, rows being their slice of the frame) and returns the block, which
+# may be a new array, e.g. with a wider dtype. Stages are applied in order to
+# every block, so they may only look at the pixels of their own block.
+# Stages that draw from the frame's random stream (grain, flicker) are marked
+# stochastic; the ones before the first of them give the same values for the
+# same input frame, so their result can be kept for a repeated frame.
+
+def block_rows(height, width):
+    return max(1, min(height, BLOCK_PIXELS // max(1, width)))
+
+def evaluate(frame, stages, quantize=True):
+    """
+    Run stages over frame block by block
+    A uint8 frame is scaled to float32 [0, 1] one block at a time; a float frame
+    is updated in place. Returns the result as uint8 (values times 255,
+    truncated like astype) or, with quantize=False, as a new float frame of the
+    stages' output dtype.
+    """
+    height, width = frame.shape[:2]
+    step = block_rows(height, width)
+    scaled = frame.dtype == np.uint8
+    buffer = np.empty((step,) + frame.shape[1:], dtype=np.float32) if scaled else None
+    result = np.empty(frame.shape, dtype=np.uint8) if quantize else None
+
+    for start in range(0, height, step):
+        rows = slice(start, min(height, start + step))
+        if scaled:
+            values = buffer[:rows.stop - rows.start]
+            np.divide(frame[rows], np.float32(255), out=values)
+        else:
+            values = frame[rows]
+        for stage in stages:
+            values = stage(values, rows)
+
+        if quantize:
+            np.multiply(values, 255, out=values)
+            result[rows] = values
+        else:
+            if result is None:
+                result = np.empty(frame.shape, dtype=values.dtype)
+            result[rows] = values
+    return result
+
+def stochastic(stage):
+    """Mark a stage as depending on the frame's random stream"""
+    stage.stochastic = True
+    return stage
+
+def deterministic_prefix(stages):
+    """Number of leading stages whose result only depends on the input frame"""
+    for i, stage in enumerate(stages):
+        if getattr(stage, 'stochastic', False):
+            return i
+    return len(stages)
+
+def requantize(values, rows):
+    """Round values to uint8 levels and back, as storing the frame between two effects would"""
+    np.multiply(values, 255, out=values)
+    np.trunc(values, out=values)
+    values = values if values.dtype == np.float32 else values.astype(np.float32)
+    np.divide(values, np.float32(255), out=values)
+    return values
+
+def chain_stages(stage_lists):
+    """Fuse the stages of consecutive effects into one list evaluated in a single pass"""
+    stages = []
+    for i, effect_stages in enumerate(stage_lists):
+        if i:
+            stages.append(requantize)
+        stages.extend(effect_stages)
+    return stages
+
+# Stage builders for the operations effects have in common
+
+def clip(low=0.0, high=1.0):
+    def stage(values, rows):
+        return np.clip(values, low, high, out=values)
+    return stage
+
+def contrast(amount, pivot=0.5):
+    """(values - pivot) * amount + pivot"""
+    def stage(values, rows):
+        np.subtract(values, pivot, out=values)
+        np.multiply(values, amount, out=values)
+        np.add(values, pivot, out=values)
+        return values
+    return stage
+
+def channel_gains(gains, clip_high=None):
+    """Multiply each channel by its gain, optionally clipping the changed channels to [0, clip_high]"""
+    def stage(values, rows):
+        for channel, gain in enumerate(gains):
+            if gain is None:
+                continue
+            channel_values = values[..., channel]
+            np.multiply(channel_values, gain, out=channel_values)
+            if clip_high is not None:
+                np.clip(channel_values, 0, clip_high, out=channel_values)
+        return values
+    return stage
+
+def multiply_mask(mask):
+    """Multiply every channel by a per-pixel (height, width) mask, such as a vignette"""
+    def stage(values, rows):
+        return np.multiply(values, mask[rows, :, None], out=values, casting='same_kind')
+    return stage
+
+def add_frame(addend):
+    """Add a constant (height, width, channels) frame, such as a light overlay"""
+    def stage(values, rows):
+        return np.add(values, addend[rows], out=values, casting='same_kind')
+    return stage
+
+def gaussian_noise(rng, var, clip_values=True):
+    """
+    Additive Gaussian noise as skimage.util.random_noise(mode='gaussian') adds it
+    The noise is drawn block after block in row order, which gives the same
+    numbers as drawing it for the whole frame at once. Like random_noise, the
+    result is float64 and clipped to [0, 1], which is only equivalent when the
+    values are never negative or get clipped to [0, 1] afterwards anyway.
+    """
+    def stage(values, rows):
+        noise = rng.normal(0.0, var ** 0.5, values.shape)
+        np.add(values, noise, out=noise)
+        if clip_values:
+            np.clip(noise, 0.0, 1.0, out=noise)
+        return noise
+    return stochastic(stage)
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+import requests
+
+import downloader
+from benchmarks.download import start_server
+
+PART_BYTES = 200_000
+
+
+@pytest.fixture
+def object_store(monkeypatch):
+    """A local threaded HTTP server imitating an object store, without latency or bandwidth cap"""
+    monkeypatch.setattr(downloader, 'DOWNLOAD_PART_BYTES', PART_BYTES)
+    monkeypatch.setattr(downloader, 'DOWNLOAD_RETRY_SECONDS', 0)
+    server = start_server(os.urandom(2 * PART_BYTES + 50_000), latency=0, connection_mbps=0, fail_rate=0)
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/source.mp4"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def download(server, tmp_path):
+    output_path = tmp_path / 'download.bin'
+    downloader.download_file(server.url, str(output_path))
+    return output_path.read_bytes()
+
+
+def test_failed_range_resumes_at_the_first_missing_byte(object_store, tmp_path):
+    # The probe response, the first range, is cut off halfway
+    object_store.fail_first = 1
+    assert download(object_store, tmp_path) == object_store.data
+    # The bytes read before the cut are kept: the retry asks for the rest only
+    assert object_store.requests[0] == f'bytes=0-{PART_BYTES - 1}'
+    assert f'bytes={downloader.CHUNK_BYTES}-{PART_BYTES - 1}' in object_store.requests
+    assert len(object_store.requests) == 4
+
+
+def test_server_without_ranges_gets_a_single_stream(object_store, tmp_path):
+    object_store.ranges = False
+    assert download(object_store, tmp_path) == object_store.data
+    assert len(object_store.requests) == 1
+
+
+def test_not_found_is_not_retried(object_store, tmp_path):
+    object_store.status = 404
+    with pytest.raises(requests.HTTPError):
+        download(object_store, tmp_path)
+    assert len(object_store.requests) == 1
+
+
+def test_empty_file_is_downloaded_after_a_416(object_store, tmp_path):
+    object_store.data = b''
+    assert download(object_store, tmp_path) == b''
+    # The range probe is refused, then the file is fetched with a plain request
+    assert object_store.requests == [f'bytes=0-{PART_BYTES - 1}', None]
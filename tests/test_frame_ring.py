@@ -0,0 +1,135 @@
+import os
+import signal
+import time
+
+import numpy as np
+import pytest
+from multiprocessing import shared_memory
+
+from frame_ring import FrameWorkers
+from Ventageeffect import process_frames_parallel
+
+FRAME_SHAPE = (8, 8, 3)
+
+
+# Effects run in spawned worker processes, so they live at module level.
+# Every test frame is filled with its own index.
+
+def invert(frame):
+    return 255 - frame
+
+
+def slow_even_frames(frame):
+    time.sleep(0.3 if frame[0, 0, 0] % 2 == 0 else 0.0)
+    return frame
+
+
+def fail(frame):
+    raise ValueError('boom')
+
+
+def hang(frame):
+    time.sleep(60)
+    return frame
+
+
+class FakeVideo:
+    """Stands in for cv2.VideoCapture, decoding frames filled with their index"""
+
+    def __init__(self, frame_count):
+        self.frame_count = frame_count
+        self.position = 0
+
+    def grab(self):
+        self.position += 1
+        return self.position <= self.frame_count
+
+    def read(self, image=None):
+        if self.position >= self.frame_count:
+            return False, None
+        image = np.empty(FRAME_SHAPE, dtype=np.uint8) if image is None else image
+        image[...] = self.position
+        self.position += 1
+        return True, image
+
+
+def stage_times():
+    return dict.fromkeys(('decode', 'color_convert', 'effect', 'write'), 0.0)
+
+
+def render(pool, frame_count):
+    written = []
+    def write(frame, frame_index, next_frame):
+        written.append(int(frame[0, 0, 0]))
+    count = process_frames_parallel(FakeVideo(frame_count), write, pool, 1.0, stage_times())
+    assert count == frame_count
+    return written
+
+
+def test_slots_are_recycled_when_the_ring_wraps():
+    pool = FrameWorkers(1, FRAME_SHAPE, invert, {}, np.random.SeedSequence(0), False, slot_count=2)
+    acquired = []
+    acquire = pool.acquire
+    def record_acquire():
+        slot = acquire()
+        if slot is not None:
+            acquired.append(slot)
+        return slot
+    pool.acquire = record_acquire
+    try:
+        written = render(pool, 9)
+    finally:
+        pool.close()
+    assert written == [255 - index for index in range(9)]
+    # One more slot is taken for the read that finds the end of the video
+    assert len(acquired) == 10
+    assert set(acquired) == {0, 1}
+
+
+def test_frames_are_written_in_order_when_workers_finish_out_of_order():
+    pool = FrameWorkers(2, FRAME_SHAPE, slow_even_frames, {}, np.random.SeedSequence(0), False)
+    finished = []
+    result = pool.result
+    def record_result():
+        slot, sequence, effect_seconds, convert_seconds = result()
+        finished.append(sequence)
+        return slot, sequence, effect_seconds, convert_seconds
+    pool.result = record_result
+    try:
+        written = render(pool, 8)
+    finally:
+        pool.close()
+    assert finished != sorted(finished)
+    assert written == list(range(8))
+
+
+def test_worker_exception_reaches_the_caller():
+    pool = FrameWorkers(1, FRAME_SHAPE, fail, {}, np.random.SeedSequence(0), False)
+    try:
+        with pytest.raises(Exception, match='boom'):
+            render(pool, 3)
+    finally:
+        pool.close()
+
+
+def test_killed_worker_does_not_hang_the_pipeline():
+    pool = FrameWorkers(1, FRAME_SHAPE, hang, {}, np.random.SeedSequence(0), False)
+    start = time.monotonic()
+    try:
+        slot = pool.acquire()
+        pool.ring.input_frame(slot)[...] = 0
+        pool.submit(slot, 0, 0)
+        os.kill(pool.processes[0].pid, signal.SIGKILL)
+        with pytest.raises(Exception, match='exited with code'):
+            pool.result()
+    finally:
+        pool.close()
+    assert time.monotonic() - start < 15
+
+
+def test_shared_memory_is_unlinked_after_close():
+    pool = FrameWorkers(1, FRAME_SHAPE, invert, {}, np.random.SeedSequence(0), False)
+    name = pool.ring.name
+    pool.close()
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
@@ -0,0 +1,41 @@
+import os
+
+from janitor import Janitor
+
+
+def make_janitor(tmp_path):
+    return Janitor([str(tmp_path / 'temp')], str(tmp_path / 'outputs'), max_age=60)
+
+
+def write_output(tmp_path, name):
+    path = tmp_path / 'outputs' / name
+    path.write_bytes(b'video')
+    return str(path)
+
+
+def test_only_the_leader_indexes_tracked_files(tmp_path):
+    (tmp_path / 'outputs').mkdir()
+    leader, follower = make_janitor(tmp_path), make_janitor(tmp_path)
+    assert leader._is_leader()
+    assert not follower._is_leader()
+
+    path = write_output(tmp_path, 'a.mp4')
+    leader.track(path)
+    follower.track(path)
+    assert path in leader.entries
+    assert follower.entries == {} and follower.expiry_heap == []
+
+
+def test_leader_rescan_picks_up_files_written_before_it_led(tmp_path):
+    (tmp_path / 'outputs').mkdir()
+    janitor = make_janitor(tmp_path)
+    path = write_output(tmp_path, 'a.mp4')
+    janitor.track(path)
+    assert janitor.entries == {}
+
+    assert janitor._is_leader()
+    mtime = os.stat(path).st_mtime
+    janitor.run_once(now=mtime)
+    assert path in janitor.entries
+    janitor.run_once(now=mtime + 61 + janitor.rescan_interval)
+    assert not os.path.exists(path)
@@ -0,0 +1,114 @@
+import inspect
+
+import cv2
+import numpy as np
+
+from effect_registry import apply_fanout_by_name, apply_fused_by_name, frame_steps
+from Ventageeffect import (
+    apply_frame, apply_steps, fuse_chain, fused_steps_process, light_leak_process, process_video_frames
+)
+
+
+def chain_steps(chain, seed, first_step=0):
+    return [(func, np.random.SeedSequence(step_seed), kwargs, 'rng' in inspect.signature(func).parameters)
+            for func, step_seed, kwargs in frame_steps(chain, seed, first_step=first_step)]
+
+
+def test_light_leak_takes_a_chain_step_seed():
+    frame = np.random.default_rng(0).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    leaked = light_leak_process(frame, intensity=0.9, leak_seed=[7, 1])
+    assert np.array_equal(leaked, light_leak_process(frame, intensity=0.9, leak_seed=(7, 1)))
+    # The requested intensity and seed are used, not the defaults
+    assert not np.array_equal(leaked, light_leak_process(frame))
+
+
+def test_fused_chain_with_light_leak_matches_step_by_step():
+    frame = np.random.default_rng(1).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    steps = chain_steps([('sepia', 0.5), ('light_leak', 0.9)], seed=7)
+    assert steps[1][2]['leak_seed'] == [7, 1]
+    assert len(fuse_chain(steps)) == 1
+
+    fused = apply_steps(steps, frame, 3)
+    expected = frame
+    for func, job_seed, kwargs, pass_rng in steps:
+        expected = apply_frame(func, expected, kwargs, job_seed, 3, pass_rng)
+    assert np.array_equal(fused, expected)
+
+
+def test_fused_frame_function_matches_the_fanout_steps():
+    frame = np.random.default_rng(2).integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    chain = [('vintage_color', 0.8), ('light_leak', 0.9)]
+    steps = [(func.__name__, step_seed, kwargs) for func, step_seed, kwargs in frame_steps(chain, 7, first_step=2)]
+    assert steps[1][1] == [7, 3]
+
+    fused = apply_frame(fused_steps_process, frame, {'steps': steps}, np.random.SeedSequence(7), 5, pass_rng=False)
+    assert np.array_equal(fused, apply_steps(chain_steps(chain, 7, first_step=2), frame, 5))
+
+
+def write_video(path, frame_count=6):
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), 24, (64, 48))
+    for index in range(frame_count):
+        writer.write(np.full((48, 64, 3), index * 20, dtype=np.uint8))
+    writer.release()
+
+
+def frame_count(path):
+    video = cv2.VideoCapture(str(path))
+    try:
+        return int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+    finally:
+        video.release()
+
+
+def test_chain_steps_draw_a_seed_when_none_is_given():
+    steps = frame_steps([('sepia', 0.5), ('light_leak', 0.9)])
+    seeds = [step_seed for _, step_seed, _ in steps]
+    assert seeds[0][0] is not None and seeds[0][0] == seeds[1][0]
+    assert steps[1][2]['leak_seed'] == seeds[1]
+    for step_seed in seeds:
+        np.random.SeedSequence(step_seed)
+
+
+def test_two_step_chain_renders_without_a_seed(tmp_path):
+    input_path = tmp_path / 'in.mp4'
+    write_video(input_path)
+    chain = [('vintage_color', 0.8), ('light_leak', 0.9)]
+
+    apply_fused_by_name(chain, str(input_path), str(tmp_path / 'fused.mp4'))
+    apply_fanout_by_name(str(input_path), [(str(tmp_path / 'fanout.mp4'), chain, False, None)], audio=False)
+    assert frame_count(tmp_path / 'fused.mp4') == 6
+    assert frame_count(tmp_path / 'fanout.mp4') == 6
+
+
+def read_frames(path):
+    video = cv2.VideoCapture(str(path))
+    frames = []
+    while True:
+        ret, frame = video.read()
+        if not ret:
+            break
+        frames.append(frame)
+    video.release()
+    return frames
+
+
+def test_fused_chain_reuses_repeated_frames(tmp_path, capsys):
+    input_path = tmp_path / 'held.mp4'
+    writer = cv2.VideoWriter(str(input_path), cv2.VideoWriter_fourcc(*'mp4v'), 24, (64, 48))
+    rng = np.random.default_rng(3)
+    for image in rng.integers(0, 256, (2, 48, 64, 3), dtype=np.uint8):
+        for _ in range(6):
+            writer.write(image)
+    writer.release()
+    steps = [(func.__name__, step_seed, kwargs) for func, step_seed, kwargs
+             in frame_steps([('sepia', 0.8), ('vintage_color', 0.8), ('light_leak', 0.9)], 7)]
+
+    outputs = []
+    for reuse_static in (False, True):
+        output_path = tmp_path / f'reuse_{reuse_static}.mp4'
+        process_video_frames(str(input_path), str(output_path), fused_steps_process, audio=False, workers=1,
+                             reuse_static=reuse_static, steps=steps)
+        outputs.append(read_frames(output_path))
+    assert 'Reused the results of repeated frames' in capsys.readouterr().out
+    assert len(outputs[0]) == 12
+    assert all(np.array_equal(a, b) for a, b in zip(*outputs))
@@ -0,0 +1,15 @@
+import subprocess
+
+from media_probe import ffmpeg_binary, probe_media
+from time_ranges import encode_segment
+
+
+def test_odd_sized_span_is_encoded(tmp_path):
+    span = str(tmp_path / 'span.mp4')
+    subprocess.run([ffmpeg_binary(), '-v', 'error', '-y', '-f', 'lavfi', '-i', 'testsrc=size=161x121:rate=24:duration=1',
+                    '-c:v', 'libx264', '-pix_fmt', 'yuv444p', span], check=True)
+    encoded = str(tmp_path / 'encoded.mp4')
+    encode_segment(span, span, encoded, frame_size=(161, 121))
+    media = probe_media(encoded)
+    assert (media['width'], media['height']) == (161, 121)
+    assert media['frame_count'] == 24
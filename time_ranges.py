@@ -0,0 +1,183 @@
+import os
+import re
+import subprocess
+from encoding import container_args, video_args
+from media_probe import ffmpeg_binary, probe_media
+
+# Codecs that can be cut at keyframes and joined again without re-encoding.
+# Re-encoded spans repeat their codec parameters in-band, so they can be mixed
+# with the copied parts of the original stream.
+COPY_VIDEO_CODECS = ('h264',)
+COPY_AUDIO_CODECS = ('aac', 'mp3')
+
+def parse_time_ranges(start=None, end=None, ranges=None):
+    """
+    Turn the start/end or ranges request parameters into a sorted list of
+    non-overlapping (start, end) seconds, where end None means the end of the video
+    ranges may be a list of [start, end] pairs or {"start": ..., "end": ...}
+    objects, or a string like "2-4.5,30-". Returns None when no range was given.
+    """
+    if ranges is None and start in (None, '') and end in (None, ''):
+        return None
+    if ranges is None:
+        ranges = [(start, end)]
+    elif isinstance(ranges, str):
+        ranges = [part.split('-', 1) for part in ranges.split(',') if part.strip()]
+
+    parsed = []
+    for time_range in ranges:
+        if isinstance(time_range, dict):
+            range_start, range_end = time_range.get('start'), time_range.get('end')
+        else:
+            range_start, range_end = time_range
+        range_start = float(range_start) if range_start not in (None, '') else 0.0
+        range_end = float(range_end) if range_end not in (None, '') else None
+        if range_start < 0 or (range_end is not None and range_end <= range_start):
+            raise ValueError('Each time range needs 0 <= start < end')
+        parsed.append((range_start, range_end))
+    if not parsed:
+        raise ValueError('No time ranges specified')
+
+    # Merge overlapping ranges
+    merged = []
+    for range_start, range_end in sorted(parsed, key=lambda time_range: time_range[0]):
+        if merged and (merged[-1][1] is None or range_start <= merged[-1][1]):
+            previous_end = merged[-1][1]
+            merged[-1] = (merged[-1][0], None if previous_end is None or range_end is None else max(previous_end, range_end))
+        else:
+            merged.append((range_start, range_end))
+    return merged
+
+def covered_seconds(ranges, duration):
+    """Seconds of a video of the given duration that fall inside the ranges"""
+    return sum(max(0.0, min(duration, duration if end is None else end) - start) for start, end in ranges)
+
+def keyframe_times(input_path):
+    """Timestamps (seconds) of the video keyframes, decoding only the keyframes"""
+    result = subprocess.run([ffmpeg_binary(), '-hide_banner', '-skip_frame', 'nokey', '-i', input_path,
+                             '-map', '0:v:0', '-vf', 'showinfo', '-f', 'null', '-'],
+                            capture_output=True, text=True)
+    return sorted(float(match) for match in re.findall(r'pts_time:([\d.]+)', result.stderr))
+
+def plan_segments(ranges, keyframes, duration):
+    """
+    Split a video into (start, end, processed) segments. Every range is widened to
+    the keyframes around it so the untouched segments can be copied as they are.
+    """
+    spans = []
+    for start, end in ranges:
+        end = duration if end is None else min(end, duration)
+        if start >= duration:
+            continue
+        span_start = max([keyframe for keyframe in keyframes if keyframe <= start], default=0.0)
+        span_end = min([keyframe for keyframe in keyframes if keyframe >= end], default=duration)
+        if spans and span_start <= spans[-1][1]:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], span_end))
+        else:
+            spans.append((span_start, span_end))
+
+    segments = []
+    position = 0.0
+    for span_start, span_end in spans:
+        if span_start > position:
+            segments.append((position, span_start, False))
+        segments.append((span_start, span_end, True))
+        position = span_end
+    # Ignore a rounding leftover at the very end
+    if duration - position > 0.001:
+        segments.append((position, duration, False))
+    return segments
+
+def run_ffmpeg(args):
+    result = subprocess.run([ffmpeg_binary(), '-v', 'error', '-y'] + args, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg failed: {result.stderr.strip()}")
+
+def split_segments(input_path, workdir, split_times):
+    """Split a video at the given keyframe times without re-encoding; returns the segment paths"""
+    # Split a little before each keyframe so rounding in the reported times
+    # can't push a cut to the next keyframe
+    args = ['-i', input_path, '-map', '0:v:0', '-map', '0:a:0?', '-c', 'copy', '-f', 'segment',
+            '-reset_timestamps', '1']
+    if split_times:
+        args += ['-segment_times', ','.join(f"{max(0.0, split_time - 0.001):.6f}" for split_time in split_times)]
+    run_ffmpeg(args + [os.path.join(workdir, 'segment_%04d.mp4')])
+    return sorted(os.path.join(workdir, name) for name in os.listdir(workdir)
+                  if name.startswith('segment_') and name.endswith('.mp4'))
+
+def encode_video(video_path, output_path, audio_path=None, encoder=None, frame_size=None):
+    """
+    Encode the frames of video_path to output_path with an encoder profile
+    With audio_path, its first audio track is encoded to AAC and muxed in,
+    cut to the length of the video.
+    """
+    args = ['-i', video_path]
+    if audio_path is not None:
+        args += ['-i', audio_path, '-map', '0:v:0', '-map', '1:a:0?', '-c:a', 'aac', '-shortest']
+    else:
+        args += ['-map', '0:v:0']
+    run_ffmpeg(args + video_args(encoder, frame_size) + container_args(encoder) + [output_path])
+
+def encode_segment(video_path, audio_path, output_path, encoder=None, frame_size=None):
+    """Encode a processed span to H.264 with an encoder profile, copying the audio of the original span"""
+    run_ffmpeg(['-i', video_path, '-i', audio_path, '-map', '0:v:0', '-map', '1:a:0?'] +
+               video_args(encoder, frame_size) + ['-x264-params', 'repeat-headers=1', '-c:a', 'copy', output_path])
+
+def join_segments(segment_paths, output_path):
+    """Join segments with identical stream layouts into one MP4 without re-encoding"""
+    list_path = os.path.splitext(output_path)[0] + '_segments.txt'
+    with open(list_path, 'w') as f:
+        for segment_path in segment_paths:
+            f.write(f"file '{os.path.abspath(segment_path)}'\n")
+    try:
+        run_ffmpeg(['-f', 'concat', '-safe', '0', '-i', list_path, '-c', 'copy',
+                    '-movflags', '+faststart', output_path])
+    finally:
+        os.remove(list_path)
+
+def render_time_ranges(input_path, output_path, ranges, render_span, workdir, encoder=None):
+    """
+    Process only the keyframe-aligned spans around ranges and copy the rest
+    render_span(span_input, span_output, effect_ranges) must render the video of
+    span_input to span_output, applying the effect only within effect_ranges
+    (seconds relative to the span); the rendered spans are encoded with the
+    encoder profile. Returns False without doing anything when the input can't
+    be cut and joined without re-encoding; the caller should then render the
+    whole video instead.
+    """
+    media = probe_media(input_path)
+    if (not media['duration'] or media['video_codec'] not in COPY_VIDEO_CODECS or
+            (media['audio_codec'] is not None and media['audio_codec'] not in COPY_AUDIO_CODECS)):
+        return False
+    keyframes = keyframe_times(input_path)
+    if not keyframes:
+        return False
+
+    segments = plan_segments(ranges, keyframes, media['duration'])
+    segment_paths = []
+    temp_paths = []
+    try:
+        segment_paths = split_segments(input_path, workdir, [start for start, _, _ in segments[1:]])
+        temp_paths += segment_paths
+        if len(segment_paths) != len(segments):
+            raise Exception("Could not split the video at its keyframes")
+
+        for i, (start, end, processed) in enumerate(segments):
+            if not processed:
+                continue
+            span_output = os.path.join(workdir, f"span_{i}_processed.mp4")
+            encoded_span = os.path.join(workdir, f"span_{i}_encoded.mp4")
+            temp_paths += [span_output, encoded_span]
+            effect_ranges = [(max(0.0, range_start - start), None if range_end is None else range_end - start)
+                             for range_start, range_end in ranges
+                             if range_start < end and (range_end is None or range_end > start)]
+            render_span(segment_paths[i], span_output, effect_ranges)
+            encode_segment(span_output, segment_paths[i], encoded_span, encoder, (media['width'], media['height']))
+            segment_paths[i] = encoded_span
+
+        join_segments(segment_paths, output_path)
+    finally:
+        for path in temp_paths:
+            if os.path.exists(path):
+                os.remove(path)
+    return True